@@ -1,9 +1,13 @@
 #! python
 # -*- coding: UTF-8 -*-
 import numpy as np
+import pandas as pd
 
-from .data_methods import create_stage
+from .data_methods import create_stage, ONE_HOT_FORMATS
 from .utils.seniority_cats import *
+from .utils.dates import years_between, get_as_of_date
+from .utils.category_encoder import CategoryEncoder
+from .utils.schema import enforce_schema, get_column_dtype, to_integer
 
 
 CATEGORIES_MERCH = list(range(1, 90))
@@ -26,19 +30,78 @@ FAMILY_STATUS_CATEGORIES = ["Никогда в браке не состоял(а
 SENIORITY_CATEGORIES = ['Нет стажа', 'Менее  6 месяцев', 'Менее 2 лет',
                         'Менее 5 лет', 'Менее 10 лет', '10 и более лет']
 
-
-def create_features_in_dataset(source_dataset):
+# Таблицы замены старых значений категорий признаков на новые
+FAMILY_STATUS_MAP = {
+    'Гражданский брак / совместное проживание': 'Женат / замужем',
+    'Вдовец / вдова': 'Разведён / Разведена',
+}
+
+EDUCATION_MAP = {
+    'Высшее - специалист': 'Высшее',
+    'Бакалавр': 'Высшее',
+    'Магистр': 'Высшее',
+    'Несколько высших': 'Высшее',
+    'Неоконченное среднее': 'Среднее',
+    'Среднее': 'Среднее',
+    'Неоконченное высшее': 'Среднее',
+}
+
+EMPLOYMENT_MAP = {
+    'Работаю по найму полный рабочий день/служу': 'Работаю по найму',
+    'Работаю по найму неполный рабочий день': 'Работаю по найму',
+    'Пенсионер': 'Иные виды',
+    'Студент': 'Иные виды',
+    'Декретный отпуск': 'Иные виды',
+    'Не работаю': 'Иные виды',
+}
+
+CHILDCOUNT_MAP = {
+    0: 'Без детей',
+    1: '1 ребенок',
+}
+CHILDCOUNT_DEFAULT = '2 и более детей'
+
+# Скомпилированные кодировщики категориальных признаков.
+# Используются и при подготовке обучающего датасета, и при предсказании
+LAST_SENIORITY_ENCODER = CategoryEncoder(SENIORITY_CATEGORIES, prefix='Посл_стаж')
+GOODS_CATEGORY_ENCODER = CategoryEncoder(GOODS_CATEGORIES, prefix='Кат_товара')
+MERCH_CODE_ENCODER = CategoryEncoder(CATEGORIES_MERCH, prefix='код_магазина')
+FAMILY_STATUS_ENCODER = CategoryEncoder(FAMILY_STATUS_CATEGORIES, prefix='Сем_положение',
+                                        mapping=FAMILY_STATUS_MAP)
+EDUCATION_ENCODER = CategoryEncoder(EDUCATION_CATEGORIES, prefix='Образование', mapping=EDUCATION_MAP)
+EMPLOYMENT_ENCODER = CategoryEncoder(EMPLOYMENT_CATEGORIES, prefix='Занятость', mapping=EMPLOYMENT_MAP)
+SENIORITY_ENCODER = CategoryEncoder(SENIORITY_CATEGORIES, prefix='Общий_стаж',
+                                    mapping={key: months_seniority_to_new_cat(seniority_cat_to_month_count(key))
+                                             for key in SENIORITY_VALUES},
+                                    default=months_seniority_to_new_cat(seniority_cat_to_month_count(DEFAULT_CAT)))
+LOAN_TERM_ENCODER = CategoryEncoder(LOAN_TERM_CATEGORIES, prefix='Срок_кредита')
+CHILDCOUNT_ENCODER = CategoryEncoder(CHILDCOUNT_CATEGORIES, prefix='Колво_детей',
+                                     mapping=CHILDCOUNT_MAP, default=CHILDCOUNT_DEFAULT)
+
+# Кодировщики в порядке добавления one-hot признаков в датасет
+CATEGORY_ENCODERS = [SENIORITY_ENCODER, EDUCATION_ENCODER, EMPLOYMENT_ENCODER, FAMILY_STATUS_ENCODER,
+                     LOAN_TERM_ENCODER, GOODS_CATEGORY_ENCODER, MERCH_CODE_ENCODER, LAST_SENIORITY_ENCODER,
+                     CHILDCOUNT_ENCODER]
+
+# Все one-hot признаки
+ONE_HOT_COLUMNS = [column for encoder in CATEGORY_ENCODERS for column in encoder.columns]
+
+
+def create_features_in_dataset(source_dataset, as_of=None):
     """
     Создание новых признаков и удаление ненужных
     :param source_dataset:  Исходный датасет
+    :param as_of: Расчетная дата (по умолчанию - расчетная дата запуска)
     """
 
-    df = source_dataset.copy()
+    # Поверхностная копия: в режиме копирования при записи данные столбцов не копируются,
+    # а исходный датасет не изменяется при замене столбцов
+    df = source_dataset.copy(deep=False)
 
-    df = replace_features(df)
+    df = replace_features(df, as_of)
     df = replace_targets(df)
 
-    return df
+    return enforce_schema(df)
 
 
 def replace_targets(dataset):
@@ -48,26 +111,11 @@ def replace_targets(dataset):
     :return: Преобразованный датасет
     """
 
-    dataset['Решение_банка_A'] = pd.Categorical(dataset['BankA_decision'],
-                                                categories=DECISION_CATEGORIES,
-                                                ordered=True)
-    dataset['Решение_банка_B'] = pd.Categorical(dataset['BankB_decision'],
-                                                categories=DECISION_CATEGORIES,
-                                                ordered=True)
-    dataset['Решение_банка_C'] = pd.Categorical(dataset['BankC_decision'],
-                                                categories=DECISION_CATEGORIES,
-                                                ordered=True)
-    dataset['Решение_банка_D'] = pd.Categorical(dataset['BankD_decision'],
-                                                categories=DECISION_CATEGORIES,
-                                                ordered=True)
-    dataset['Решение_банка_E'] = pd.Categorical(dataset['BankE_decision'],
-                                                categories=DECISION_CATEGORIES,
-                                                ordered=True)
-    dataset['Решение_банка_A'] = dataset['Решение_банка_A'].cat.codes
-    dataset['Решение_банка_B'] = dataset['Решение_банка_B'].cat.codes
-    dataset['Решение_банка_C'] = dataset['Решение_банка_C'].cat.codes
-    dataset['Решение_банка_D'] = dataset['Решение_банка_D'].cat.codes
-    dataset['Решение_банка_E'] = dataset['Решение_банка_E'].cat.codes
+    # Коды категорий записываются сразу, без промежуточного категориального столбца
+    for bank_id in 'ABCDE':
+        dataset[f'Решение_банка_{bank_id}'] = pd.Categorical(dataset[f'Bank{bank_id}_decision'],
+                                                             categories=DECISION_CATEGORIES,
+                                                             ordered=True).codes
 
     # Удаление более ненужных признаков
     dataset = dataset.drop(columns=['BankA_decision', 'BankB_decision', 'BankC_decision',
@@ -76,80 +124,62 @@ def replace_targets(dataset):
     return dataset
 
 
-def replace_features(dataset):
+def replace_features(dataset, as_of=None):
     """
     Преобразует и переименовывает признаки
     :param dataset:  Исходный датасет
+    :param as_of: Расчетная дата (по умолчанию - расчетная дата запуска)
     :return: Преобразованный датасет
 
     """
 
-    # Создание новых числовых и бинарных признаков
+    if as_of is None:
+        as_of = get_as_of_date()
+
+    # Создание новых числовых и бинарных признаков (сразу с типами схемы)
     dataset['Имеет_доход'] = (
-            (pd.notna(dataset['JobStartDate'])) & (dataset['employment status'] != "Не работаю")).astype('int')
+            (pd.notna(dataset['JobStartDate'])) & (dataset['employment status'] != "Не работаю")).astype(
+        get_column_dtype('Имеет_доход'))
 
-    dataset['Кредитная_нагрузка'] = (dataset['MonthProfit'] - dataset['MonthExpense']) / (
+    credit_load = (dataset['MonthProfit'] - dataset['MonthExpense']) / (
             dataset['Loan_amount'] / dataset['Loan_term'])
     # df['Кредитная_нагрузка'] = np.where(df['Кредитная_нагрузка'] < 0, 0, df['Кредитная_нагрузка'])
+    dataset['Кредитная_нагрузка'] = credit_load.astype(get_column_dtype('Кредитная_нагрузка'))
 
-    dataset['Кредит_возможен'] = np.where(dataset['Кредитная_нагрузка'] > 1.25, 1, 0)
+    # Порог сравнивается с нагрузкой до округления до float32
+    dataset['Кредит_возможен'] = (credit_load > 1.25).astype(get_column_dtype('Кредит_возможен'))
+    del credit_load
 
-    dataset['Возраст'] = dataset['BirthDate'].apply(lambda r: relativedelta(datetime.today(), r).years)
+    dataset['Возраст'] = to_integer(years_between(dataset['BirthDate'], as_of).astype('int'),
+                                    get_column_dtype('Возраст')).to_numpy()
 
     # Создание новых категориальных признаков
 
     # Стаж работы на последнем месте в месяцах
-    last_seniority = dataset.apply(set_last_seniority_new_cat, axis=1)
-    dataset['Последний_стаж_работы'] = pd.Categorical(last_seniority, ordered=True,
-                                                      categories=SENIORITY_CATEGORIES)
-    last_seniority = pd.get_dummies(dataset['Последний_стаж_работы'], prefix="Посл_стаж", dtype=int)
-    dataset['Код_Последний_стаж_работы'] = dataset['Последний_стаж_работы'].cat.codes
-
-    dataset['Категория_товара'] = pd.Categorical(dataset['Goods_category'], ordered=True, categories=GOODS_CATEGORIES)
-    dataset['Код_Категория_товара'] = dataset['Категория_товара'].cat.codes
-    goods_category = pd.get_dummies(dataset['Категория_товара'], prefix="Кат_товара", dtype=int)
-
-    dataset['Код_магазина'] = pd.Categorical(dataset['Merch_code'], ordered=True, categories=CATEGORIES_MERCH)
-    merch_codes = pd.get_dummies(dataset['Код_магазина'], prefix="код_магазина", dtype=int)
-
-    dataset['Family status'] = dataset['Family status'].apply(replace_family_status)
-    dataset['Семейное_положение'] = pd.Categorical(dataset['Family status'], ordered=True,
-                                                   categories=FAMILY_STATUS_CATEGORIES)
-    dataset['Код_Семейное_положение'] = dataset['Семейное_положение'].cat.codes
-    family_status = pd.get_dummies(dataset['Семейное_положение'], prefix="Сем_положение", dtype=int)
-
-    dataset['education'] = dataset['education'].apply(replace_education)
-    dataset['Образование'] = pd.Categorical(dataset['education'], ordered=True,
-                                            categories=EDUCATION_CATEGORIES)
-    dataset['Код_Образование'] = dataset['Образование'].cat.codes
-    education = pd.get_dummies(dataset['Образование'], prefix="Образование", dtype=int)
-
-    dataset['employment status'] = dataset['employment status'].apply(replace_employment_status)
-    dataset['Тип_занятости'] = pd.Categorical(dataset['employment status'], ordered=True,
-                                              categories=EMPLOYMENT_CATEGORIES)
-    dataset['Код_Тип_занятости'] = dataset['Тип_занятости'].cat.codes
-    employment_status = pd.get_dummies(dataset['Тип_занятости'], prefix="Занятость", dtype=int)
-
-    dataset['Value'] = dataset['Value'].apply(replace_seniority)
-    dataset['Стаж_работы'] = pd.Categorical(dataset['Value'], ordered=True, categories=SENIORITY_CATEGORIES)
-    dataset['Код_Стаж_работы'] = dataset['Стаж_работы'].cat.codes
-    value = pd.get_dummies(dataset['Стаж_работы'], prefix="Общий_стаж", dtype=int)
-
-    dataset['Срок_кредита'] = pd.Categorical(dataset['Loan_term'], ordered=True, categories=LOAN_TERM_CATEGORIES)
-    loan_term = pd.get_dummies(dataset['Срок_кредита'], prefix="Срок_кредита", dtype=int)
-
-    dataset['Колво_детей'] = dataset['ChildCount'].apply(replace_childcount)
-    dataset['Колво_детей'] = pd.Categorical(dataset['Колво_детей'], ordered=True,
-                                            categories=CHILDCOUNT_CATEGORIES)
-    dataset['Код_Колво_детей'] = dataset['Колво_детей'].cat.codes
-    child_count = pd.get_dummies(dataset['Колво_детей'], prefix="Колво_детей", dtype=int)
-
-    # Добавление кодированных признаков
-    dataset = pd.concat(
-        [dataset, value, education, employment_status, family_status, loan_term,
-         goods_category, merch_codes, last_seniority, child_count],
-        axis=1
-    )
+    last_seniority = get_last_seniority_new_cat(dataset['JobStartDate'], as_of)
+    last_seniority = encode_feature(dataset, LAST_SENIORITY_ENCODER, last_seniority,
+                                    'Последний_стаж_работы', 'Код_Последний_стаж_работы')
+
+    goods_category = encode_feature(dataset, GOODS_CATEGORY_ENCODER, dataset['Goods_category'],
+                                    'Категория_товара', 'Код_Категория_товара')
+
+    merch_codes = encode_feature(dataset, MERCH_CODE_ENCODER, dataset['Merch_code'], 'Код_магазина')
+
+    family_status = encode_feature(dataset, FAMILY_STATUS_ENCODER, dataset['Family status'],
+                                   'Семейное_положение', 'Код_Семейное_положение')
+
+    education = encode_feature(dataset, EDUCATION_ENCODER, dataset['education'],
+                               'Образование', 'Код_Образование')
+
+    employment_status = encode_feature(dataset, EMPLOYMENT_ENCODER, dataset['employment status'],
+                                       'Тип_занятости', 'Код_Тип_занятости')
+
+    value = encode_feature(dataset, SENIORITY_ENCODER, dataset['Value'], 'Стаж_работы', 'Код_Стаж_работы')
+
+    loan_term = encode_feature(dataset, LOAN_TERM_ENCODER, dataset['Loan_term'], 'Срок_кредита')
+
+    child_count = encode_feature(dataset, CHILDCOUNT_ENCODER, dataset['ChildCount'],
+                                 'Колво_детей', 'Код_Колво_детей')
 
     # Удаление более ненужных признаков
     dataset = dataset.drop(columns=['BirthDate', 'JobStartDate', 'Goods_category',
@@ -165,9 +195,53 @@ def replace_features(dataset):
         'SNILS': 'СНИЛС'
     })
 
+    # Добавление кодированных признаков (в режиме копирования при записи
+    # удаление, переименование и объединение не копируют данные столбцов)
+    dataset = pd.concat(
+        [dataset, value, education, employment_status, family_status, loan_term,
+         goods_category, merch_codes, last_seniority, child_count],
+        axis=1
+    )
+
     return dataset
 
 
+def encode_feature(dataset, encoder, values, column, code_column=None):
+    """
+    Кодирует категориальный признак: добавляет в датасет категориальный столбец
+    и столбец с кодами категорий
+    :param dataset: Исходный датасет
+    :param encoder: Скомпилированный кодировщик признака
+    :param values: Исходные значения признака
+    :param column: Название категориального столбца
+    :param code_column: Название столбца с кодами категорий (если нужен)
+    :return: One-hot представление признака
+    """
+    codes = encoder.encode(values)
+    dataset[column] = encoder.to_categorical(codes)
+    if code_column is not None:
+        dataset[code_column] = codes
+
+    return encoder.to_one_hot(codes, index=dataset.index)
+
+
+def apply_one_hot_format(dataset, one_hot_format='uint8'):
+    """
+    Приведение one-hot признаков датасета к заданному представлению
+    (например, после чтения csv-файла, где они читаются как int64)
+    :param dataset: Исходный датасет
+    :param one_hot_format: uint8 - плотные столбцы, sparse - разреженные столбцы uint8 (pandas.SparseDtype)
+    :return: Преобразованный датасет
+    """
+    if one_hot_format not in ONE_HOT_FORMATS:
+        raise ValueError(f"Unknown one-hot format '{one_hot_format}'. Possible: {', '.join(ONE_HOT_FORMATS)}")
+
+    dtype = pd.SparseDtype('uint8', 0) if one_hot_format == 'sparse' else 'uint8'
+    columns = [column for column in ONE_HOT_COLUMNS if column in dataset.columns]
+
+    return dataset.astype({column: dtype for column in columns})
+
+
 def replace_family_status(old_value):
     """
     Заменяет старое значение категории признака 'Семейное_положение' на новое
@@ -175,11 +249,7 @@ def replace_family_status(old_value):
     :return: Новое значение категории признака 'Семейное_положение'
     """
 
-    if old_value == 'Гражданский брак / совместное проживание':
-        return 'Женат / замужем'
-    if old_value == 'Вдовец / вдова':
-        return 'Разведён / Разведена'
-    return old_value
+    return FAMILY_STATUS_MAP.get(old_value, old_value)
 
 
 def replace_education(old_value):
@@ -188,11 +258,7 @@ def replace_education(old_value):
     :param old_value: Старое значение категории признака 'Образование'
     :return: Новое значение категории признака 'Образование'
     """
-    if old_value in ['Высшее - специалист', 'Бакалавр', 'Магистр', 'Несколько высших']:
-        return 'Высшее'
-    if old_value in ['Неоконченное среднее', 'Среднее', 'Неоконченное высшее']:
-        return 'Среднее'
-    return old_value
+    return EDUCATION_MAP.get(old_value, old_value)
 
 
 def replace_employment_status(old_value):
@@ -201,11 +267,7 @@ def replace_employment_status(old_value):
     :param old_value: Старое значение категории признака 'Тип_занятости'
     :return: Новое значение категории признака 'Тип_занятости'
     """
-    if old_value in ['Работаю по найму полный рабочий день/служу', 'Работаю по найму неполный рабочий день']:
-        return 'Работаю по найму'
-    if old_value in ['Пенсионер', 'Студент', 'Декретный отпуск', 'Не работаю']:
-        return 'Иные виды'
-    return old_value
+    return EMPLOYMENT_MAP.get(old_value, old_value)
 
 
 def replace_childcount(old_value):
@@ -214,11 +276,7 @@ def replace_childcount(old_value):
     :param old_value: Старое значение категории признака 'ChildCount'
     :return: Новое значение категории признака 'ChildCount'
     """
-    if old_value == 0:
-        return 'Без детей'
-    if old_value == 1:
-        return '1 ребенок'
-    return '2 и более детей'
+    return CHILDCOUNT_MAP.get(old_value, CHILDCOUNT_DEFAULT)
 
 
 def replace_seniority(old_value):
@@ -233,5 +291,18 @@ def replace_seniority(old_value):
     return months_seniority_to_new_cat(total_seniority_in_months)
 
 
+def replace_seniority_array(old_values):
+    """
+    Заменяет массив старых значений категории признака 'стаж работы' на новые.
+    Векторизованный вариант replace_seniority
+    :param old_values: Старые значения признака 'стаж работы'
+    :return: Новые значения категории признака 'стаж работы'
+    """
+
+    # Общий стаж в месяцах
+    total_seniority_in_months = seniority_cat_to_month_count_array(old_values.astype(str))
+    return months_seniority_to_new_cat_array(total_seniority_in_months)
+
+
 if __name__ == "__main__":
     create_stage("create_features", create_features_in_dataset)
@@ -3,12 +3,34 @@
 """
 import sys
 import os
+import yaml
 import pandas as pd
 
+from .utils.dates import set_as_of_date
+from .utils.schema import enforce_schema, memory_usage, get_stream_dtype
+
 # Выбрать вариант в зависимости от операционной системы и способа запуска
 # project_path = os.path.abspath(os.path.join(os.getcwd(), os.path.pardir, os.path.pardir))
 project_path = os.getcwd()
 
+# Признаки с датами, которые требуют разбора при чтении csv-файлов
+DATE_COLUMNS = ['JobStartDate', 'BirthDate']
+
+# Поддерживаемые форматы файлов этапов конвейера
+DATASET_FORMATS = ['parquet', 'feather', 'csv']
+
+# Возможные представления one-hot признаков в памяти
+ONE_HOT_FORMATS = ['uint8', 'sparse']
+
+
+def copy_on_write():
+    """
+    Режим копирования при записи на время выполнения этапа: этапы не копируют исходный датасет целиком,
+    данные столбца копируются только при его изменении. Режим включается только внутри контекста,
+    поэтому импорт модулей не меняет настройки pandas процесса, который их использует
+    """
+    return pd.option_context('mode.copy_on_write', True)
+
 
 def create_stage(stage_name, function):
     """
@@ -18,6 +40,41 @@ def create_stage(stage_name, function):
     :return: путь для каталога с результатами работы этапа
     """
 
+    filename_input, filename_output, stage_dir = get_stage_paths(stage_name)
+
+    with copy_on_write():
+        # %% Чтение файла данных
+        df = read_dataset(filename_input)
+        memory_before = memory_usage(df)
+
+        # Подготовка датасета
+        df = enforce_schema(function(df))
+        print_memory_report(stage_name, memory_before, df)
+
+        # Сохранение результатов в файлы
+        write_dataset(df, filename_output)
+
+    return stage_dir
+
+
+def print_memory_report(stage_name, memory_before, df):
+    """
+    Вывод объема памяти датасета до и после выполнения этапа
+    :param stage_name: название этапа конвейера
+    :param memory_before: объем памяти исходного датасета (МБ)
+    :param df: результирующий датасет
+    """
+    print(f"{stage_name}: память до этапа - {memory_before:.2f} МБ, после этапа - {memory_usage(df):.2f} МБ, "
+          f"строк - {len(df)}, признаков - {df.shape[1]}")
+
+
+def get_stage_paths(stage_name):
+    """
+    Разбор аргументов командной строки этапа конвейера и подготовка каталога для результатов
+    :param stage_name: название этапа конвейера
+    :return: путь к входному файлу, путь к выходному файлу и каталог с результатами работы этапа
+    """
+
     if len(sys.argv) != 2:
         sys.stderr.write("Arguments error. Usage:\n")
         sys.stderr.write(f"\tpython3 {stage_name}.py data-file\n")
@@ -26,20 +83,225 @@ def create_stage(stage_name, function):
     # Название файла загружаемого датасета
     f_input = sys.argv[1]
 
+    # Фиксация расчетной даты для всего этапа
+    set_as_of_date()
+
     # %%  Задание путей для файлов
     stage_dir = os.path.join(project_path, "data", f"stage_{stage_name}")
     os.makedirs(stage_dir, exist_ok=True)
     filename_input = os.path.join(project_path, f_input)
-    filename_output = os.path.join(stage_dir, "dataset.csv")
+    filename_output = os.path.join(stage_dir, dataset_filename("dataset"))
 
-    # %% Чтение файла данных
-    df = pd.read_csv(filename_input, sep=';', parse_dates=['JobStartDate', 'BirthDate'])
+    return filename_input, filename_output, stage_dir
 
-    # Подготовка датасета
-    df = function(df)
 
-    # Сохранение результатов в файлы
-    df.to_csv(filename_output, index=False, sep=';')
+def get_io_params():
+    """
+    Получение параметров хранения промежуточных файлов конвейера
+    :return: словарь с форматом файлов, алгоритмом сжатия и представлением one-hot признаков
+    """
+    params = yaml.safe_load(open(os.path.join(project_path, "params.yaml")))
+    io_params = params.get("io", {})
 
-    return stage_dir
+    dataset_format = io_params.get("format", "csv")
+    if dataset_format not in DATASET_FORMATS:
+        raise ValueError(f"Unknown dataset format '{dataset_format}'. Possible: {', '.join(DATASET_FORMATS)}")
+
+    one_hot_format = io_params.get("one_hot", "uint8")
+    if one_hot_format not in ONE_HOT_FORMATS:
+        raise ValueError(f"Unknown one-hot format '{one_hot_format}'. Possible: {', '.join(ONE_HOT_FORMATS)}")
+
+    return {
+        "format": dataset_format,
+        "compression": io_params.get("compression", "zstd"),
+        "one_hot": one_hot_format,
+    }
+
+
+def dataset_filename(name):
+    """
+    Имя файла датасета с расширением, соответствующим формату из params.yaml
+    :param name: имя файла без расширения
+    :return: имя файла с расширением
+    """
+    return f"{name}.{get_io_params()['format']}"
+
+
+def read_dataset(filename):
+    """
+    Чтение датасета. Формат определяется по расширению файла
+    :param filename: путь к файлу
+    :return: датасет
+    """
+    extension = os.path.splitext(filename)[1].lstrip('.')
+
+    if extension == 'parquet':
+        df = pd.read_parquet(filename)
+    elif extension == 'feather':
+        df = pd.read_feather(filename)
+    else:
+        columns = pd.read_csv(filename, sep=';', nrows=0).columns
+        df = pd.read_csv(filename, sep=';', parse_dates=[column for column in DATE_COLUMNS if column in columns])
+
+    # Типы признаков по схеме (csv-файлы читаются с типами int64 и float64)
+    return enforce_schema(df)
+
+
+def write_dataset(df, filename):
+    """
+    Сохранение датасета. Формат определяется по расширению файла,
+    для бинарных форматов сохраняются типы данных признаков
+    :param df: датасет
+    :param filename: путь к файлу
+    """
+    extension = os.path.splitext(filename)[1].lstrip('.')
+    compression = get_io_params()["compression"]
+    # Разреженные столбцы сохраняются как плотные того же типа (нули хорошо сжимаются)
+    df = enforce_schema(densify(df))
+
+    if extension == 'parquet':
+        df.to_parquet(filename, index=False, compression=None if compression == 'uncompressed' else compression)
+    elif extension == 'feather':
+        df.reset_index(drop=True).to_feather(filename, compression=compression)
+    else:
+        df.to_csv(filename, index=False, sep=';')
+
+
+def densify(df):
+    """
+    Замена разреженных столбцов (pandas.SparseDtype) плотными того же типа
+    :param df: датасет
+    :return: датасет без разреженных столбцов (исходный, если таких столбцов нет)
+    """
+    sparse_columns = [column for column, dtype in df.dtypes.items() if isinstance(dtype, pd.SparseDtype)]
+    if not sparse_columns:
+        return df
+
+    df = df.copy(deep=False)
+    for column in sparse_columns:
+        df[column] = df[column].sparse.to_dense()
+
+    return df
+
+
+def iter_dataset(filename, chunk_size):
+    """
+    Чтение датасета частями. Формат определяется по расширению файла
+    :param filename: путь к файлу
+    :param chunk_size: количество строк в одной части
+    :return: генератор частей датасета
+    """
+    extension = os.path.splitext(filename)[1].lstrip('.')
+
+    if extension == 'parquet':
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(filename).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif extension == 'feather':
+        import pyarrow as pa
+
+        with pa.memory_map(filename) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                for offset in range(0, batch.num_rows, chunk_size):
+                    yield batch.slice(offset, chunk_size).to_pandas()
+    elif extension == 'jsonl':
+        with pd.read_json(filename, lines=True, chunksize=chunk_size) as reader:
+            yield from reader
+    else:
+        columns = pd.read_csv(filename, sep=';', nrows=0).columns
+        yield from pd.read_csv(filename, sep=';', chunksize=chunk_size,
+                               parse_dates=[column for column in DATE_COLUMNS if column in columns])
+
+
+class DatasetWriter:
+    """
+    Последовательная запись датасета частями. Формат определяется по расширению файла,
+    схема данных задается первой записанной частью, целые признаки схемы записываются с типом int64
+    (get_stream_dtype), чтобы расширение типа в следующей части не нарушало схему файла
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: путь к файлу
+        """
+        self.filename = filename
+        self.extension = os.path.splitext(filename)[1].lstrip('.')
+        self.compression = get_io_params()["compression"]
+        self._writer = None
+        self._schema = None
+        self._header = True
+
+    def write(self, df):
+        """
+        Запись очередной части датасета
+        :param df: часть датасета
+        """
+        if self.extension == 'jsonl':
+            text = df.to_json(orient='records', lines=True, force_ascii=False, date_format='iso')
+            with open(self.filename, 'w' if self._header else 'a', encoding='utf-8') as fd:
+                fd.write(text if text.endswith('\n') else text + '\n')
+            self._header = False
+            return
+
+        if self.extension not in ('parquet', 'feather'):
+            df.to_csv(self.filename, index=False, sep=';', mode='w' if self._header else 'a', header=self._header)
+            self._header = False
+            return
+
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = self._get_schema(df, table.schema)
+            table = table.cast(self._schema)
+            self._writer = self._open(self._schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        """
+        Завершение записи
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    @staticmethod
+    def _get_schema(df, schema):
+        """
+        Схема файла: типы первой части, целые признаки схемы - с типом int64
+        :param df: первая часть датасета
+        :param schema: схема таблицы первой части
+        """
+        import pyarrow as pa
+
+        fields = []
+        for field in schema:
+            if field.name in df.columns and pa.types.is_integer(field.type):
+                dtype = get_stream_dtype(field.name, df[field.name].dtype)
+                field = field.with_type(pa.from_numpy_dtype(dtype))
+            fields.append(field)
+
+        return pa.schema(fields, metadata=schema.metadata)
+
+    def _open(self, schema):
+        """
+        Создание объекта для записи бинарного формата
+        :param schema: схема данных
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        compression = None if self.compression == 'uncompressed' else self.compression
+        if self.extension == 'parquet':
+            return pq.ParquetWriter(self.filename, schema, compression=compression or 'none')
+
+        return pa.ipc.new_file(self.filename, schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
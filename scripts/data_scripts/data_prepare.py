@@ -5,6 +5,10 @@ import pandas as pd
 import numpy as np
 
 from .data_methods import create_stage
+from .utils.schema import get_column_dtype, to_integer
+
+# Признаки, приводимые к целому типу схемы
+INT_COLUMNS = ['ChildCount', 'SNILS', 'Loan_amount', 'Loan_term', 'MonthProfit', 'MonthExpense', 'Merch_code']
 
 
 def prepare_dataset(source_dataset):
@@ -13,18 +17,16 @@ def prepare_dataset(source_dataset):
     :param source_dataset:  Исходный датасет
     """
 
-    df = source_dataset.copy()
+    # Поверхностная копия: в режиме копирования при записи данные столбцов не копируются,
+    # а исходный датасет не изменяется при замене столбцов
+    df = source_dataset.copy(deep=False)
 
     df['BirthDate'] = pd.to_datetime(df['BirthDate'])
     df['JobStartDate'] = pd.to_datetime(df['JobStartDate'])
-    df['Gender'] = np.where(df['Gender'] > 0, 1, 0)
-    df['ChildCount'] = df['ChildCount'].astype('int')
-    df['SNILS'] = df['SNILS'].astype('int')
-    df['Loan_amount'] = df['Loan_amount'].astype('int')
-    df['Loan_term'] = df['Loan_term'].astype('int')
-    df['MonthProfit'] = df['MonthProfit'].astype('int')
-    df['MonthExpense'] = df['MonthExpense'].astype('int')
-    df['Merch_code'] = df['Merch_code'].astype('int')
+    df['Gender'] = np.where(df['Gender'] > 0, 1, 0).astype(get_column_dtype('Gender'))
+    for column in INT_COLUMNS:
+        # Дробная часть отбрасывается (как в astype('int')), затем значения сужаются до типа схемы
+        df[column] = to_integer(df[column].astype('int64'), get_column_dtype(column))
 
     return df
 
@@ -1,15 +1,24 @@
 #! python
 # -*- coding: UTF-8 -*-
 """
-Подготговка датасета для определенного банка
+Подготговка датасета для определенного банка.
+В режиме all датасеты всех банков готовятся за один проход
 """
 import sys
 import os
 import joblib
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.preprocessing import StandardScaler
 
+from .data_methods import read_dataset, get_io_params, print_memory_report, copy_on_write
+from .feature_store import write_feature_store
+from .utils.schema import enforce_schema, memory_usage
+from .create_features import apply_one_hot_format
+from .preprocessing_artifact import ScalerParams, load_artifact, save_artifact
+from .preprocessing_artifact import STATISTICS_FILENAME, ARTIFACT_FILENAME
+
 
 # Признаки, не оказывающие влияния на решение банка, подлежат удалению
 # из признакового пространства
@@ -28,6 +37,24 @@ all_drop_columns = {
     'E': ['Кат_товара_Other', 'Срок_кредита_18', 'Срок_кредита_24'],
 }
 
+# Идентификаторы банков
+BANK_IDS = list(all_drop_columns)
+
+# Признаки, которые не нужны для обучения модели любого банка
+COMMON_DROP_COLUMNS = ['Последний_стаж_работы', 'Код_Последний_стаж_работы',
+                       'Категория_товара', 'Код_Категория_товара',
+                       'Код_магазина', 'Семейное_положение', 'Код_Семейное_положение',
+                       'Образование', 'Код_Образование', 'Тип_занятости', 'Код_Тип_занятости',
+                       'Стаж_работы', 'Код_Стаж_работы', 'Срок_кредита', 'Колво_детей',
+                       'Код_Колво_детей']
+
+# Числовые признаки, подлежащие стандартизации
+NUM_COLUMNS = ['Ежемесячный_доход', 'Ежемесячный_расход', 'Сумма_заказа', 'Кредитная_нагрузка']
+
+# Степень полинома для создания новых признаков
+# для создания полиномиальной модели
+POLYNOM_ORDER = 3
+
 
 def feature_prepare_for_bank(dataset, data_id, scaler, transform_columns):
     """
@@ -38,32 +65,36 @@ def feature_prepare_for_bank(dataset, data_id, scaler, transform_columns):
     :param transform_columns: Признаки, подлежащие стандартизации
     :return: Датасет для обучения модели определенного банка
     """
-    # Степень полинома для создания новых признаков
-    # для создания полиномиальной модели
-    polynom_order = 3
+    dataset = feature_prepare_common(dataset, scaler, transform_columns)
 
-    # Удаление признаков, которые не нужны для обучения модели любого банка
-    dataset = dataset.drop(columns=['Последний_стаж_работы', 'Код_Последний_стаж_работы',
-                                    'Категория_товара', 'Код_Категория_товара',
-                                    'Код_магазина', 'Семейное_положение', 'Код_Семейное_положение',
-                                    'Образование', 'Код_Образование', 'Тип_занятости', 'Код_Тип_занятости',
-                                    'Стаж_работы', 'Код_Стаж_работы', 'Срок_кредита', 'Колво_детей',
-                                    'Код_Колво_детей'])
     # Удаление признаков, которые не нужны для обучения модели конкретного банка
     bank_drop_columns = all_drop_columns.get(data_id, [])
     dataset = dataset.drop(columns=bank_drop_columns)
 
+    return dataset
+
+
+def feature_prepare_common(dataset, scaler, transform_columns):
+    """
+    Подготавливает общую для всех банков часть датасета:
+    удаление ненужных признаков, масштабирование и полиномиальные признаки
+    :param dataset: Исходный датасет
+    :param scaler: Обученный объект для стандартизации числовых признаков
+    :param transform_columns: Признаки, подлежащие стандартизации
+    :return: Датасет с признаками для всех банков
+    """
+
+    # Удаление признаков, которые не нужны для обучения модели любого банка
+    dataset = dataset.drop(columns=COMMON_DROP_COLUMNS)
+
     # Масштабирование признаков
     dataset['Возраст'] = dataset['Возраст'] / 100
 
     scaled = scaler.transform(dataset[transform_columns])
-    scaled = to_polynom(scaled, order=polynom_order)
+    scaled = to_polynom(scaled, order=POLYNOM_ORDER)
 
-    ext_transform_columns = transform_columns.copy()
-    for o in range(2, polynom_order + 1):
-        for el in transform_columns:
-            ext_transform_columns = np.append(ext_transform_columns, f'{el}_{o}')
-    df_standard = pd.DataFrame(scaled, columns=ext_transform_columns)
+    ext_transform_columns = get_polynom_columns(transform_columns)
+    df_standard = pd.DataFrame(scaled, columns=ext_transform_columns, index=dataset.index)
 
     # Удаление исходных признаков, которые уже отмасштабированы
     dataset = dataset.drop(columns=transform_columns)
@@ -73,6 +104,53 @@ def feature_prepare_for_bank(dataset, data_id, scaler, transform_columns):
     return dataset
 
 
+def get_polynom_columns(transform_columns, order=None):
+    """
+    Названия полиномиальных признаков в порядке, в котором их возвращает to_polynom
+    :param transform_columns: Признаки, подлежащие стандартизации
+    :param order: Степень полинома (по умолчанию - POLYNOM_ORDER)
+    :return: Список названий признаков
+    """
+    order = order or POLYNOM_ORDER
+    ext_transform_columns = list(transform_columns)
+    for o in range(2, order + 1):
+        for el in transform_columns:
+            ext_transform_columns.append(f'{el}_{o}')
+
+    return ext_transform_columns
+
+
+def select_bank_dataset(common_dataset, data_id):
+    """
+    Выбирает из общей части датасета строки и признаки для определенного банка
+    :param common_dataset: Датасет с признаками для всех банков (результат feature_prepare_common)
+    :param data_id: Идентификатор банка
+    :return: Датасет для обучения модели определенного банка с целевым признаком 'Y'
+    """
+    target = f'Решение_банка_{data_id}'
+    bank_drop_columns = set(all_drop_columns.get(data_id, []))
+    columns = [column for column in common_dataset.columns
+               if column not in bank_drop_columns
+               and (not column.startswith("Решение_банка") or column == target)]
+
+    dataset = common_dataset.loc[common_dataset[target] != 2, columns]
+    dataset = dataset.reset_index(drop=True)
+
+    return dataset.rename(columns={target: 'Y'})
+
+
+def fit_scaler(dataset):
+    """
+    Обучение объекта для стандартизации числовых признаков
+    :param dataset: Исходный датасет
+    :return: Обученный объект StandardScaler
+    """
+    standard_scaler = StandardScaler(copy=True, with_mean=True, with_std=True)
+    standard_scaler.fit(dataset[NUM_COLUMNS])
+
+    return standard_scaler
+
+
 def to_polynom(x, order=2):
     """
     Преобразование признаков к полиному
@@ -87,12 +165,51 @@ def to_polynom(x, order=2):
     return out
 
 
+def write_bank_datasets(common_dataset, bank_ids, stage_dir, scaler, model_dir, max_workers=None):
+    """
+    Параллельное сохранение датасетов (в хранилища признаков) и объектов стандартизации для нескольких банков
+    :param common_dataset: Датасет с признаками для всех банков (результат feature_prepare_common)
+    :param bank_ids: Идентификаторы банков
+    :param stage_dir: Каталог для хранилищ признаков
+    :param scaler: Обученный объект для стандартизации числовых признаков
+    :param model_dir: Каталог для объектов стандартизации
+    :param max_workers: Количество потоков записи (по умолчанию - по количеству банков)
+    """
+
+    def write_bank(bank_id):
+        df = select_bank_dataset(common_dataset, bank_id)
+        write_feature_store(df, os.path.join(stage_dir, f"features_{bank_id}"))
+        joblib.dump(scaler, os.path.join(model_dir, f'scaler_{bank_id}.pkl'))
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(bank_ids)) as executor:
+        list(executor.map(write_bank, bank_ids))
+
+
+def save_preprocessing_artifact(statistics_filename, artifact_filename, bank_ids, scaler):
+    """
+    Сохранение статистик предобработки вместе с параметрами стандартизации банков.
+    Параметры стандартизации других банков из ранее сохраненного файла сохраняются
+    :param statistics_filename: Путь к файлу статистик этапа preprocess
+    :param artifact_filename: Путь к файлу статистик для предсказания
+    :param bank_ids: Идентификаторы банков
+    :param scaler: Обученный объект для стандартизации числовых признаков
+    """
+    artifact = load_artifact(statistics_filename)
+    if os.path.exists(artifact_filename):
+        artifact.scalers = load_artifact(artifact_filename).scalers
+
+    for bank_id in bank_ids:
+        artifact.scalers[bank_id] = ScalerParams.from_scaler(scaler, NUM_COLUMNS)
+
+    save_artifact(artifact, artifact_filename)
+
+
 if __name__ == "__main__":
     stage_name = "feature_prepare"
 
-    if len(sys.argv) !=3:
+    if len(sys.argv) != 3:
         sys.stderr.write("Arguments error. Usage:\n")
-        sys.stderr.write(f"\tpython3 bank_id  {stage_name}.py data-file\n")
+        sys.stderr.write(f"\tpython3 {stage_name}.py bank_id|all data-file\n")
         sys.exit(1)
 
     # Название файла загружаемого датасета
@@ -108,28 +225,24 @@ if __name__ == "__main__":
     os.makedirs(stage_dir, exist_ok=True)
     os.makedirs(model_dir, exist_ok=True)
 
-    # %% Задание путей для файлов
-    filename_input = os.path.join(project_path, f_input)
-    filename_output = os.path.join(stage_dir, f"dataset_{bank_id}.csv")
-    scaler_filename = f'scaler_{bank_id}.pkl'
-    scaler_full_filename = os.path.join(model_dir, scaler_filename)
-
-    # %% Чтение файла данных
-    df = pd.read_csv(filename_input, sep=';')
-
-    # Подготовка датасета
-    target = f'Решение_банка_{bank_id}'
-    num_columns = ['Ежемесячный_доход', 'Ежемесячный_расход', 'Сумма_заказа', 'Кредитная_нагрузка']
-    standard_scaler = StandardScaler(copy=True, with_mean=True, with_std=True)
-    standard_scaler.fit(df[num_columns])
-
-    df = df.drop(df[(df[target] == 2)].index)
-    df = df.reset_index(drop=True)
-    df = df.rename(columns={target: 'Y'})
-    df = df.drop(columns=[column for column in df.columns
-                          if column.startswith("Решение_банка")])
-    df = feature_prepare_for_bank(df, bank_id, standard_scaler, num_columns)
-
-    # Сохранение результатов в файлы
-    joblib.dump(standard_scaler, scaler_full_filename)
-    df.to_csv(filename_output, index=False, sep=';')
+    with copy_on_write():
+        # %% Чтение файла данных
+        filename_input = os.path.join(project_path, f_input)
+        df = apply_one_hot_format(read_dataset(filename_input), get_io_params()["one_hot"])
+        memory_before = memory_usage(df)
+
+        # Подготовка датасета.
+        # Объект стандартизации обучается на всем датасете и одинаков для всех банков
+        standard_scaler = fit_scaler(df)
+        df = enforce_schema(feature_prepare_common(df, standard_scaler, NUM_COLUMNS))
+        print_memory_report(stage_name, memory_before, df)
+
+        # Сохранение результатов в файлы
+        bank_ids = BANK_IDS if bank_id == 'all' else [bank_id]
+        write_bank_datasets(df, bank_ids, stage_dir, standard_scaler, model_dir)
+
+    # Статистики предобработки для предсказания
+    statistics_filename = os.path.join(os.path.dirname(filename_input), STATISTICS_FILENAME)
+    if os.path.exists(statistics_filename):
+        save_preprocessing_artifact(statistics_filename, os.path.join(model_dir, ARTIFACT_FILENAME),
+                                    bank_ids, standard_scaler)
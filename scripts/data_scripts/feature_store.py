@@ -0,0 +1,168 @@
+"""
+Хранилище признаков банка: матрица признаков float32 и целевой признак в файлах .npy
+с файлом описания признаков. Файлы читаются через memmap, строки выборок выбираются по номерам
+без чтения и разбора всего датасета
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from .data_methods import densify
+from .utils.schema import enforce_schema
+
+# Версия формата файла описания
+STORE_VERSION = 1
+
+# Файлы хранилища
+FEATURES_FILENAME = "features.npy"
+TARGET_FILENAME = "target.npy"
+MANIFEST_FILENAME = "manifest.json"
+
+# Каталоги хранилищ признаков и номеров строк выборок (относительно каталога проекта)
+FEATURE_STORE_DIR = os.path.join("data", "stage_feature_prepare")
+SPLIT_DIR = os.path.join("data", "stage_train_test_split")
+
+# Наибольшее целое значение, точно представимое в float32
+MAX_EXACT_FLOAT32 = 2 ** 24
+
+
+def get_store_dir(project_path, bank_id):
+    """
+    Каталог хранилища признаков банка
+    :param project_path: каталог проекта
+    :param bank_id: идентификатор банка
+    """
+    return os.path.join(project_path, FEATURE_STORE_DIR, f"features_{bank_id}")
+
+
+def get_rows_filename(project_path, bank_id, part):
+    """
+    Путь к файлу номеров строк выборки
+    :param project_path: каталог проекта
+    :param bank_id: идентификатор банка
+    :param part: выборка (train или test)
+    """
+    return os.path.join(project_path, SPLIT_DIR, f"{part}_{bank_id}.npy")
+
+
+def write_feature_store(dataset, directory, target='Y'):
+    """
+    Сохранение датасета в хранилище признаков
+    :param dataset: датасет с числовыми признаками и целевым признаком
+    :param directory: каталог хранилища
+    :param target: название целевого признака
+    :return: объект FeatureStore для чтения сохраненного датасета
+    """
+    # Разреженные столбцы становятся плотными, типы признаков - по схеме (как при записи датасета)
+    features = enforce_schema(densify(dataset.drop(columns=target)))
+    for column, dtype in features.dtypes.items():
+        if pd.api.types.is_integer_dtype(dtype) and len(features) and \
+                features[column].abs().max() > MAX_EXACT_FLOAT32:
+            raise ValueError(f"Column '{column}' has values that can not be stored in float32 exactly")
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, FEATURES_FILENAME), features.to_numpy(dtype='float32'))
+    np.save(os.path.join(directory, TARGET_FILENAME), dataset[target].to_numpy(dtype='int8'))
+
+    manifest = {
+        "version": STORE_VERSION,
+        "target": target,
+        "rows": len(features),
+        "columns": list(features.columns),
+        "dtypes": {column: str(dtype) for column, dtype in features.dtypes.items()},
+    }
+    with open(os.path.join(directory, MANIFEST_FILENAME), "w", encoding="utf-8") as fd:
+        json.dump(manifest, fd, ensure_ascii=False, indent=2)
+
+    return FeatureStore(directory)
+
+
+class FeatureStore:
+    """
+    Выборка из хранилища признаков: файлы отображаются в память (memmap),
+    строки копируются в память только при построении датасета
+    """
+
+    def __init__(self, directory, rows=None):
+        """
+        :param directory: каталог хранилища
+        :param rows: номера строк выборки (по умолчанию - все строки)
+        """
+        with open(os.path.join(directory, MANIFEST_FILENAME), encoding="utf-8") as fd:
+            manifest = json.load(fd)
+        if manifest.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported feature store version {manifest.get('version')} in {directory}")
+
+        self.directory = directory
+        self.rows = None if rows is None else np.asarray(rows, dtype='int64')
+        self.target = manifest["target"]
+        self.columns = manifest["columns"]
+        self.dtypes = manifest["dtypes"]
+        self.x = np.load(os.path.join(directory, FEATURES_FILENAME), mmap_mode='r')
+        self.y = np.load(os.path.join(directory, TARGET_FILENAME), mmap_mode='r')
+
+    @classmethod
+    def from_rows_file(cls, directory, filename):
+        """
+        Выборка по файлу номеров строк (результат этапа train_test_split)
+        :param directory: каталог хранилища
+        :param filename: путь к файлу номеров строк
+        """
+        return cls(directory, np.load(filename))
+
+    def __len__(self):
+        return len(self.y) if self.rows is None else len(self.rows)
+
+    def __reduce__(self):
+        # Процессам передаются пути и номера строк, а не содержимое файлов
+        return self.__class__, (self.directory, self.rows)
+
+    def take(self, positions):
+        """
+        Подвыборка строк
+        :param positions: позиции строк внутри выборки
+        :return: новый объект FeatureStore
+        """
+        positions = np.asarray(positions, dtype='int64')
+        return self.__class__(self.directory, positions if self.rows is None else self.rows[positions])
+
+    def get_target(self):
+        """
+        Значения целевого признака выборки
+        """
+        return np.asarray(self.y if self.rows is None else self.y[self.rows])
+
+    def to_frame(self, positions=None):
+        """
+        Датасет с типами признаков исходного датасета
+        :param positions: позиции строк внутри выборки (по умолчанию - все строки)
+        :return: датасет с целевым признаком
+        """
+        rows = self.rows
+        if positions is not None:
+            positions = np.asarray(positions, dtype='int64')
+            rows = positions if rows is None else rows[positions]
+
+        x = np.asarray(self.x if rows is None else self.x[rows])
+        y = np.asarray(self.y if rows is None else self.y[rows])
+
+        # Признаки одного типа преобразуются одним блоком (без фрагментации датасета по столбцам)
+        groups = {}
+        for position, column in enumerate(self.columns):
+            groups.setdefault(self.dtypes[column], []).append(position)
+        blocks = [pd.DataFrame(x[:, group].astype(dtype, copy=False),
+                               columns=[self.columns[position] for position in group], copy=False)
+                  for dtype, group in groups.items()]
+        blocks.append(pd.DataFrame({self.target: y}))
+
+        return pd.concat(blocks, axis=1)[self.columns + [self.target]]
+
+    def iter_chunks(self, chunk_size):
+        """
+        Чтение выборки частями
+        :param chunk_size: количество строк в одной части
+        :return: генератор частей датасета
+        """
+        for offset in range(0, len(self), chunk_size):
+            yield self.to_frame(np.arange(offset, min(offset + chunk_size, len(self))))
@@ -1,39 +1,104 @@
 #! python
 # -*- coding: UTF-8 -*-
 
+import pandas as pd
+
 from .data_methods import create_stage
 
+# Ненужные столбцы
+DROP_COLUMNS = ['SkillFactory_Id', 'Position''']
+
+# Значения для заполнения пропусков, не зависящие от данных
+CONSTANT_FILL_VALUES = {
+    'Value': 'Нет стажа',
+    'ChildCount': 0,
+    'SNILS': 0,
+}
+
+# Признаки, пропуски в которых заполняются модой
+MODE_FILL_COLUMNS = ['Gender', 'Family status', 'Loan_term']
+
+# Признаки, пропуски в которых заполняются медианой
+MEDIAN_FILL_COLUMNS = ['Loan_amount']
 
-def fill_na_in_dataset(source_dataset):
+
+def fill_na_in_dataset(source_dataset, fill_values=None):
     """
     Заполнение пропусков и удаление ненужных столбцов
     :param source_dataset:  Исходный датасет
+    :param fill_values: Значения для заполнения пропусков
+                        (по умолчанию вычисляются по датасету)
     """
 
-    df = source_dataset.copy()
+    df = clean_dataset(source_dataset)
 
-    # Удаление пустых строк
-    df = df.dropna(how='all')
+    # Заполнение пустых значений
+    if fill_values is None:
+        fill_values = get_fill_values(df)
+    df = apply_fill_values(df, fill_values)
 
-    # Удаление дубликатов
-    df = df.drop_duplicates()
+    return df
+
+
+def clean_dataset(df, drop_duplicates=None):
+    """
+    Удаление пустых строк, дубликатов и ненужных столбцов
+    :param df:  Исходный датасет
+    :param drop_duplicates: Функция удаления дубликатов
+                            (по умолчанию дубликаты ищутся по 8-байтовым хешам строк)
+    """
+
+    # Пустые строки и дубликаты удаляются одной маской строк
+    keep = df.notna().to_numpy().any(axis=1)
+    if drop_duplicates is None:
+        # Хеши строк вместо DataFrame.duplicated: без промежуточных кодов значений для каждого столбца
+        keep &= ~pd.util.hash_pandas_object(df, index=False).duplicated().to_numpy()
+        df = df[keep]
+    else:
+        df = drop_duplicates(df[keep])
 
     # Удаление ненужных столбцов
-    df = df.drop(columns=['SkillFactory_Id', 'Position'''])
+    df = df.drop(columns=DROP_COLUMNS)
     df = df.reset_index(drop=True)
 
-    # Заполнение пустых значений
-    mode_gender = df['Gender'].value_counts().idxmax()
-    mode_family_status = df['Family status'].value_counts().idxmax()
-    mode_loan_term = df['Loan_term'].value_counts().idxmax()
-
-    df['Value'] = df['Value'].fillna('Нет стажа')
-    df['Gender'] = df['Gender'].fillna(mode_gender)
-    df['Family status'] = df['Family status'].fillna(mode_family_status)
-    df['ChildCount'] = df['ChildCount'].fillna(0)
-    df['SNILS'] = df['SNILS'].fillna(0)
-    df['Loan_amount'] = df['Loan_amount'].fillna(df['Loan_amount'].median())
-    df['Loan_term'] = df['Loan_term'].fillna(mode_loan_term)
+    return df
+
+
+def get_fill_values(df):
+    """
+    Вычисление значений для заполнения пропусков
+    :param df:  Датасет без пустых строк и дубликатов
+    :return: Словарь {признак: значение}
+    """
+
+    fill_values = dict(CONSTANT_FILL_VALUES)
+    for column in MODE_FILL_COLUMNS:
+        fill_values[column] = df[column].value_counts().idxmax()
+    for column in MEDIAN_FILL_COLUMNS:
+        fill_values[column] = df[column].median()
+
+    return fill_values
+
+
+def apply_fill_values(df, fill_values):
+    """
+    Заполнение пропусков заданными значениями
+    :param df:  Исходный датасет
+    :param fill_values: Словарь {признак: значение}
+    """
+
+    for column, value in fill_values.items():
+        values = df[column]
+        # В категориальный признак значение для заполнения добавляется как новая категория
+        if isinstance(values.dtype, pd.CategoricalDtype) and value not in values.cat.categories:
+            values = values.cat.add_categories([value])
+        if pd.api.types.is_object_dtype(values.dtype):
+            # Тип object-признака после заполнения определяется явно (неявное приведение в fillna устарело)
+            with pd.option_context('future.no_silent_downcasting', True):
+                values = values.fillna(value)
+            df[column] = values.infer_objects(copy=False)
+        else:
+            df[column] = values.fillna(value)
 
     return df
 
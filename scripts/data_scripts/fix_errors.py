@@ -3,40 +3,100 @@
 
 import numpy as np
 import pandas as pd
-from datetime import datetime, date
-from dateutil.relativedelta import relativedelta
 
 from .data_methods import create_stage
 from .utils.seniority_cats import months_seniority_to_cat, seniority_cat_to_month_count
-from .utils.seniority_cats import set_last_seniority
+from .utils.seniority_cats import months_seniority_to_codes, seniority_cat_to_month_count_array
+from .utils.seniority_cats import set_last_seniority, SENIORITY_BINS, DEFAULT_CAT
+from .utils.dates import months_between, subtract_months, to_datetime, get_as_of_date
+from .utils.schema import get_column_dtype, to_integer
 
 # Прожиточный минимум
 ADULT_LIVING_WAGE = 15669
 CHILD_LIVING_WAGE = 13944
 
+# Признаки, в которых удаляются выбросы
+FEATURES_TO_CLEAR = ["MonthProfit", "MonthExpense"]
 
-def fix_errors_in_dataset(source_dataset):
+# Процентили для вычисления межквартильного размаха
+OUTLIER_PERCENTILES = [25, 85]
+
+# Семейное положение при наличии супруга/супруги
+FAMILY_STATUSES_WITH_SPOUSE = ['Женат / замужем', 'Гражданский брак / совместное проживание']
+
+
+def fix_errors_in_dataset(source_dataset, as_of=None, bounds=None):
     """
     Исправление ошибок и аномалий в данных
     :param source_dataset:  Исходный датасет
+    :param as_of: Расчетная дата (по умолчанию - расчетная дата запуска)
+    :param bounds: Пределы значений для удаления выбросов
+                   (по умолчанию вычисляются по датасету)
     """
 
-    df = source_dataset.copy()
+    # Поверхностная копия: исходный датасет не изменяется при замене столбцов
+    df = source_dataset.copy(deep=False)
+
+    # Стаж исправляется построчно и не зависит от признаков с выбросами, поэтому исправляется
+    # до удаления выбросов: временные массивы не занимают память одновременно с копией строк
+    df = fix_seniority_in_dataset(df, as_of)
 
     # Удаление выбросов
-    features_to_clear = ["MonthProfit", "MonthExpense"]
-    for feature in features_to_clear:
-        lower_bound, upper_bound = get_bounds((df[feature]))
-        df = df.drop(df[(df[feature] < lower_bound) | (df[feature] > upper_bound)].index)
-    df = df.reset_index(drop=True)
+    if bounds is None:
+        bounds = get_outlier_bounds(df)
+    df = remove_outliers(df, bounds)
 
-    # Исправление аномалий
-    df = df.apply(fix_seniority, axis=1)
-    df = df.apply(fix_expense, axis=1)
+    # Исправление аномалий расхода (после удаления выбросов расхода)
+    df = fix_expense_in_dataset(df)
 
     return df
 
 
+def get_outlier_bounds(df):
+    """
+    Вычисление пределов значений признаков для удаления выбросов.
+    Пределы для каждого следующего признака вычисляются
+    после удаления выбросов по предыдущим
+    :param df:  Исходный датасет
+    :return: Словарь {признак: (нижняя граница, верхняя граница)}
+    """
+
+    bounds = {}
+    keep = np.ones(len(df), dtype=bool)
+    for feature in FEATURES_TO_CLEAR:
+        values = df[feature].to_numpy()
+        bounds[feature] = get_bounds(values[keep])
+        keep &= ~get_outlier_mask(values, *bounds[feature])
+
+    return bounds
+
+
+def remove_outliers(df, bounds):
+    """
+    Удаление выбросов одной маской строк по всем признакам
+    :param df:  Исходный датасет
+    :param bounds: Словарь {признак: (нижняя граница, верхняя граница)}
+    """
+
+    keep = np.ones(len(df), dtype=bool)
+    for feature, (lower_bound, upper_bound) in bounds.items():
+        keep &= ~get_outlier_mask(df[feature].to_numpy(), lower_bound, upper_bound)
+
+    return df[keep].reset_index(drop=True)
+
+
+def get_outlier_mask(values, lower_bound, upper_bound):
+    """
+    Маска выбросов: значения вне пределов (пустые значения выбросами не считаются)
+    :param values: Значения признака
+    :param lower_bound: Нижняя граница
+    :param upper_bound: Верхняя граница
+    :return: Логический массив
+    """
+
+    return (values < lower_bound) | (values > upper_bound)
+
+
 def fix_expense(application_data):
     """
     Исправление аномальных значений расхода семьи
@@ -67,57 +127,55 @@ def check_family_status(status):
          возвращает True
         :param status:  Данные из заявки
     """
-    status = str(status)
 
-    if (status == 'Женат / замужем' or
-            status == 'Гражданский брак / совместное проживание'):
-        return True
-    else:
-        return False
+    return str(status) in FAMILY_STATUSES_WITH_SPOUSE
 
 
-def fix_seniority(application_data):
+def fix_seniority(application_data, as_of=None):
     """
     Исправление аномальных значений стажа работы
     :param application_data:  Данные заявки
+    :param as_of: Расчетная дата (по умолчанию - расчетная дата запуска)
     """
 
+    if as_of is None:
+        as_of = get_as_of_date()
+
     # Общий стаж в месяцах
-    total_seniority_in_months = int(seniority_cat_to_month_count(application_data['Value']))
+    total_seniority_in_months = seniority_cat_to_month_count(application_data['Value'])
 
-    # Возраст
-    age = relativedelta(datetime.today(), application_data['BirthDate'])
+    # Возраст в месяцах
+    age_in_months = months_between(pd.to_datetime(application_data['BirthDate']), as_of)
 
     # Проверка на соответствие трудовому законодательству
-    if age.years < 16:
-        application_data['Value'] = 'Нет стажа'
-        application_data['JobStartDate'] = np.NAN
+    if np.trunc(age_in_months / 12) < 16:
+        application_data['Value'] = DEFAULT_CAT
+        application_data['JobStartDate'] = pd.NaT
         return application_data
 
     # Максимально возможный трудовой стаж в месяцах
     # (возраст - 16) (ТК)
-    max_seniority_in_months = age.months + (age.years - 16) * 12
+    max_seniority_in_months = age_in_months - 16 * 12
 
     # Общий стаж не может быть больше,
-    # чем максимально возможный трудовой стаж
-    new_total_seniority = min(total_seniority_in_months, max_seniority_in_months)
+    # чем максимально возможный трудовой стаж (при неизвестном возрасте не меняется)
+    new_total_seniority = np.fmin(total_seniority_in_months, max_seniority_in_months)
 
     # Стаж работы на последнем месте
     if (not pd.isna(application_data['JobStartDate']) and
             application_data['employment status'] != "Не работаю"):
         # Стаж работы на последнем месте в месяцах
-        last_seniority_in_months = set_last_seniority(application_data)
+        last_seniority_in_months = set_last_seniority(application_data, as_of)
 
         # Стаж на последнем рабочем месте не может быть больше,
         # чем максимально возможный трудовой стаж
         # Общий стаж не может быть меньше, чем стаж на последнем рабочем  месте
-        new_last_seniority = min(last_seniority_in_months, max_seniority_in_months, new_total_seniority)
+        new_last_seniority = np.fmin(np.fmin(last_seniority_in_months, max_seniority_in_months),
+                                     new_total_seniority)
 
         # Корректировка стажа на последнем рабочем  месте
         if new_last_seniority != last_seniority_in_months:
-            application_data['JobStartDate'] = datetime.strftime((date.today() -
-                                                                  relativedelta(months=new_last_seniority)),
-                                                                 "%Y-%m-%d %H:%M:%S")
+            application_data['JobStartDate'] = subtract_months(as_of, new_last_seniority)
 
     # Корректировка общего стажа
     if new_total_seniority != total_seniority_in_months:
@@ -126,6 +184,105 @@ def fix_seniority(application_data):
     return application_data
 
 
+def fix_expense_in_dataset(dataset):
+    """
+    Исправление аномальных значений расхода семьи для всего датасета.
+    Векторизованный вариант fix_expense
+    :param dataset:  Датасет с заявками
+    :return: Датасет с исправленными значениями расхода
+    """
+
+    # Реальный расход: сам пользователь, супруг/супруга (при наличии) и дети
+    has_spouse = dataset['Family status'].isin(FAMILY_STATUSES_WITH_SPOUSE).to_numpy()
+    real_expense = (ADULT_LIVING_WAGE
+                    + ADULT_LIVING_WAGE * has_spouse
+                    + CHILD_LIVING_WAGE * dataset['ChildCount'].to_numpy(dtype='int64'))
+
+    # Если рассчитанные расходы превышают указанные в заявлении,
+    # исправляем на большее значение
+    month_expense = dataset['MonthExpense'].to_numpy()
+    dataset['MonthExpense'] = to_integer(np.where(real_expense > month_expense, real_expense, month_expense),
+                                         get_column_dtype('MonthExpense')).to_numpy()
+
+    return dataset
+
+
+def fix_seniority_in_dataset(dataset, as_of=None):
+    """
+    Исправление аномальных значений стажа работы для всего датасета.
+    Векторизованный вариант fix_seniority
+    :param dataset:  Датасет с заявками
+    :param as_of: Расчетная дата (по умолчанию - расчетная дата запуска)
+    :return: Датасет с исправленными значениями стажа
+    """
+
+    if as_of is None:
+        as_of = get_as_of_date()
+    birth_date = to_datetime(dataset['BirthDate'])
+    job_start_date = to_datetime(dataset['JobStartDate'])
+
+    # Общий стаж в месяцах
+    total_seniority_in_months = seniority_cat_to_month_count_array(dataset['Value'])
+
+    # Возраст в месяцах
+    age_in_months = months_between(birth_date, as_of)
+
+    # Проверка на соответствие трудовому законодательству
+    # (в целых месяцах: возраст меньше 16 полных лет)
+    underage = age_in_months < 16 * 12
+
+    # Максимально возможный трудовой стаж в месяцах
+    # (возраст - 16) (ТК)
+    max_seniority_in_months = age_in_months - 16 * 12
+    del age_in_months
+
+    # Общий стаж не может быть больше,
+    # чем максимально возможный трудовой стаж
+    new_total_seniority = np.fmin(total_seniority_in_months, max_seniority_in_months)
+
+    # Стаж работы на последнем месте в месяцах
+    has_last_job = (job_start_date.notna() & (dataset['employment status'] != "Не работаю")).to_numpy()
+    last_seniority_in_months = months_between(job_start_date, as_of)
+
+    # Стаж на последнем рабочем месте не может быть больше,
+    # чем максимально возможный трудовой стаж
+    # Общий стаж не может быть меньше, чем стаж на последнем рабочем  месте
+    new_last_seniority = np.fmin(np.fmin(last_seniority_in_months, max_seniority_in_months),
+                                 new_total_seniority)
+    del max_seniority_in_months
+
+    # Корректировка стажа на последнем рабочем  месте (даты вычисляются только для исправляемых строк)
+    fix_last = has_last_job & ~underage & (new_last_seniority != last_seniority_in_months)
+    del has_last_job, last_seniority_in_months
+    job_start_values = job_start_date.to_numpy(dtype='datetime64[ns]', copy=True)
+    job_start_values[fix_last] = subtract_months(as_of, new_last_seniority[fix_last])
+    job_start_values[underage] = np.datetime64('NaT')
+    del new_last_seniority, fix_last
+
+    # Корректировка общего стажа по кодам категорий (без массива строк)
+    fix_total = ~underage & (new_total_seniority != total_seniority_in_months)
+    value = dataset['Value']
+    if not isinstance(value.dtype, pd.CategoricalDtype):
+        value = value.astype('category')
+    value = value.cat.add_categories([category for category in SENIORITY_BINS.categories
+                                      if category not in value.cat.categories])
+    categories = value.cat.categories
+    codes = value.cat.codes.to_numpy(copy=True)
+    new_codes = months_seniority_to_codes(new_total_seniority[fix_total], SENIORITY_BINS)
+    codes[fix_total] = categories.get_indexer(SENIORITY_BINS.categories)[new_codes]
+    codes[underage] = categories.get_loc(DEFAULT_CAT)
+
+    # Категории - только встречающиеся значения в порядке сортировки (как при преобразовании строк)
+    used = np.bincount(codes[codes >= 0], minlength=len(categories)) > 0
+    new_categories = categories[used].sort_values()
+    recode = np.append(new_categories.get_indexer(categories), -1).astype(codes.dtype)
+
+    dataset['Value'] = pd.Categorical.from_codes(recode[codes], new_categories, validate=False)
+    dataset['JobStartDate'] = job_start_values
+
+    return dataset
+
+
 def search_outliers(feature):
     """
     Поиск выбросов в значениях признака
@@ -143,7 +300,17 @@ def get_bounds(feature):
     :param feature: Значения признака
     :return: Нижняя и верхняя граница пределов
     """
-    q1, q3 = np.percentile(feature, [25, 85])
+    q1, q3 = np.percentile(feature, OUTLIER_PERCENTILES)
+    return iqr_bounds(q1, q3)
+
+
+def iqr_bounds(q1, q3):
+    """
+    Вычисляет пределы значений для нахождения выбросов по квартилям
+    :param q1: Нижний квартиль
+    :param q3: Верхний квартиль
+    :return: Нижняя и верхняя граница пределов
+    """
     iqr = q3 - q1
     lower_bound = q1 - 1.5 * iqr
     upper_bound = q3 + 1.5 * iqr
@@ -0,0 +1,242 @@
+#! python
+# -*- coding: UTF-8 -*-
+"""
+Предобработка датасета в одном процессе без промежуточных файлов:
+fill_na -> data_prepare -> fix_errors -> create_features
+"""
+import os
+import yaml
+import numpy as np
+import pandas as pd
+
+from .data_methods import get_stage_paths, read_dataset, write_dataset, dataset_filename, project_path
+from .data_methods import iter_dataset, DatasetWriter, print_memory_report, copy_on_write
+from .fill_na import clean_dataset, get_fill_values, apply_fill_values
+from .fill_na import CONSTANT_FILL_VALUES, MODE_FILL_COLUMNS, MEDIAN_FILL_COLUMNS
+from .data_prepare import prepare_dataset
+from .fix_errors import fix_errors_in_dataset, get_outlier_bounds, iqr_bounds, FEATURES_TO_CLEAR, OUTLIER_PERCENTILES
+from .create_features import create_features_in_dataset
+from .preprocessing_artifact import PreprocessingArtifact, save_artifact, STATISTICS_FILENAME
+from .utils.sketches import ValueCounter, QuantileSketch
+from .utils.schema import memory_usage
+
+
+def preprocess_dataset(source_dataset, as_of=None, checkpoint=None):
+    """
+    Последовательное выполнение всех этапов предобработки датасета в памяти
+    :param source_dataset: Исходный датасет
+    :param as_of: Расчетная дата (по умолчанию - расчетная дата запуска)
+    :param checkpoint: Функция checkpoint(stage_name, df) для сохранения
+                       промежуточных результатов (если нужно)
+    :return: Датасет с признаками
+    """
+
+    df, _ = preprocess_dataset_with_statistics(source_dataset, as_of, checkpoint)
+
+    return df
+
+
+def preprocess_dataset_with_statistics(source_dataset, as_of=None, checkpoint=None):
+    """
+    Предобработка датасета в памяти с сохранением вычисленных статистик
+    :param source_dataset: Исходный датасет
+    :param as_of: Расчетная дата (по умолчанию - расчетная дата запуска)
+    :param checkpoint: Функция checkpoint(stage_name, df) для сохранения
+                       промежуточных результатов (если нужно)
+    :return: Датасет с признаками и объект PreprocessingArtifact со статистиками
+    """
+
+    df = clean_dataset(source_dataset)
+    fill_values = get_fill_values(df)
+    df = apply_fill_values(df, fill_values)
+    if checkpoint is not None:
+        checkpoint("fill_na", df)
+
+    df = prepare_dataset(df)
+    if checkpoint is not None:
+        checkpoint("data_prepare", df)
+
+    bounds = get_outlier_bounds(df)
+    df = fix_errors_in_dataset(df, as_of, bounds)
+    if checkpoint is not None:
+        checkpoint("fix_errors", df)
+
+    df = create_features_in_dataset(df, as_of)
+
+    return df, PreprocessingArtifact(fill_values=fill_values, bounds=bounds)
+
+
+def preprocess_dataset_in_chunks(filename_input, filename_output, chunk_size,
+                                 sketch_size=2000, deduplicate='chunk', as_of=None):
+    """
+    Предобработка датасета по частям ограниченного размера в два прохода:
+    первый проход вычисляет значения для заполнения пропусков и пределы выбросов,
+    второй - преобразует строки и дописывает их в выходной файл
+    :param filename_input: Путь к исходному датасету
+    :param filename_output: Путь к результирующему датасету
+    :param chunk_size: Количество строк в одной части
+    :param sketch_size: Размер приближенных распределений для вычисления квантилей
+    :param deduplicate: Удаление дубликатов: chunk - в пределах части (память ограничена размером части),
+                        global - по всему датасету (память растет с числом строк, см. RowDeduplicator)
+    :param as_of: Расчетная дата (по умолчанию - расчетная дата запуска)
+    :return: Объект PreprocessingArtifact со значениями для заполнения пропусков и пределами выбросов
+    """
+
+    # Первый проход: вычисление статистик
+    fill_values, bounds = fit_statistics_in_chunks(iter_dataset(filename_input, chunk_size),
+                                                   sketch_size, deduplicate)
+
+    # Второй проход: преобразование строк
+    deduplicator = RowDeduplicator(deduplicate)
+    with DatasetWriter(filename_output) as writer:
+        for chunk in iter_dataset(filename_input, chunk_size):
+            df = clean_dataset(chunk, deduplicator)
+            if df.empty:
+                continue
+            df = apply_fill_values(df, fill_values)
+            df = prepare_dataset(df)
+            df = fix_errors_in_dataset(df, as_of, bounds)
+            if df.empty:
+                continue
+            df = create_features_in_dataset(df, as_of)
+            writer.write(df)
+
+    return PreprocessingArtifact(fill_values=fill_values, bounds=bounds)
+
+
+def fit_statistics_in_chunks(chunks, sketch_size=2000, deduplicate='chunk'):
+    """
+    Вычисление значений для заполнения пропусков и пределов выбросов по частям датасета.
+    Пределы для всех признаков вычисляются по одному распределению
+    (без предварительного удаления выбросов по предыдущим признакам)
+    :param chunks: Части исходного датасета
+    :param sketch_size: Размер приближенных распределений для вычисления квантилей
+    :param deduplicate: Удаление дубликатов: chunk - в пределах части (память ограничена размером части),
+                        global - по всему датасету (память растет с числом строк, см. RowDeduplicator)
+    :return: Значения для заполнения пропусков и пределы выбросов
+    """
+
+    deduplicator = RowDeduplicator(deduplicate)
+    counters = {column: ValueCounter() for column in MODE_FILL_COLUMNS}
+    sketches = {column: QuantileSketch(sketch_size) for column in MEDIAN_FILL_COLUMNS + FEATURES_TO_CLEAR}
+
+    for chunk in chunks:
+        df = clean_dataset(chunk, deduplicator)
+        for column, counter in counters.items():
+            counter.update(df[column].dropna())
+        for column in MEDIAN_FILL_COLUMNS:
+            sketches[column].update(df[column])
+        # Признаки для удаления выбросов приводятся к целому типу так же, как в prepare_dataset
+        for column in FEATURES_TO_CLEAR:
+            sketches[column].update(df[column].dropna().astype('int'))
+
+    fill_values = dict(CONSTANT_FILL_VALUES)
+    for column, counter in counters.items():
+        fill_values[column] = counter.mode()
+    for column in MEDIAN_FILL_COLUMNS:
+        fill_values[column] = sketches[column].quantile(0.5)
+
+    bounds = {}
+    for column in FEATURES_TO_CLEAR:
+        q1, q3 = (sketches[column].quantile(percentile / 100) for percentile in OUTLIER_PERCENTILES)
+        bounds[column] = iqr_bounds(q1, q3)
+
+    return fill_values, bounds
+
+
+class RowDeduplicator:
+    """
+    Удаление дубликатов строк в датасете, обрабатываемом по частям.
+    В режиме chunk (по умолчанию) дубликаты удаляются только в пределах части: память ограничена размером части,
+    но повторы строк из разных частей остаются в выходном файле и учитываются в статистиках несколько раз.
+    В режиме global удаляются все повторы, но память O(N) от числа уникальных строк N (8 байт на строку,
+    около 80 МБ на 10 млн строк) и не ограничивается размером части.
+    Хеши встреченных строк хранятся в нескольких отсортированных массивах (уровнях), размеры которых убывают
+    не меньше чем вдвое: хеши новой части добавляются отдельным уровнем, который сливается с предыдущими
+    уровнями не большего размера. Каждый хеш копируется при слиянии O(log N) раз (вместо пересборки всего
+    массива для каждой части), поиск выполняется по O(log N) уровням
+    """
+
+    def __init__(self, mode='chunk'):
+        """
+        :param mode: chunk - дубликаты ищутся в пределах части, global - по всему датасету
+        """
+        self.mode = mode
+        self._levels = []
+
+    def __call__(self, df):
+        """
+        Удаление дубликатов из очередной части датасета
+        :param df: часть датасета
+        """
+        df = df.drop_duplicates()
+        if self.mode != 'global':
+            return df
+
+        hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        seen = self._contains(hashes)
+        self._add(hashes[~seen])
+
+        return df[~seen]
+
+    def _contains(self, hashes):
+        """
+        Проверка хешей по всем уровням
+        :param hashes: хеши строк части
+        :return: логический массив: строка уже встречалась
+        """
+        seen = np.zeros(len(hashes), dtype=bool)
+        for level in self._levels:
+            positions = np.minimum(np.searchsorted(level, hashes), len(level) - 1)
+            seen |= level[positions] == hashes
+
+        return seen
+
+    def _add(self, hashes):
+        """
+        Добавление хешей новым уровнем со слиянием уровней не большего размера
+        :param hashes: хеши новых строк
+        """
+        level = np.unique(hashes)
+        if not len(level):
+            return
+        while self._levels and len(self._levels[-1]) <= len(level):
+            level = np.union1d(self._levels.pop(), level)
+        self._levels.append(level)
+
+
+def save_checkpoint(stage_name, df):
+    """
+    Сохранение промежуточного результата в каталог соответствующего этапа
+    :param stage_name: название этапа конвейера
+    :param df: датасет
+    """
+    stage_dir = os.path.join(project_path, "data", f"stage_{stage_name}")
+    os.makedirs(stage_dir, exist_ok=True)
+    write_dataset(df, os.path.join(stage_dir, dataset_filename("dataset")))
+
+
+if __name__ == "__main__":
+    stage_name = "preprocess"
+    params = yaml.safe_load(open(os.path.join(project_path, "params.yaml")))
+    preprocess_params = params.get(stage_name, {})
+
+    filename_input, filename_output, stage_dir = get_stage_paths(stage_name)
+
+    with copy_on_write():
+        if preprocess_params.get("chunk_size", 0) > 0:
+            statistics = preprocess_dataset_in_chunks(filename_input, filename_output,
+                                                      chunk_size=preprocess_params["chunk_size"],
+                                                      sketch_size=preprocess_params.get("sketch_size", 2000),
+                                                      deduplicate=preprocess_params.get("deduplicate", "chunk"))
+        else:
+            checkpoints = preprocess_params.get("checkpoints", False)
+            df = read_dataset(filename_input)
+            memory_before = memory_usage(df)
+            df, statistics = preprocess_dataset_with_statistics(
+                df, checkpoint=save_checkpoint if checkpoints else None)
+            print_memory_report(stage_name, memory_before, df)
+            write_dataset(df, filename_output)
+
+    # Статистики для предобработки при предсказании
+    save_artifact(statistics, os.path.join(stage_dir, STATISTICS_FILENAME))
@@ -0,0 +1,141 @@
+#! python
+# -*- coding: UTF-8 -*-
+"""
+Сохраненные статистики предобработки: значения для заполнения пропусков,
+пределы выбросов, словари категорий и параметры стандартизации.
+Вычисляются при обучении и используются при предсказании без пересчета
+"""
+import json
+import numpy as np
+from dataclasses import dataclass, field
+
+from .create_features import CATEGORY_ENCODERS
+
+# Версия формата файла статистик
+ARTIFACT_VERSION = 1
+
+# Файл статистик этапа preprocess (без параметров стандартизации)
+STATISTICS_FILENAME = "statistics.json"
+
+# Файл статистик для предсказания (в каталоге моделей)
+ARTIFACT_FILENAME = "preprocessing.json"
+
+
+@dataclass
+class ScalerParams:
+    """
+    Параметры стандартизации числовых признаков (как у StandardScaler)
+    """
+    columns: list
+    mean: list
+    scale: list
+
+    @classmethod
+    def from_scaler(cls, scaler, columns):
+        """
+        Параметры обученного объекта StandardScaler
+        :param scaler: обученный объект StandardScaler
+        :param columns: стандартизуемые признаки
+        """
+        return cls(columns=list(columns), mean=scaler.mean_.tolist(), scale=scaler.scale_.tolist())
+
+    def transform(self, dataset):
+        """
+        Стандартизация признаков (результат совпадает с StandardScaler.transform)
+        :param dataset: датасет со стандартизуемыми признаками
+        :return: массив стандартизованных значений
+        """
+        values = np.asarray(dataset[self.columns], dtype='float64')
+        values = values - np.asarray(self.mean)
+        values /= np.asarray(self.scale)
+        return values
+
+
+@dataclass
+class PreprocessingArtifact:
+    """
+    Статистики предобработки, вычисленные по обучающему датасету
+    """
+    fill_values: dict
+    bounds: dict
+    vocabularies: dict = field(default_factory=lambda: get_vocabularies())
+    scalers: dict = field(default_factory=dict)
+    version: int = ARTIFACT_VERSION
+
+    def to_dict(self):
+        """
+        Представление для сохранения в JSON
+        """
+        return {
+            "version": self.version,
+            "fill_values": {column: to_builtin(value) for column, value in self.fill_values.items()},
+            "bounds": {column: [to_builtin(value) for value in bound] for column, bound in self.bounds.items()},
+            "vocabularies": {prefix: [to_builtin(value) for value in categories]
+                             for prefix, categories in self.vocabularies.items()},
+            "scalers": {bank_id: vars(scaler) for bank_id, scaler in self.scalers.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Восстановление из JSON-представления с проверкой версии
+        :param data: словарь, полученный методом to_dict
+        """
+        version = data.get("version")
+        if version != ARTIFACT_VERSION:
+            raise ValueError(f"Unsupported preprocessing artifact version {version}, expected {ARTIFACT_VERSION}")
+
+        return cls(
+            fill_values=dict(data["fill_values"]),
+            bounds={column: tuple(bound) for column, bound in data["bounds"].items()},
+            vocabularies=dict(data["vocabularies"]),
+            scalers={bank_id: ScalerParams(**scaler) for bank_id, scaler in data.get("scalers", {}).items()},
+            version=version,
+        )
+
+    def check_vocabularies(self):
+        """
+        Проверка совпадения словарей категорий со словарями кодировщиков признаков:
+        при несовпадении one-hot признаки модели и предобработки различаются
+        """
+        vocabularies = get_vocabularies()
+        if self.vocabularies != vocabularies:
+            changed = [prefix for prefix in set(vocabularies) | set(self.vocabularies)
+                       if self.vocabularies.get(prefix) != vocabularies.get(prefix)]
+            raise ValueError(f"Preprocessing artifact vocabularies differ from the encoders: {sorted(changed)}")
+
+
+def get_vocabularies():
+    """
+    Словари категорий кодировщиков признаков: {префикс признаков: список категорий}
+    """
+    return {encoder.prefix: [to_builtin(category) for category in encoder.categories]
+            for encoder in CATEGORY_ENCODERS}
+
+
+def to_builtin(value):
+    """
+    Приведение скалярных значений numpy к встроенным типам Python
+    :param value: значение
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def save_artifact(artifact, filename):
+    """
+    Сохранение статистик предобработки в JSON-файл
+    :param artifact: объект PreprocessingArtifact
+    :param filename: путь к файлу
+    """
+    with open(filename, "w", encoding="utf-8") as fd:
+        json.dump(artifact.to_dict(), fd, ensure_ascii=False, indent=2)
+
+
+def load_artifact(filename):
+    """
+    Загрузка статистик предобработки из JSON-файла
+    :param filename: путь к файлу
+    :return: объект PreprocessingArtifact
+    """
+    with open(filename, encoding="utf-8") as fd:
+        return PreprocessingArtifact.from_dict(json.load(fd))
@@ -4,9 +4,13 @@
 import sys
 import os
 import yaml
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 
+from .feature_store import FeatureStore, get_rows_filename
+from .feature_prepare import BANK_IDS
+
 
 def separate_bank_dataset(source_dataset, target_name, p_split_ratio, random_state=42):
     """
@@ -31,22 +35,40 @@ def separate_bank_dataset(source_dataset, target_name, p_split_ratio, random_sta
     return df_train, df_test
 
 
+def split_rows(target, p_split_ratio, random_state=42):
+    """
+    Разделение номеров строк на обучающую и тестовую выборки
+    (с тем же разбиением, что и separate_bank_dataset)
+    :param target: Значения целевого параметра
+    :param p_split_ratio: Отношение для разделения
+    :param random_state: фиксированный сид случайных чисел (для повторяемости)
+    :return: Номера строк обучающей и тестовой выборок
+    """
+
+    return train_test_split(np.arange(len(target)), test_size=p_split_ratio,
+                            random_state=random_state, stratify=target)
+
+
 if __name__ == "__main__":
     stage_name = "train_test_split"
 
     if len(sys.argv) != 3:
         sys.stderr.write("Arguments error. Usage:\n")
-        sys.stderr.write(f"\tpython3 bank_id {stage_name}.py data-file\n")
+        sys.stderr.write(f"\tpython3 {stage_name}.py bank_id feature-store-dir\n")
+        sys.stderr.write(f"\tpython3 {stage_name}.py all feature-prepare-stage-dir\n")
         sys.exit(1)
 
-    # Название файла загружаемого датасета
+    # Каталог хранилища признаков банка (для all - каталог этапа feature_prepare с хранилищами всех банков)
     f_input = sys.argv[2]
     bank_id = sys.argv[1]
 
     # %% Задание путей для файлов
     project_path = os.getcwd()
     stage_dir = os.path.join(project_path, "data", f"stage_{stage_name}")
-    filename_input = os.path.join(project_path, f_input)
+    if bank_id == 'all':
+        store_dirs = {bank: os.path.join(project_path, f_input, f"features_{bank}") for bank in BANK_IDS}
+    else:
+        store_dirs = {bank_id: os.path.join(project_path, f_input)}
 
     # %% Создание каталогов
     os.makedirs(stage_dir, exist_ok=True)
@@ -56,16 +78,14 @@ if __name__ == "__main__":
     split_ratio = params["split"]["split_ratio"]
     random_state = params["split"]["random_state"]
 
-    # %% Чтение файла данных
-    df = pd.read_csv(filename_input, sep=';')
-    print(f'Строк - {df.shape[0]}')
+    for bank, store_dir in store_dirs.items():
+        # %% Чтение целевого признака (матрица признаков не читается)
+        target = FeatureStore(store_dir).get_target()
+        print(f'Банк {bank}: строк - {len(target)}')
 
-    # Подготовка датасетов
-    target_column = 'Y'
-    df_train, df_test = separate_bank_dataset(df, target_column, split_ratio, random_state)
+        # Разделение номеров строк
+        train_rows, test_rows = split_rows(target, split_ratio, random_state)
 
-    # Сохранение результатов в файлы
-    train_filename_output = os.path.join(stage_dir, f"train_{bank_id}.csv")
-    test_filename_output = os.path.join(stage_dir, f"test_{bank_id}.csv")
-    df_train.to_csv(train_filename_output, index=False, sep=';')
-    df_test.to_csv(test_filename_output, index=False, sep=';')
+        # Сохранение результатов в файлы
+        np.save(get_rows_filename(project_path, bank, "train"), train_rows)
+        np.save(get_rows_filename(project_path, bank, "test"), test_rows)
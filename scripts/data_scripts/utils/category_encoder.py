@@ -0,0 +1,115 @@
+"""
+Векторизованное кодирование категориальных признаков
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Наибольший диапазон значений целого признака для перекодировки по таблице
+MAX_LOOKUP_RANGE = 2 ** 16
+
+
+class CategoryEncoder:
+    """
+    Скомпилированная таблица перекодировки исходных значений признака
+    в коды категорий и one-hot представление
+    """
+
+    def __init__(self, categories, prefix, mapping=None, default=None):
+        """
+        :param categories: упорядоченный список категорий признака
+        :param prefix: префикс названий столбцов one-hot представления
+        :param mapping: словарь {исходное значение: категория}, значения вне словаря
+                        сохраняются без изменений
+        :param default: категория для значений, которых нет ни в словаре, ни в списке категорий
+                        (по умолчанию - пустое значение)
+        """
+        mapping = mapping or {}
+        self.categories = list(categories)
+        self.prefix = prefix
+        self.columns = [f'{prefix}_{category}' for category in self.categories]
+
+        # Исходные значения: ключи словаря и сами категории
+        keys = list(mapping) + [category for category in self.categories if category not in mapping]
+        self._keys = pd.Index(keys)
+        key_codes = [self._code(mapping.get(key, key)) for key in keys]
+        # Последний элемент - код для неизвестных значений
+        self._codes = np.array(key_codes + [self._code(default)], dtype=self.codes_dtype)
+        # Словарь для перекодировки отдельных значений
+        self._lookup = dict(zip(keys, key_codes))
+        self._default_code = self._code(default)
+
+        # Единичная матрица с нулевой строкой для пустых значений
+        self._one_hot = np.vstack([np.eye(len(self.categories), dtype='uint8'),
+                                   np.zeros((1, len(self.categories)), dtype='uint8')])
+
+    @property
+    def codes_dtype(self):
+        """
+        Тип данных кодов категорий (как у pandas.Categorical)
+        """
+        return np.int8 if len(self.categories) < np.iinfo(np.int8).max else np.int16
+
+    def encode(self, values):
+        """
+        Перекодировка исходных значений в коды категорий
+        :param values: исходные значения признака
+        :return: массив кодов категорий (-1 для пустых значений)
+        """
+        # Категориальный признак перекодируется по категориям, без массива исходных значений
+        dtype = getattr(values, 'dtype', None)
+        if isinstance(dtype, pd.CategoricalDtype):
+            values = pd.Categorical(values)
+            positions = self._keys.get_indexer(np.asarray(values.categories, dtype=object))
+            # Последний элемент - код для пустых значений (код категории -1)
+            return np.append(self._codes[positions], self._codes[-1])[values.codes]
+
+        # Целый признак перекодируется по таблице для диапазона его значений
+        if pd.api.types.is_integer_dtype(dtype) and not isinstance(dtype, pd.api.extensions.ExtensionDtype):
+            values = np.asarray(values)
+            if len(values) and int(values.max()) - int(values.min()) < MAX_LOOKUP_RANGE:
+                low = int(values.min())
+                positions = self._keys.get_indexer(np.arange(low, int(values.max()) + 1).astype(object))
+                return self._codes[positions][values.astype('int32') - low]
+
+        positions = self._keys.get_indexer(np.asarray(values, dtype=object))
+        return self._codes[positions]
+
+    def encode_value(self, value):
+        """
+        Перекодировка одного исходного значения в код категории (без pandas)
+        :param value: исходное значение признака
+        :return: код категории (-1 для пустых значений)
+        """
+        return self._lookup.get(value, self._default_code)
+
+    def to_categorical(self, codes):
+        """
+        Упорядоченный категориальный признак по кодам категорий
+        :param codes: коды категорий
+        """
+        return pd.Categorical.from_codes(codes, categories=self.categories, ordered=True)
+
+    def to_one_hot(self, codes, index=None, is_sparse=False):
+        """
+        One-hot представление по кодам категорий (как в pandas.get_dummies) с типом uint8
+        :param codes: коды категорий
+        :param index: индекс результирующего датафрейма
+        :param is_sparse: разреженные столбцы (pandas.SparseDtype) вместо плотных
+        """
+        if not is_sparse:
+            # Без копирования матрицы конструктором (в режиме копирования при записи)
+            return pd.DataFrame(self._one_hot[codes], columns=self.columns, index=index, copy=False)
+
+        codes = np.asarray(codes)
+        rows = np.flatnonzero(codes >= 0)
+        matrix = sparse.csr_matrix((np.ones(len(rows), dtype='uint8'), (rows, codes[rows])),
+                                   shape=(len(codes), len(self.categories)))
+        return pd.DataFrame.sparse.from_spmatrix(matrix, index=index, columns=self.columns)
+
+    def _code(self, category):
+        """
+        Код категории (-1, если категории нет в списке)
+        :param category: категория
+        """
+        return self.categories.index(category) if category in self.categories else -1
@@ -0,0 +1,248 @@
+"""
+Векторизованная арифметика дат
+"""
+import os
+import numpy as np
+import pandas as pd
+
+# Переменная окружения для фиксации расчетной даты
+AS_OF_DATE_ENV = 'AS_OF_DATE'
+
+# Расчетная дата, зафиксированная для текущего запуска
+_as_of_date = None
+
+# Количество наносекунд в сутках
+NS_PER_DAY = 86_400 * 10 ** 9
+
+# Количество дней в месяцах невисокосного года
+DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype='int8')
+
+
+def set_as_of_date(value=None):
+    """
+    Фиксация расчетной даты для текущего запуска
+    :param value: расчетная дата (по умолчанию - из переменной окружения AS_OF_DATE или текущий момент)
+    :return: зафиксированная расчетная дата
+    """
+    global _as_of_date
+
+    if value is None:
+        value = os.environ.get(AS_OF_DATE_ENV) or pd.Timestamp.today()
+    _as_of_date = pd.Timestamp(value)
+
+    return _as_of_date
+
+
+def reset_as_of_date():
+    """
+    Сброс зафиксированной расчетной даты
+    """
+    global _as_of_date
+    _as_of_date = None
+
+
+def get_as_of_date():
+    """
+    Получение расчетной даты. Если дата не зафиксирована для запуска,
+    возвращается значение переменной окружения AS_OF_DATE или текущий момент
+    :return: расчетная дата
+    """
+    if _as_of_date is not None:
+        return _as_of_date
+
+    return pd.Timestamp(os.environ.get(AS_OF_DATE_ENV) or pd.Timestamp.today())
+
+
+def to_datetime(values):
+    """
+    Преобразование значений в даты. Признаки, уже содержащие даты, не копируются
+    :param values: значения признака
+    :return: даты
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    return pd.to_datetime(values)
+
+
+def months_between(start, end):
+    """
+    Количество полных месяцев между датами (так же, как в relativedelta).
+    Вычисляется в целых числах по годам и месяцам (int32) без промежуточных массивов float64
+    :param start: начальные даты (массив или скаляр)
+    :param end: конечные даты (массив или скаляр)
+    :return: количество месяцев (int32; float64 с NaN, если есть пустые даты)
+    """
+    if np.ndim(start) == 0 and np.ndim(end) == 0:
+        return _months_between_scalars(pd.Timestamp(start), pd.Timestamp(end))
+
+    start_year, start_month, start_day, start_ns, start_na = _split_dates(start)
+    end_year, end_month, end_day, end_ns, end_na = _split_dates(end)
+
+    months = (end_year - start_year) * 12 + (end_month - start_month)
+    del start_year, start_month
+
+    # День начальной даты, перенесенный в месяц конечной даты
+    # (с учетом количества дней в месяце)
+    shifted_day = np.minimum(start_day, _days_in_month(end_year, end_month))
+    shifted_after_end = np.asarray(shifted_day > end_day)
+    shifted_before_end = np.asarray(shifted_day < end_day)
+
+    # При совпадении дней сравнивается время суток (только для таких дат)
+    same_day = np.asarray(shifted_day == end_day)
+    del shifted_day, start_day
+    if same_day.any():
+        start_time = np.broadcast_to(start_ns, same_day.shape)[same_day] % NS_PER_DAY
+        end_time = np.broadcast_to(end_ns, same_day.shape)[same_day] % NS_PER_DAY
+        shifted_after_end[same_day] = start_time > end_time
+        shifted_before_end[same_day] = start_time < end_time
+
+    months = months - ((months > 0) & shifted_after_end) + ((months < 0) & shifted_before_end)
+
+    is_na = start_na | end_na
+    if is_na.any():
+        months = np.where(is_na, np.nan, months)
+
+    return months[()]
+
+
+def years_between(start, end):
+    """
+    Количество полных лет между датами (так же, как в relativedelta)
+    :param start: начальные даты (массив или скаляр)
+    :param end: конечные даты (массив или скаляр)
+    :return: массив с количеством лет (NaN для пустых дат)
+    """
+    months = months_between(start, end)
+    # Целое число месяцев делится без преобразования в float64 (с отбрасыванием дробной части, как np.fix)
+    if np.issubdtype(np.asarray(months).dtype, np.integer):
+        return np.sign(months) * (np.abs(months) // 12)
+
+    return np.fix(months / 12)
+
+
+def subtract_months(end, months):
+    """
+    Вычитание месяцев из даты (так же, как в relativedelta) с отбрасыванием времени.
+    Вычисляется в целых числах по годам и месяцам (int32)
+    :param end: исходная дата
+    :param months: количество месяцев (массив или скаляр)
+    :return: массив дат (дата для скаляра)
+    """
+    end = pd.Timestamp(end)
+    if np.ndim(months) == 0:
+        month_index = end.year * 12 + end.month - 1 - int(months)
+        year, month = divmod(month_index, 12)
+        return pd.Timestamp(year, month + 1, min(end.day, int(_days_in_month(year, month + 1))))
+
+    month_index = np.int32(end.year * 12 + end.month - 1) - np.asarray(months).astype('int32')
+    year = month_index // 12
+    month = (month_index % 12 + 1).astype('int8')
+    del month_index
+    day = np.minimum(np.int8(end.day), _days_in_month(year, month))
+
+    return pd.DatetimeIndex(_days_from_civil(year, month, day).astype('datetime64[D]')).as_unit('ns')
+
+
+def _months_between_scalars(start, end):
+    """
+    Количество полных месяцев между двумя датами (скалярный вариант months_between
+    без промежуточных массивов для построчной обработки)
+    :param start: начальная дата (Timestamp или NaT)
+    :param end: конечная дата (Timestamp или NaT)
+    :return: количество месяцев (int32; NaN для пустой даты)
+    """
+    if start is pd.NaT or end is pd.NaT:
+        return np.float64(np.nan)
+
+    months = (end.year - start.year) * 12 + (end.month - start.month)
+
+    # День начальной даты, перенесенный в месяц конечной даты, и время суток
+    shifted = (min(start.day, int(_days_in_month(end.year, end.month))), start.value % NS_PER_DAY)
+    current = (end.day, end.value % NS_PER_DAY)
+    if months > 0 and shifted > current:
+        months -= 1
+    elif months < 0 and shifted < current:
+        months += 1
+
+    return np.int32(months)
+
+
+def _split_dates(value):
+    """
+    Разбиение дат на составляющие в целых типах
+    :param value: даты (массив или скаляр)
+    :return: год (int32), месяц (int8), день (int8), даты в наносекундах от начала эпохи (int64)
+             и маска пустых дат в виде массивов numpy
+    """
+    shape = np.shape(value)
+    dates = np.ravel(value)
+    if dates.dtype != np.dtype('datetime64[ns]'):
+        dates = pd.DatetimeIndex(pd.to_datetime(dates)).as_unit('ns').to_numpy()
+    is_na = np.isnat(dates)
+
+    # Номер дня от начала эпохи (пустые даты дают корректную дату, результат для них маскируется)
+    nanoseconds = dates.view('int64')
+    year, month, day = _civil_from_days((nanoseconds // NS_PER_DAY).astype('int32'))
+
+    return tuple(component.reshape(shape) for component in (year, month, day, nanoseconds, is_na))
+
+
+def _days_in_month(year, month):
+    """
+    Количество дней в месяце
+    :param year: год (массив)
+    :param month: месяц (массив)
+    :return: количество дней (int8)
+    """
+    is_leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+
+    return DAYS_IN_MONTH[month - 1] + ((month == 2) & is_leap)
+
+
+def _civil_from_days(days):
+    """
+    Год, месяц и день по номеру дня от начала эпохи в целых числах
+    (алгоритм days_from_civil/civil_from_days Г. Хиннанта)
+    :param days: номера дней от 1970-01-01 (int32)
+    :return: год (int32), месяц (int8) и день (int8)
+    """
+    # Дни отсчитываются от 0000-03-01, 400-летние эры содержат по 146097 дней
+    days = days + np.int32(719468)
+    era = days // 146097
+    day_of_era = days - era * 146097
+    del days
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    del day_of_era
+
+    # Месяцы отсчитываются от марта
+    month_from_march = (5 * day_of_year + 2) // 153
+    day = (day_of_year - (153 * month_from_march + 2) // 5 + 1).astype('int8')
+    del day_of_year
+    month = np.where(month_from_march < 10, month_from_march + 3, month_from_march - 9).astype('int8')
+    year = year_of_era + era * 400 + (month <= 2)
+
+    return year, month, day
+
+
+def _days_from_civil(year, month, day):
+    """
+    Номер дня от начала эпохи по году, месяцу и дню в целых числах
+    (алгоритм days_from_civil Г. Хиннанта)
+    :param year: год (int32)
+    :param month: месяц
+    :param day: день
+    :return: номера дней от 1970-01-01 (int32)
+    """
+    # Годы начинаются с марта, 400-летние эры содержат по 146097 дней
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    del year
+    month_from_march = (month.astype('int32') + 9) % 12
+    day_of_year = (153 * month_from_march + 2) // 5 + day - 1
+    del month_from_march
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+
+    return era * 146097 + day_of_era - np.int32(719468)
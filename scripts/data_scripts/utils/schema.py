@@ -0,0 +1,167 @@
+"""
+Единая схема типов данных признаков на всех этапах конвейера:
+коды и флаги - int8/int16, суммы - int32, дробные числовые признаки - float32,
+строковые признаки - category, one-hot признаки - uint8
+"""
+import numpy as np
+import pandas as pd
+
+# Типы признаков по названию
+COLUMN_DTYPES = {
+    # Исходные признаки (после data_prepare)
+    'Gender': 'int8',
+    'ChildCount': 'int8',
+    'SNILS': 'int8',
+    'Merch_code': 'int8',
+    'Loan_term': 'int8',
+    'Loan_amount': 'int32',
+    'MonthProfit': 'int32',
+    'MonthExpense': 'int32',
+    'education': 'category',
+    'employment status': 'category',
+    'Value': 'category',
+    'Position': 'category',
+    'Family status': 'category',
+    'Goods_category': 'category',
+    'BankA_decision': 'category',
+    'BankB_decision': 'category',
+    'BankC_decision': 'category',
+    'BankD_decision': 'category',
+    'BankE_decision': 'category',
+
+    # Признаки после create_features
+    'Пол': 'int8',
+    'СНИЛС': 'int8',
+    'Имеет_доход': 'int8',
+    'Кредит_возможен': 'int8',
+    'Возраст': 'int8',
+    'Ежемесячный_доход': 'int32',
+    'Ежемесячный_расход': 'int32',
+    'Сумма_заказа': 'int32',
+    'Кредитная_нагрузка': 'float32',
+    'Последний_стаж_работы': 'category',
+    'Категория_товара': 'category',
+    'Код_магазина': 'category',
+    'Семейное_положение': 'category',
+    'Образование': 'category',
+    'Тип_занятости': 'category',
+    'Стаж_работы': 'category',
+    'Срок_кредита': 'category',
+    'Колво_детей': 'category',
+    'Y': 'int8',
+}
+
+# Типы признаков по префиксу названия (коды категорий, целевые признаки,
+# one-hot признаки кодировщиков create_features и полиномиальные признаки feature_prepare)
+PREFIX_DTYPES = {
+    'Код_': 'int8',
+    'Решение_банка_': 'int8',
+    'Общий_стаж_': 'uint8',
+    'Образование_': 'uint8',
+    'Занятость_': 'uint8',
+    'Сем_положение_': 'uint8',
+    'Срок_кредита_': 'uint8',
+    'Кат_товара_': 'uint8',
+    'код_магазина_': 'uint8',
+    'Посл_стаж_': 'uint8',
+    'Колво_детей_': 'uint8',
+    'Ежемесячный_доход_': 'float32',
+    'Ежемесячный_расход_': 'float32',
+    'Сумма_заказа_': 'float32',
+    'Кредитная_нагрузка_': 'float32',
+}
+
+# Префиксы в порядке проверки (более длинные - раньше)
+_PREFIXES = sorted(PREFIX_DTYPES, key=len, reverse=True)
+
+
+def get_column_dtype(column):
+    """
+    Тип признака по схеме
+    :param column: название признака
+    :return: тип данных или None, если признака нет в схеме
+    """
+    if column in COLUMN_DTYPES:
+        return COLUMN_DTYPES[column]
+    for prefix in _PREFIXES:
+        if column.startswith(prefix):
+            return PREFIX_DTYPES[prefix]
+
+    return None
+
+
+def get_stream_dtype(column, dtype):
+    """
+    Тип признака в файле, записываемом по частям. Схема файла задается до записи всех частей,
+    а to_integer расширяет целый признак схемы до int64 в той части, где значения не помещаются в тип схемы,
+    поэтому такие признаки записываются с типом int64 (при чтении read_dataset сужает их до типа схемы)
+    :param column: название признака
+    :param dtype: тип признака в части датасета
+    :return: тип признака в файле
+    """
+    target = COLUMN_DTYPES.get(column)
+    if target is not None and target != 'category' and np.dtype(target).kind in 'iu' \
+            and pd.api.types.is_integer_dtype(dtype):
+        return np.dtype('int64')
+
+    return dtype
+
+
+def to_integer(values, dtype):
+    """
+    Приведение значений к целому типу схемы. Если значения не помещаются в тип схемы,
+    используется int64 (значения не искажаются переполнением)
+    :param values: значения признака без пропусков
+    :param dtype: целый тип по схеме
+    """
+    values = pd.Series(values) if not isinstance(values, pd.Series) else values
+    info = np.iinfo(dtype)
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        dtype = 'int64'
+
+    return values.astype(dtype)
+
+
+def enforce_schema(df):
+    """
+    Приведение признаков датасета к типам схемы без изменения значений:
+    целые признаки сужаются до типа схемы, дробные признаки схемы - до float32,
+    строковые становятся категориальными. Дробные значения целых признаков схемы (например, с пропусками
+    в исходном датасете) остаются float64 до приведения к целому типу (to_integer в data_prepare):
+    float32 точно представляет целые значения только до 2 ** 24.
+    Признаки вне схемы и разреженные признаки не изменяются
+    :param df: датасет
+    :return: датасет с типами по схеме (исходный, если изменений нет)
+    """
+    casts = {}
+    for column, dtype in df.dtypes.items():
+        target = get_column_dtype(column)
+        if target is None or isinstance(dtype, pd.SparseDtype) or dtype == target:
+            continue
+
+        if target == 'category':
+            if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+                casts[column] = 'category'
+        elif pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+            if np.dtype(target).kind == 'f':
+                casts[column] = target
+            elif not isinstance(dtype, pd.api.extensions.ExtensionDtype):
+                casts[column] = to_integer(df[column], target).dtype
+        elif pd.api.types.is_float_dtype(dtype) and not isinstance(dtype, pd.api.extensions.ExtensionDtype):
+            # Дробные признаки схемы (например, после масштабирования)
+            if np.dtype(target).kind == 'f':
+                casts[column] = target
+
+    casts = {column: dtype for column, dtype in casts.items() if df[column].dtype != dtype}
+    if not casts:
+        return df
+
+    return df.astype(casts)
+
+
+def memory_usage(df):
+    """
+    Объем памяти, занимаемый датасетом (МБ)
+    :param df: датасет
+    """
+    return df.memory_usage(deep=True).sum() / 2 ** 20
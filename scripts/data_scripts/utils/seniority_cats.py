@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
+from dataclasses import dataclass
+
+from .dates import months_between, get_as_of_date
 
 DEFAULT_CAT = 'Нет стажа'
 
@@ -33,6 +35,113 @@ NEW_SENIORITY_VALUES = {
 }
 
 
+@dataclass
+class SeniorityBins:
+    """
+    Скомпилированная таблица категорий стажа: границы диапазонов и коды категорий
+    """
+    categories: np.ndarray
+    starts: np.ndarray
+    stops: np.ndarray
+    month_counts: np.ndarray
+    default_code: int
+
+
+def compile_seniority_bins(seniority_values):
+    """
+    Компиляция словаря диапазонов стажа в таблицу для бинарного поиска
+    :param seniority_values: словарь {категория: диапазон количества месяцев}
+    :return: объект SeniorityBins
+    """
+    items = sorted(seniority_values.items(), key=lambda item: item[1].start)
+    categories = np.array([key for key, _ in items], dtype=object)
+
+    return SeniorityBins(
+        categories=categories,
+        starts=np.array([value_range.start for _, value_range in items], dtype='int64'),
+        stops=np.array([value_range.stop for _, value_range in items], dtype='int64'),
+        month_counts=np.array([max(value_range) for _, value_range in items], dtype='int16'),
+        default_code=int(np.flatnonzero(categories == DEFAULT_CAT)[0])
+    )
+
+
+SENIORITY_BINS = compile_seniority_bins(SENIORITY_VALUES)
+NEW_SENIORITY_BINS = compile_seniority_bins(NEW_SENIORITY_VALUES)
+
+# Количество месяцев по исходной категории стажа (для построчной конвертации)
+SENIORITY_MONTH_COUNTS = dict(zip(SENIORITY_BINS.categories, SENIORITY_BINS.month_counts.tolist()))
+
+
+def months_seniority_to_codes(numeric_values, bins):
+    """
+    Конвертация массива числовых значений стажа в коды категорий
+    :param numeric_values: стаж (количество месяцев)
+    :param bins: скомпилированная таблица категорий стажа
+    :return: массив кодов категорий (-1 для пустых значений)
+    """
+    values = np.asarray(numeric_values)
+    # Целые значения сравниваются с границами без преобразования в float64
+    if np.issubdtype(values.dtype, np.integer):
+        is_na = False
+    else:
+        values = np.fix(values.astype('float64'))
+        is_na = np.isnan(values)
+
+    codes = np.searchsorted(bins.starts, values, side='right') - 1
+    in_range = (codes >= 0) & (values < bins.stops[np.maximum(codes, 0)])
+    codes = np.where(in_range, codes, bins.default_code)
+
+    return np.where(is_na, -1, codes)
+
+
+def codes_to_cats(codes, bins):
+    """
+    Конвертация кодов категорий стажа в их строковое представление
+    :param codes: коды категорий (-1 для пустых значений)
+    :param bins: скомпилированная таблица категорий стажа
+    :return: массив строковых представлений категорий (None для пустых значений)
+    """
+    categories = np.append(bins.categories, None)
+
+    return categories[codes]
+
+
+def months_seniority_to_cat_array(numeric_values):
+    """
+    Конвертация массива числовых значений стажа в строковое
+    представление исходной категории стажа
+    :param numeric_values: стаж (количество месяцев)
+    :return массив строковых представлений исходной категории стажа
+    """
+    return codes_to_cats(months_seniority_to_codes(numeric_values, SENIORITY_BINS), SENIORITY_BINS)
+
+
+def months_seniority_to_new_cat_array(numeric_values):
+    """
+    Конвертация массива числовых значений стажа в строковое
+    представление новой категории стажа
+    :param numeric_values: стаж (количество месяцев)
+    :return массив строковых представлений новой категории стажа
+    """
+    return codes_to_cats(months_seniority_to_codes(numeric_values, NEW_SENIORITY_BINS), NEW_SENIORITY_BINS)
+
+
+def seniority_cat_to_month_count_array(str_values):
+    """
+    Конвертация массива строковых представлений исходной категории стажа
+    в количество месяцев
+    :param str_values:  строковые представления исходной категории стажа
+    :return массив со стажем (количество месяцев)
+    """
+    # Категориальный признак перекодируется по категориям, без создания массива строк
+    if not isinstance(getattr(str_values, 'dtype', None), pd.CategoricalDtype):
+        str_values = np.asarray(str_values, dtype=object)
+    codes = pd.Categorical(str_values, categories=SENIORITY_BINS.categories).codes
+    codes = np.where(codes < 0, SENIORITY_BINS.default_code, codes)
+
+    return SENIORITY_BINS.month_counts[codes]
+
+
 def months_seniority_to_cat(numeric_value):
     """
     Конвертация числового значения стажа в строковое
@@ -43,13 +152,9 @@ def months_seniority_to_cat(numeric_value):
     if numeric_value is None:
         return None
 
-    numeric_value = int(numeric_value)
+    code = months_seniority_to_codes(int(numeric_value), SENIORITY_BINS)
 
-    for key, value_range in SENIORITY_VALUES.items():
-        if numeric_value in value_range:
-            return key
-
-    return DEFAULT_CAT
+    return SENIORITY_BINS.categories[code]
 
 
 def months_seniority_to_new_cat(numeric_value):
@@ -62,13 +167,9 @@ def months_seniority_to_new_cat(numeric_value):
     if numeric_value is None:
         return None
 
-    numeric_value = int(numeric_value)
-
-    for key, value_range in NEW_SENIORITY_VALUES.items():
-        if numeric_value in value_range:
-            return key
+    code = months_seniority_to_codes(int(numeric_value), NEW_SENIORITY_BINS)
 
-    return DEFAULT_CAT
+    return NEW_SENIORITY_BINS.categories[code]
 
 
 def seniority_cat_to_month_count(str_value):
@@ -78,27 +179,54 @@ def seniority_cat_to_month_count(str_value):
     :param str_value:  строковое представление исходной категории стажа
     :return стаж (количество месяцев)
     """
+    default_count = SENIORITY_MONTH_COUNTS[DEFAULT_CAT]
 
-    str_value = str(str_value)
-    range_value = SENIORITY_VALUES.get(str_value, SENIORITY_VALUES[DEFAULT_CAT])
+    return SENIORITY_MONTH_COUNTS.get(str(str_value), default_count)
 
-    return max(range_value)
 
-
-def set_last_seniority(application_data):
+def set_last_seniority(application_data, as_of=None):
     """
     Вычисление стажа работы на последнем месте в месяцах
     :param application_data:  Данные заявки
+    :param as_of: Расчетная дата (по умолчанию - расчетная дата запуска)
     :return: Стаж работы на последнем месте в месяцах
     """
     if not pd.isna(application_data['JobStartDate']):
-        last_seniority = relativedelta(datetime.today(), pd.to_datetime(application_data['JobStartDate']))
+        if as_of is None:
+            as_of = get_as_of_date()
         # Стаж работы на последнем месте в месяцах
-        return last_seniority.months + last_seniority.years * 12
+        return int(months_between(pd.to_datetime(application_data['JobStartDate']), as_of))
 
     return None
 
 
+def get_last_seniority(job_start_dates, as_of=None):
+    """
+    Вычисление стажа работы на последнем месте в месяцах для массива дат.
+    Векторизованный вариант set_last_seniority
+    :param job_start_dates: Даты начала работы на последнем месте
+    :param as_of: Расчетная дата (по умолчанию - расчетная дата запуска)
+    :return: Массив со стажем в месяцах (NaN для пустых дат)
+    """
+    if as_of is None:
+        as_of = get_as_of_date()
+
+    return months_between(job_start_dates, as_of)
+
+
+def get_last_seniority_new_cat(job_start_dates, as_of=None):
+    """
+    Вычисление новой категории стажа работы на последнем месте для массива дат.
+    Векторизованный вариант set_last_seniority_new_cat
+    :param job_start_dates: Даты начала работы на последнем месте
+    :param as_of: Расчетная дата (по умолчанию - расчетная дата запуска)
+    :return: Категориальный массив с новыми категориями стажа (пустое значение для пустых дат)
+    """
+    codes = months_seniority_to_codes(get_last_seniority(job_start_dates, as_of), NEW_SENIORITY_BINS)
+
+    return pd.Categorical.from_codes(codes, categories=NEW_SENIORITY_BINS.categories)
+
+
 def set_last_seniority_cat(application_data):
     """
     Вычисление категории стажа работы на последнем месте
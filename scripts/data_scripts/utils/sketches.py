@@ -0,0 +1,111 @@
+"""
+Объединяемые статистики для обработки датасета по частям
+"""
+import numpy as np
+import pandas as pd
+
+
+class ValueCounter:
+    """
+    Частоты значений признака, накапливаемые по частям датасета
+    """
+
+    def __init__(self):
+        self.counts = pd.Series(dtype='float64')
+
+    def update(self, values):
+        """
+        Добавление значений очередной части датасета
+        :param values: значения признака
+        """
+        self.counts = self.counts.add(pd.Series(values).value_counts(), fill_value=0)
+
+    def merge(self, other):
+        """
+        Объединение с частотами, накопленными по другим частям датасета
+        :param other: объект ValueCounter
+        """
+        self.counts = self.counts.add(other.counts, fill_value=0)
+
+    def mode(self):
+        """
+        Наиболее частое значение признака
+        """
+        return self.counts.idxmax()
+
+
+class QuantileSketch:
+    """
+    Приближенное распределение числового признака для вычисления квантилей.
+    Хранит не более max_size пар (значение, вес). Пока различных значений
+    меньше max_size, квантили совпадают с numpy.percentile
+    """
+
+    def __init__(self, max_size=2000):
+        """
+        :param max_size: максимальное количество хранимых пар (значение, вес)
+        """
+        self.max_size = max_size
+        self.values = np.empty(0, dtype='float64')
+        self.weights = np.empty(0, dtype='float64')
+
+    def update(self, values):
+        """
+        Добавление значений очередной части датасета
+        :param values: значения признака (пропуски игнорируются)
+        """
+        values = np.asarray(values, dtype='float64')
+        values, counts = np.unique(values[~np.isnan(values)], return_counts=True)
+        self._add(values, counts.astype('float64'))
+
+    def merge(self, other):
+        """
+        Объединение с распределением, накопленным по другим частям датасета
+        :param other: объект QuantileSketch
+        """
+        self._add(other.values, other.weights)
+
+    def quantile(self, q):
+        """
+        Квантиль распределения (линейная интерполяция, как в numpy.percentile)
+        :param q: уровень квантиля от 0 до 1
+        """
+        if len(self.values) == 0:
+            return np.nan
+
+        total = self.weights.sum()
+        position = (total - 1) * q
+        cumulative = np.cumsum(self.weights)
+
+        lower_rank = np.floor(position)
+        lower = self.values[np.searchsorted(cumulative, lower_rank, side='right')]
+        upper = self.values[min(np.searchsorted(cumulative, lower_rank + 1, side='right'), len(self.values) - 1)]
+
+        return lower + (position - lower_rank) * (upper - lower)
+
+    def _add(self, values, weights):
+        """
+        Добавление пар (значение, вес) с последующим сжатием
+        :param values: значения
+        :param weights: веса значений
+        """
+        values, inverse = np.unique(np.concatenate([self.values, values]), return_inverse=True)
+        self.weights = np.bincount(inverse, weights=np.concatenate([self.weights, weights]))
+        self.values = values
+
+        if len(self.values) > self.max_size:
+            self._compress()
+
+    def _compress(self):
+        """
+        Сжатие распределения: соседние значения объединяются в max_size
+        групп примерно равного веса, значение группы - средневзвешенное
+        """
+        cumulative = np.cumsum(self.weights)
+        groups = np.minimum(((cumulative - self.weights / 2) / cumulative[-1] * self.max_size).astype('int64'),
+                            self.max_size - 1)
+        _, groups = np.unique(groups, return_inverse=True)
+
+        weights = np.bincount(groups, weights=self.weights)
+        self.values = np.bincount(groups, weights=self.values * self.weights) / weights
+        self.weights = weights
@@ -1,28 +1,114 @@
 #! python
 # -*- coding: UTF-8 -*-
 """
-Вычисление метрик
+Вычисление метрик.
+Вероятности положительного класса вычисляются один раз, классы и все метрики получаются из них
 """
 import os
 import sys
-import pickle
 import json
-import pandas as pd
-from sklearn.metrics import classification_report, f1_score
+import numpy as np
+from sklearn.metrics import classification_report, accuracy_score, f1_score, precision_score, recall_score
+from sklearn.metrics import roc_auc_score, average_precision_score
 from pathlib import Path
 
+from scripts.data_scripts.data_methods import densify
+from scripts.data_scripts.feature_store import FeatureStore, get_store_dir
+from scripts.model_scripts.model_store import load_model, BoosterModel
+
+# Порог вероятности положительного класса (как в predict моделей)
+DEFAULT_THRESHOLD = 0.5
+
+
+def predict_positive(model, x):
+    """
+    Вероятности положительного класса (один проход предсказания)
+    :param model: модель (BoosterModel или модель scikit-learn)
+    :param x: матрица признаков
+    :return: массив вероятностей
+    """
+    if isinstance(model, BoosterModel):
+        return np.asarray(model.predict_positive(x), dtype='float64')
+
+    return np.asarray(model.predict_proba(densify(x))[:, 1], dtype='float64')
+
+
+def get_metrics(y_true, proba, threshold=DEFAULT_THRESHOLD):
+    """
+    Метрики качества по вероятностям положительного класса
+    :param y_true: истинные значения
+    :param proba: вероятности положительного класса
+    :param threshold: порог вероятности положительного класса
+    :return: словарь {метрика: значение}
+    """
+    y_true = np.asarray(y_true)
+    preds = (np.asarray(proba) > threshold).astype('int64')
+    # ROC AUC и PR AUC не определены, если в выборке один класс
+    both_classes = len(np.unique(y_true)) == 2
+
+    return {
+        "micro_f1": float(f1_score(y_true, preds, average="micro")),
+        "macro_f1": float(f1_score(y_true, preds, average="macro", zero_division=0)),
+        "weighted_f1": float(f1_score(y_true, preds, average="weighted", zero_division=0)),
+        "f1": float(f1_score(y_true, preds, zero_division=0)),
+        "accuracy": float(accuracy_score(y_true, preds)),
+        "precision": float(precision_score(y_true, preds, zero_division=0)),
+        "recall": float(recall_score(y_true, preds, zero_division=0)),
+        "roc_auc": float(roc_auc_score(y_true, proba)) if both_classes else None,
+        "pr_auc": float(average_precision_score(y_true, proba)) if both_classes else None,
+    }
+
+
+def get_threshold_sweep(y_true, proba, thresholds):
+    """
+    Метрики положительного класса для нескольких порогов вероятности
+    (все пороги вычисляются одной матрицей сравнений)
+    :param y_true: истинные значения
+    :param proba: вероятности положительного класса
+    :param thresholds: пороги вероятности
+    :return: список словарей {threshold, precision, recall, f1, accuracy}
+    """
+    positive = np.asarray(y_true) == 1
+    thresholds = np.asarray(thresholds, dtype='float64')
+    preds = np.asarray(proba)[None, :] > thresholds[:, None]
+
+    tp = (preds & positive).sum(axis=1)
+    fp = (preds & ~positive).sum(axis=1)
+    fn = (~preds & positive).sum(axis=1)
+    tn = len(positive) - tp - fp - fn
+
+    def ratio(numerator, denominator):
+        return np.divide(numerator, denominator, out=np.zeros(len(thresholds)), where=denominator > 0)
+
+    precision = ratio(tp, tp + fp)
+    recall = ratio(tp, tp + fn)
+    f1 = ratio(2 * tp, 2 * tp + fp + fn)
+    accuracy = ratio(tp + tn, np.full(len(thresholds), len(positive)))
+
+    return [{"threshold": round(float(threshold), 6), "precision": float(p), "recall": float(r),
+             "f1": float(f), "accuracy": float(a)}
+            for threshold, p, r, f, a in zip(thresholds, precision, recall, f1, accuracy)]
+
+
+def get_thresholds(step=0.05):
+    """
+    Пороги вероятности для перебора
+    :param step: шаг порога
+    """
+    return np.round(np.arange(step, 1, step), 6)
+
 
 if __name__ == "__main__":
     stage_name = Path(sys.argv[0]).stem
 
     if len(sys.argv) != 5:
         sys.stderr.write("Arguments error. Usage:\n")
-        sys.stderr.write(f"\tpython3 bank_id {stage_name}.py data-file  model json-file\n")
+        sys.stderr.write(f"\tpython3 bank_id {stage_name}.py rows-file  train-method json-file\n")
         sys.exit(1)
 
-    # Название файла загружаемого датасета
+    # Название файла номеров строк тестовой выборки
     f_input = sys.argv[2]
-    f_model = sys.argv[3]
+    train_method = sys.argv[3]
     f_evaluate = sys.argv[4]
     bank_id = sys.argv[1]
 
@@ -39,25 +125,22 @@ if __name__ == "__main__":
 
     # %% Задание путей для файлов
     filename_input = os.path.join(project_path, f_input)
-    filename_model = os.path.join(model_dir, f_model)
     filename_evaluate = os.path.join(evaluate_dir, f_evaluate)
 
-    # %% Чтение файла данных
-    test_data = pd.read_csv(filename_input, sep=';')
-    with open(filename_model, "rb") as fd:
-        clf = pickle.load(fd)
+    # %% Чтение данных: строки тестовой выборки выбираются из хранилища признаков банка
+    test_data = FeatureStore.from_rows_file(get_store_dir(project_path, bank_id), filename_input).to_frame()
+    clf = load_model(model_dir, train_method, bank_id)
 
     # Подготовка датасета
     x_test = test_data.drop('Y', axis=1)
     y_test = test_data['Y']
 
-    clf.set_params(device="cpu")
-    score = clf.score(x_test, y_test)
-    preds = clf.predict(x_test)
+    proba = predict_positive(clf, x_test)
+    preds = (proba > DEFAULT_THRESHOLD).astype('int64')
     f1 = classification_report(y_test, preds, target_names=['negative', 'positive'], zero_division=True)
     print(f1)
-    f1_micro = f1_score(y_test, preds, average="micro")
-    print("f1_micro=", f1_micro)
+    metrics = get_metrics(y_test, proba)
+    print("f1_micro=", metrics["micro_f1"])
 
     with open(filename_evaluate, "w") as fd:
-        json.dump({"micro_f1": f1_micro}, fd)
+        json.dump(metrics, fd)
@@ -0,0 +1,192 @@
+#! python
+# -*- coding: UTF-8 -*-
+"""
+Оценка моделей всех банков (и нескольких методов обучения) за один запуск.
+Предсказания выполняются параллельно в пуле процессов, по одному проходу на модель.
+Вероятности положительного класса кэшируются на диске вместе с отпечатком файлов модели и тестовой выборки:
+пока файлы не изменились, метрики пересчитываются по кэшу без повторного предсказания
+
+Пример запуска (методы по умолчанию - из блока evaluate_all или general.train_method):
+    python -m scripts.model_scripts.evaluate_all
+    python -m scripts.model_scripts.evaluate_all xgbclassifier logisticregression
+"""
+import os
+import sys
+import json
+import time
+import yaml
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from threadpoolctl import threadpool_limits
+
+from scripts.data_scripts.feature_prepare import BANK_IDS
+from scripts.data_scripts.feature_store import FeatureStore, get_store_dir, get_rows_filename
+from scripts.data_scripts.feature_store import FEATURES_FILENAME, TARGET_FILENAME, MANIFEST_FILENAME
+from scripts.model_scripts.model_store import load_model, get_model_files
+from scripts.model_scripts.train_all import get_core_budget
+from scripts.model_scripts.evaluate import predict_positive, get_metrics, get_threshold_sweep, get_thresholds
+
+
+def get_cache_paths(cache_dir, method, bank_id):
+    """
+    Файлы кэша вероятностей модели
+    :param cache_dir: каталог кэша
+    :param method: метод обучения
+    :param bank_id: идентификатор банка
+    :return: путь к файлу вероятностей и путь к файлу отпечатка
+    """
+    name = f"proba_{method}_{bank_id}"
+    return os.path.join(cache_dir, f"{name}.npy"), os.path.join(cache_dir, f"{name}.json")
+
+
+def get_fingerprint(project_path, method, bank_id):
+    """
+    Отпечаток файлов модели и тестовой выборки (размер и время изменения)
+    :param project_path: каталог проекта
+    :param method: метод обучения
+    :param bank_id: идентификатор банка
+    :return: словарь {путь: [размер, время изменения]}
+    """
+    store_dir = get_store_dir(project_path, bank_id)
+    paths = get_model_files(os.path.join(project_path, "models"), method, bank_id) + [
+        get_rows_filename(project_path, bank_id, "test"),
+        os.path.join(store_dir, FEATURES_FILENAME),
+        os.path.join(store_dir, TARGET_FILENAME),
+        os.path.join(store_dir, MANIFEST_FILENAME),
+    ]
+
+    fingerprint = {}
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            fingerprint[os.path.relpath(path, project_path)] = [stat.st_size, stat.st_mtime_ns]
+
+    return fingerprint
+
+
+def is_cache_valid(cache_dir, method, bank_id, fingerprint):
+    """
+    Проверка кэша вероятностей: файлы модели и тестовой выборки не изменились
+    :param cache_dir: каталог кэша
+    :param method: метод обучения
+    :param bank_id: идентификатор банка
+    :param fingerprint: текущий отпечаток файлов
+    """
+    proba_filename, fingerprint_filename = get_cache_paths(cache_dir, method, bank_id)
+    if not os.path.exists(proba_filename) or not os.path.exists(fingerprint_filename):
+        return False
+
+    with open(fingerprint_filename, encoding="utf-8") as fd:
+        return json.load(fd) == fingerprint
+
+
+def run_job(bank_id, method, threads, project_path, cache_dir):
+    """
+    Вероятности положительного класса модели банка на тестовой выборке (из кэша или одним проходом предсказания)
+    :param bank_id: идентификатор банка
+    :param method: метод обучения
+    :param threads: количество потоков задания
+    :param project_path: каталог проекта
+    :param cache_dir: каталог кэша
+    :return: словарь с отчетом о задании
+    """
+    fingerprint = get_fingerprint(project_path, method, bank_id)
+    start = time.perf_counter()
+    cached = is_cache_valid(cache_dir, method, bank_id, fingerprint)
+
+    if not cached:
+        test_store = FeatureStore.from_rows_file(get_store_dir(project_path, bank_id),
+                                                 get_rows_filename(project_path, bank_id, "test"))
+        model = load_model(os.path.join(project_path, "models"), method, bank_id, nthread=threads)
+        with threadpool_limits(threads):
+            proba = predict_positive(model, test_store.to_frame().drop('Y', axis=1))
+
+        proba_filename, fingerprint_filename = get_cache_paths(cache_dir, method, bank_id)
+        np.save(proba_filename, proba)
+        with open(fingerprint_filename, "w", encoding="utf-8") as fd:
+            json.dump(fingerprint, fd, ensure_ascii=False)
+
+    return {
+        'bank_id': bank_id,
+        'method': method,
+        'threads': threads,
+        'cached': cached,
+        'wall_time': round(time.perf_counter() - start, 3),
+    }
+
+
+def evaluate_all(methods, bank_ids, project_path, cache_dir, cores=0, max_jobs=0, threshold_step=0.05):
+    """
+    Оценка моделей банков: предсказания в пуле процессов, метрики - по кэшированным вероятностям
+    :param methods: методы обучения
+    :param bank_ids: идентификаторы банков
+    :param project_path: каталог проекта
+    :param cache_dir: каталог кэша вероятностей
+    :param cores: общий бюджет ядер (0 - все ядра)
+    :param max_jobs: максимальное количество одновременных заданий (0 - по бюджету ядер)
+    :param threshold_step: шаг перебора порога вероятности
+    :return: отчет о запуске с метриками моделей
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    jobs = [(bank_id, method) for method in methods for bank_id in bank_ids]
+    workers, threads = get_core_budget(len(jobs), cores, max_jobs)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_job, bank_id, method, threads, project_path, cache_dir)
+                   for bank_id, method in jobs]
+        reports = [future.result() for future in futures]
+
+    # Метрики вычисляются по кэшу (без повторного предсказания)
+    thresholds = get_thresholds(threshold_step)
+    for report in reports:
+        bank_id, method = report['bank_id'], report['method']
+        y_true = FeatureStore.from_rows_file(get_store_dir(project_path, bank_id),
+                                             get_rows_filename(project_path, bank_id, "test")).get_target()
+        proba = np.load(get_cache_paths(cache_dir, method, bank_id)[0])
+        report['metrics'] = get_metrics(y_true, proba)
+        report['thresholds'] = get_threshold_sweep(y_true, proba, thresholds)
+        roc_auc = report['metrics']['roc_auc']
+        print(f"{method} {bank_id}: f1_micro - {report['metrics']['micro_f1']:.4f}, "
+              f"roc_auc - {'-' if roc_auc is None else f'{roc_auc:.4f}'}, "
+              f"{'кэш' if report['cached'] else 'предсказание'}")
+
+    return {
+        'cores': workers * threads,
+        'workers': workers,
+        'threads': threads,
+        'wall_time': round(time.perf_counter() - start, 3),
+        'jobs': reports,
+    }
+
+
+if __name__ == "__main__":
+    stage_name = "evaluate_all"
+
+    # %% Задание каталогов
+    project_path = os.getcwd()
+    evaluate_dir = os.path.join(project_path, "evaluate")
+    cache_dir = os.path.join(evaluate_dir, "cache")
+    os.makedirs(evaluate_dir, exist_ok=True)
+
+    # %% Загрузка параметров расчета
+    params = yaml.safe_load(open(os.path.join(project_path, "params.yaml")))
+    evaluate_all_params = params.get("evaluate_all", {})
+
+    methods = sys.argv[1:] or evaluate_all_params.get("methods") or [params["general"]["train_method"]]
+    bank_ids = evaluate_all_params.get("banks") or BANK_IDS
+
+    report = evaluate_all(methods, bank_ids, project_path, cache_dir,
+                          cores=evaluate_all_params.get("cores", 0),
+                          max_jobs=evaluate_all_params.get("jobs", 0),
+                          threshold_step=evaluate_all_params.get("threshold_step", 0.05))
+    print(f"Моделей - {len(report['jobs'])}, из кэша - {sum(job['cached'] for job in report['jobs'])}, "
+          f"время - {report['wall_time']:.1f} с")
+
+    # %% Сохранение отчета и сводной таблицы метрик
+    with open(os.path.join(evaluate_dir, f"{stage_name}.json"), "w") as fd:
+        json.dump(report, fd, indent=2)
+    summary = pd.DataFrame([{'method': job['method'], 'bank_id': job['bank_id'], **job['metrics']}
+                            for job in report['jobs']])
+    summary.to_csv(os.path.join(evaluate_dir, f"{stage_name}.csv"), index=False, sep=';')
@@ -0,0 +1,99 @@
+#! python
+# -*- coding: UTF-8 -*-
+"""
+Предсказания всех банков по одной общей матрице признаков.
+Матрица строится один раз для группы банков с одинаковыми параметрами стандартизации,
+признаки модели каждого банка выбираются из нее по заранее вычисленным индексам
+"""
+import numpy as np
+
+import scripts.data_scripts.feature_prepare as fp
+from scripts.model_scripts.feature_layout import FeatureLayout, get_superset_columns
+
+
+class ScalerGroup:
+    """
+    Банки с одинаковыми параметрами стандартизации
+    """
+
+    def __init__(self, scaler, columns):
+        """
+        :param scaler: параметры стандартизации (ScalerParams или обученный StandardScaler)
+        :param columns: признаки общей матрицы
+        """
+        self.scaler = scaler
+        self.layout = FeatureLayout(columns, scaler)
+        self.bank_ids = []
+
+
+class FanOutScorer:
+    """
+    Предсказания всех банков по общей матрице признаков
+    """
+
+    def __init__(self, banks):
+        """
+        :param banks: словарь {идентификатор банка: BankArtifacts}
+        """
+        self.banks = banks
+        self.columns = get_superset_columns()
+        positions = {column: i for i, column in enumerate(self.columns)}
+
+        # Индексы признаков модели банка в общей матрице
+        self.indices = {bank_id: np.array([positions[name] for name in bank_artifacts.feature_names])
+                        for bank_id, bank_artifacts in banks.items()}
+
+        # Группы банков с одинаковыми параметрами стандартизации
+        self.groups = {}
+        for bank_id, bank_artifacts in banks.items():
+            key = scaler_key(bank_artifacts.scaler)
+            if key not in self.groups:
+                self.groups[key] = ScalerGroup(bank_artifacts.scaler, self.columns)
+            self.groups[key].bank_ids.append(bank_id)
+
+    def predict_dataset(self, dataset):
+        """
+        Предсказания всех банков для предобработанного датасета анкет
+        :param dataset: датасет после create_features (без целевых признаков)
+        :return: словарь {идентификатор банка: массив предсказаний}
+        """
+        predictions = {}
+        for group in self.groups.values():
+            matrix = fp.feature_prepare_common(dataset, group.scaler, fp.NUM_COLUMNS)
+            matrix = matrix[self.columns].to_numpy(dtype='float32')
+            predictions.update(self._predict_group(group, matrix))
+
+        return predictions
+
+    def predict_record(self, record_features):
+        """
+        Предсказания всех банков для одной анкеты
+        :param record_features: признаки анкеты (RecordFeatures)
+        :return: словарь {идентификатор банка: массив с предсказанием}
+        """
+        predictions = {}
+        for group in self.groups.values():
+            row = group.layout.fill(record_features)
+            predictions.update(self._predict_group(group, row.reshape(1, -1)))
+
+        return predictions
+
+    def _predict_group(self, group, matrix):
+        """
+        Предсказания банков группы по общей матрице признаков
+        :param group: группа банков
+        :param matrix: общая матрица признаков
+        """
+        return {bank_id: self.banks[bank_id].model.predict(matrix[:, self.indices[bank_id]])
+                for bank_id in group.bank_ids}
+
+
+def scaler_key(scaler):
+    """
+    Ключ для сравнения параметров стандартизации
+    :param scaler: параметры стандартизации (ScalerParams или обученный StandardScaler)
+    """
+    mean = getattr(scaler, 'mean_', getattr(scaler, 'mean', None))
+    scale = getattr(scaler, 'scale_', getattr(scaler, 'scale', None))
+
+    return tuple(np.asarray(mean, dtype='float64').tolist()), tuple(np.asarray(scale, dtype='float64').tolist())
@@ -0,0 +1,194 @@
+#! python
+# -*- coding: UTF-8 -*-
+"""
+Построение вектора признаков одной анкеты без датафрейма.
+Выполняет предобработку fill_na -> data_prepare -> fix_errors -> create_features -> feature_prepare
+для одной записи построчными функциями этапов и заполняет строку float32 в порядке признаков модели банка
+"""
+import numpy as np
+import pandas as pd
+
+import scripts.data_scripts.create_features as cf
+import scripts.data_scripts.feature_prepare as fp
+from scripts.data_scripts.data_prepare import INT_COLUMNS
+from scripts.data_scripts.fill_na import CONSTANT_FILL_VALUES
+from scripts.data_scripts.fix_errors import fix_seniority, fix_expense
+from scripts.data_scripts.utils.dates import years_between, get_as_of_date
+from scripts.data_scripts.utils.seniority_cats import set_last_seniority, months_seniority_to_new_cat
+
+# Числовые и бинарные признаки, которые передаются в модель без стандартизации
+SCALAR_FEATURES = ['Пол', 'СНИЛС', 'Merch_code', 'Имеет_доход', 'Кредит_возможен', 'Возраст']
+
+
+class RecordFeatures:
+    """
+    Признаки одной анкеты, общие для всех банков:
+    значения числовых признаков и коды категорий кодировщиков
+    """
+    __slots__ = ('scalars', 'numbers', 'codes')
+
+    def __init__(self, scalars, numbers, codes):
+        """
+        :param scalars: значения признаков SCALAR_FEATURES
+        :param numbers: значения стандартизуемых признаков в порядке NUM_COLUMNS
+        :param codes: коды категорий в порядке CATEGORY_ENCODERS
+        """
+        self.scalars = scalars
+        self.numbers = numbers
+        self.codes = codes
+
+
+class FeatureLayout:
+    """
+    Скомпилированная раскладка признаков модели банка:
+    позиции признаков в строке в порядке feature_names модели
+    """
+
+    def __init__(self, feature_names, scaler, order=None):
+        """
+        :param feature_names: признаки модели банка (feature_names бустера)
+        :param scaler: параметры стандартизации (ScalerParams или обученный StandardScaler)
+        :param order: степень полинома (по умолчанию - POLYNOM_ORDER)
+        """
+        self.feature_names = list(feature_names)
+        self.order = order or fp.POLYNOM_ORDER
+        positions = {name: i for i, name in enumerate(self.feature_names)}
+
+        known = set(get_superset_columns(self.order))
+        unknown = [name for name in self.feature_names if name not in known]
+        if unknown:
+            raise ValueError(f"Model features are not produced by preprocessing: {unknown}")
+
+        self._scalars = np.array([positions.get(name, -1) for name in SCALAR_FEATURES])
+        # Позиции one-hot признаков по кодам категорий, последний элемент - для кода -1
+        self._one_hot = [np.array([positions.get(column, -1) for column in encoder.columns] + [-1])
+                         for encoder in cf.CATEGORY_ENCODERS]
+        self._polynom = np.array([positions.get(column, -1)
+                                  for column in fp.get_polynom_columns(fp.NUM_COLUMNS, self.order)])
+
+        self._mean = np.asarray(getattr(scaler, 'mean_', getattr(scaler, 'mean', None)), dtype='float64')
+        self._scale = np.asarray(getattr(scaler, 'scale_', getattr(scaler, 'scale', None)), dtype='float64')
+
+    def __len__(self):
+        return len(self.feature_names)
+
+    def fill(self, record_features, out=None):
+        """
+        Заполнение строки признаков модели
+        :param record_features: признаки анкеты (RecordFeatures)
+        :param out: предварительно выделенная строка float32 (по умолчанию создается новая)
+        :return: строка признаков
+        """
+        if out is None:
+            out = np.zeros(len(self.feature_names), dtype='float32')
+        else:
+            out[:] = 0
+
+        for position, value in zip(self._scalars, record_features.scalars):
+            if position >= 0:
+                out[position] = value
+
+        for positions, code in zip(self._one_hot, record_features.codes):
+            position = positions[code]
+            if position >= 0:
+                out[position] = 1
+
+        scaled = (np.asarray(record_features.numbers, dtype='float64') - self._mean) / self._scale
+        polynom = np.concatenate([np.power(scaled, o) for o in range(1, self.order + 1)])
+        present = self._polynom >= 0
+        out[self._polynom[present]] = polynom[present]
+
+        return out
+
+
+def get_superset_columns(order=None):
+    """
+    Все признаки, которые может использовать модель банка
+    :param order: степень полинома (по умолчанию - POLYNOM_ORDER)
+    """
+    columns = list(SCALAR_FEATURES)
+    for encoder in cf.CATEGORY_ENCODERS:
+        columns.extend(encoder.columns)
+    columns.extend(fp.get_polynom_columns(fp.NUM_COLUMNS, order))
+
+    return columns
+
+
+def build_record_features(record, fill_values=None, as_of=None):
+    """
+    Вычисление признаков одной анкеты.
+    Исправление ошибок выполняется построчными функциями fix_errors (fix_seniority, fix_expense),
+    даты - функциями utils.dates, категории стажа - функциями utils.seniority_cats
+    :param record: словарь с данными анкеты во внутреннем формате
+    :param fill_values: значения для заполнения пропусков (по умолчанию - только постоянные значения)
+    :param as_of: расчетная дата (по умолчанию - расчетная дата запуска)
+    :return: объект RecordFeatures
+    """
+    if as_of is None:
+        as_of = get_as_of_date()
+    as_of = pd.Timestamp(as_of)
+
+    # fill_na: заполнение пропусков
+    record = dict(record)
+    for column, value in (fill_values or CONSTANT_FILL_VALUES).items():
+        if is_missing(record.get(column)):
+            record[column] = value
+
+    # data_prepare: приведение типов
+    record['BirthDate'] = to_timestamp(record['BirthDate'])
+    record['JobStartDate'] = to_timestamp(record['JobStartDate'])
+    gender = 1 if record['Gender'] > 0 else 0
+    for column in INT_COLUMNS:
+        record[column] = int(record[column])
+
+    # fix_errors: исправление стажа работы и расхода
+    record = fix_seniority(record, as_of)
+    record = fix_expense(record)
+    month_expense = record['MonthExpense']
+
+    # create_features: новые признаки
+    has_income = int(not pd.isna(record['JobStartDate']) and record['employment status'] != "Не работаю")
+    with np.errstate(divide='ignore', invalid='ignore'):
+        credit_load = float(np.float64(record['MonthProfit'] - month_expense)
+                            / (np.float64(record['Loan_amount']) / record['Loan_term']))
+    credit_possible = 1 if credit_load > 1.25 else 0
+    # Кредитная нагрузка хранится в датасете как float32 (схема типов)
+    credit_load = float(np.float32(credit_load))
+    age = int(years_between(record['BirthDate'], as_of))
+    last_seniority_cat = months_seniority_to_new_cat(set_last_seniority(record, as_of))
+
+    values = {
+        cf.SENIORITY_ENCODER.prefix: record['Value'],
+        cf.EDUCATION_ENCODER.prefix: record['education'],
+        cf.EMPLOYMENT_ENCODER.prefix: record['employment status'],
+        cf.FAMILY_STATUS_ENCODER.prefix: record['Family status'],
+        cf.LOAN_TERM_ENCODER.prefix: record['Loan_term'],
+        cf.GOODS_CATEGORY_ENCODER.prefix: record['Goods_category'],
+        cf.MERCH_CODE_ENCODER.prefix: record['Merch_code'],
+        cf.LAST_SENIORITY_ENCODER.prefix: last_seniority_cat,
+        cf.CHILDCOUNT_ENCODER.prefix: record['ChildCount'],
+    }
+    codes = [encoder.encode_value(values[encoder.prefix]) for encoder in cf.CATEGORY_ENCODERS]
+
+    # feature_prepare: масштабирование возраста
+    scalars = [gender, record['SNILS'], record['Merch_code'], has_income, credit_possible, age / 100]
+    numbers = [record['MonthProfit'], month_expense, record['Loan_amount'], credit_load]
+
+    return RecordFeatures(scalars=scalars, numbers=numbers, codes=codes)
+
+
+def is_missing(value):
+    """
+    Проверка на пустое значение (None, NaN, NaT)
+    :param value: значение
+    """
+    return value is None or value != value
+
+
+def to_timestamp(value):
+    """
+    Приведение даты анкеты к Timestamp (как pandas.to_datetime в data_prepare)
+    :param value: дата (строка, date, datetime, Timestamp) или пустое значение
+    :return: объект Timestamp или NaT
+    """
+    return pd.NaT if is_missing(value) else pd.Timestamp(value)
@@ -4,6 +4,7 @@ from sklearn.linear_model import LogisticRegression
 from pathlib import Path
 from dataclasses import dataclass
 
+from scripts.data_scripts.data_methods import densify
 from .train import *
 
 
@@ -13,27 +14,38 @@ class LogRegParams:
     Параметры алгоритма обучения модели
     """
     max_iter: int = 0
+    # Допустимое изменение функции потерь для остановки оптимизации
+    tol: float = 1e-4
 
 
-def train_model(dataset: pd.DataFrame, train_params: LogRegParams):
+def train_model(dataset: pd.DataFrame, train_params: LogRegParams, validation: pd.DataFrame = None):
     """
-    Обучение модели с помощью алгоритма логистической регрессии
+    Обучение модели с помощью алгоритма логистической регрессии.
+    Оптимизация останавливается по допуску tol, F1 на валидационной выборке
+    вычисляется для итоговой модели
 
     :param dataset: Исходный датасет
     :param train_params: Параметры обучения модели
-    :return: Обученная модель
+    :param validation: Валидационная выборка
+    :return: Обученная модель и история обучения
     """
 
     # Подготовка датасета
-    x_train = dataset.drop('Y', axis=1)
+    x_train = densify(dataset.drop('Y', axis=1))
     y_train = dataset['Y']
 
     model = LogisticRegression(
-        max_iter=train_params.max_iter
+        max_iter=train_params.max_iter,
+        tol=train_params.tol
     )
     model.fit(x_train, y_train)
 
-    return model
+    history = TrainHistory()
+    if validation is not None:
+        history.add(int(model.n_iter_[0]) - 1,
+                    validation_f1(validation['Y'], model.predict(densify(validation.drop('Y', axis=1)))))
+
+    return model, history
 
 
 def get_train_params(params_yaml):
@@ -43,7 +55,8 @@ def get_train_params(params_yaml):
     :return: Объект LogRegParams с параметрами модели
     """
     return LogRegParams(
-        max_iter=params_yaml["log_reg"]["max_iter"]
+        max_iter=params_yaml["log_reg"]["max_iter"],
+        tol=params_yaml["log_reg"].get("tol", LogRegParams.tol)
     )
 
 
@@ -0,0 +1,243 @@
+#! python
+# -*- coding: UTF-8 -*-
+"""
+Реестр загруженных в память моделей, статистик предобработки и параметров стандартизации банков
+"""
+import os
+import sys
+import threading
+import joblib
+import yaml
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+
+from scripts.data_scripts.feature_prepare import BANK_IDS, NUM_COLUMNS
+from scripts.data_scripts.preprocessing_artifact import load_artifact, ARTIFACT_FILENAME
+from scripts.model_scripts.feature_layout import FeatureLayout
+from scripts.model_scripts.fan_out import FanOutScorer
+from scripts.model_scripts.model_store import load_model, get_model_files, get_feature_names
+
+
+@dataclass(frozen=True)
+class BankArtifacts:
+    """
+    Модель, параметры стандартизации и раскладка признаков одного банка
+    """
+    bank_id: str
+    scaler: object
+    model: object
+    feature_names: list
+    layout: FeatureLayout
+
+
+@dataclass(frozen=True)
+class RegistrySnapshot:
+    """
+    Версия артефактов всех банков и статистик предобработки
+    """
+    preprocessing: object
+    banks: dict
+    scorer: FanOutScorer
+
+
+class ModelRegistry:
+    """
+    Загружает модели, статистики предобработки и параметры стандартизации всех банков
+    один раз, проверяет и прогревает их.
+    Если файла статистик предобработки нет, используются объекты стандартизации из scaler_*.pkl.
+    Фоновый поток отслеживает изменения файлов в каталоге моделей, загружает новую версию
+    и атомарно заменяет ею текущую. Если новая версия не прошла проверку, используется прежняя
+    """
+
+    def __init__(self, model_dir, train_method, bank_ids=None):
+        """
+        :param model_dir: каталог с моделями
+        :param train_method: метод обучения (часть названия файла модели)
+        :param bank_ids: идентификаторы банков (по умолчанию - все банки)
+        """
+        self.model_dir = model_dir
+        self.train_method = train_method
+        self.bank_ids = list(bank_ids or BANK_IDS)
+
+        self._artifacts = None
+        self._signature = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def artifact_paths(self, bank_id):
+        """
+        Пути к файлам объекта стандартизации и модели банка
+        :param bank_id: идентификатор банка
+        """
+        return [os.path.join(self.model_dir, f'scaler_{bank_id}.pkl')] + \
+            get_model_files(self.model_dir, self.train_method, bank_id)
+
+    @property
+    def preprocessing_path(self):
+        """
+        Путь к файлу статистик предобработки
+        """
+        return os.path.join(self.model_dir, ARTIFACT_FILENAME)
+
+    def snapshot(self):
+        """
+        Текущая версия артефактов: объект RegistrySnapshot.
+        Объект не изменяется после загрузки, поэтому его можно использовать без блокировок
+        """
+        if self._artifacts is None:
+            self.load()
+        return self._artifacts
+
+    def get(self, bank_id):
+        """
+        Артефакты банка из текущей версии
+        :param bank_id: идентификатор банка
+        """
+        return self.snapshot().banks[bank_id]
+
+    def load(self):
+        """
+        Загрузка, проверка и прогрев артефактов всех банков с заменой текущей версии
+        :return: True, если версия заменена
+        """
+        with self._lock:
+            signature = self._get_signature()
+            if self._artifacts is not None and signature == self._signature:
+                return False
+
+            preprocessing = None
+            if os.path.exists(self.preprocessing_path):
+                preprocessing = load_artifact(self.preprocessing_path)
+                preprocessing.check_vocabularies()
+
+            banks = {bank_id: self._load_bank(bank_id, preprocessing) for bank_id in self.bank_ids}
+            for bank_artifacts in banks.values():
+                warm_up(bank_artifacts)
+            artifacts = RegistrySnapshot(preprocessing=preprocessing, banks=banks, scorer=FanOutScorer(banks))
+
+            # Замена ссылки атомарна: предсказания используют либо прежнюю, либо новую версию целиком
+            self._artifacts = artifacts
+            self._signature = signature
+
+        return True
+
+    def refresh(self):
+        """
+        Загрузка новой версии артефактов, если файлы изменились.
+        Ошибки загрузки не прерывают работу с текущей версией
+        :return: True, если версия заменена
+        """
+        try:
+            return self.load()
+        except Exception as error:
+            sys.stderr.write(f"Model registry: new artifacts are rejected: {error}\n")
+            return False
+
+    def start_watching(self, interval):
+        """
+        Запуск фонового потока, проверяющего изменения файлов в каталоге моделей
+        :param interval: период проверки в секундах
+        """
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop.wait(interval):
+                self.refresh()
+
+        self._stop.clear()
+        self._watcher = threading.Thread(target=watch, name="model-registry-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        """
+        Остановка фонового потока
+        """
+        if self._watcher is None:
+            return
+        self._stop.set()
+        self._watcher.join()
+        self._watcher = None
+
+    def _get_signature(self):
+        """
+        Время изменения и размеры файлов артефактов (None для отсутствующих файлов)
+        """
+        paths = [self.preprocessing_path]
+        for bank_id in self.bank_ids:
+            paths.extend(self.artifact_paths(bank_id))
+
+        signature = []
+        for path in paths:
+            stat = os.stat(path) if os.path.exists(path) else None
+            signature.append((path, stat and stat.st_mtime_ns, stat and stat.st_size))
+        return tuple(signature)
+
+    def _load_bank(self, bank_id, preprocessing=None):
+        """
+        Загрузка и проверка артефактов банка
+        :param bank_id: идентификатор банка
+        :param preprocessing: статистики предобработки (если есть)
+        """
+        scaler_filename = self.artifact_paths(bank_id)[0]
+        if preprocessing is not None:
+            if bank_id not in preprocessing.scalers:
+                raise ValueError(f"Preprocessing artifact has no scaler parameters for bank {bank_id}")
+            scaler = preprocessing.scalers[bank_id]
+            scaler_columns = scaler.columns
+        else:
+            scaler = joblib.load(scaler_filename)
+            scaler_columns = list(getattr(scaler, 'feature_names_in_', NUM_COLUMNS))
+
+        model = load_model(self.model_dir, self.train_method, bank_id)
+
+        if scaler_columns != NUM_COLUMNS:
+            raise ValueError(f"Scaler for bank {bank_id} is fitted on {scaler_columns}, expected {NUM_COLUMNS}")
+
+        feature_names = get_feature_names(model, self.model_dir, self.train_method, bank_id)
+        if not feature_names:
+            raise ValueError(f"Model for bank {bank_id} has no feature names")
+
+        return BankArtifacts(bank_id=bank_id, scaler=scaler, model=model, feature_names=list(feature_names),
+                             layout=FeatureLayout(feature_names, scaler))
+
+
+def warm_up(bank_artifacts):
+    """
+    Пробное предсказание, чтобы первый запрос не тратил время на инициализацию модели
+    :param bank_artifacts: артефакты банка
+    """
+    bank_artifacts.scaler.transform(pd.DataFrame(np.zeros((1, len(NUM_COLUMNS))), columns=NUM_COLUMNS))
+    sample = pd.DataFrame(np.zeros((1, len(bank_artifacts.feature_names))), columns=bank_artifacts.feature_names)
+    bank_artifacts.model.predict(sample)
+    bank_artifacts.model.predict(np.zeros((1, len(bank_artifacts.layout)), dtype='float32'))
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry(project_path=None):
+    """
+    Общий для процесса реестр моделей. Создается при первом обращении по параметрам params.yaml
+    :param project_path: каталог проекта (по умолчанию - текущий каталог)
+    """
+    global _registry
+
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                project_path = project_path or os.getcwd()
+                params = yaml.safe_load(open(os.path.join(project_path, "params.yaml")))
+                registry = ModelRegistry(os.path.join(project_path, "models"),
+                                         params["general"]["train_method"])
+                registry.load()
+
+                reload_interval = params.get("serve", {}).get("reload_interval", 0)
+                if reload_interval > 0:
+                    registry.start_watching(reload_interval)
+                _registry = registry
+
+    return _registry
@@ -0,0 +1,224 @@
+#! python
+# -*- coding: UTF-8 -*-
+"""
+Сохранение и загрузка моделей.
+Модели XGBoost сохраняются в собственном бинарном формате XGBoost (UBJ),
+остальные модели - в формате pickle. Рядом с моделью сохраняется
+файл описания (manifest.json) с признаками модели, банком и методом обучения
+"""
+import os
+import json
+import pickle
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from scripts.data_scripts.data_methods import densify
+
+# Версия формата файла описания модели
+MANIFEST_VERSION = 1
+
+# Имена файлов в каталоге модели
+MANIFEST_FILENAME = "manifest.json"
+BOOSTER_FILENAME = "model.ubj"
+PICKLE_FILENAME = "model.pkl"
+
+
+class BoosterModel:
+    """
+    Модель XGBoost только для предсказаний (без обертки scikit-learn).
+    Использует предсказание без создания DMatrix (inplace_predict)
+    """
+
+    def __init__(self, booster, feature_names, threshold=0.5, iteration_range=None):
+        """
+        :param booster: обученный объект xgboost.Booster
+        :param feature_names: признаки модели
+        :param threshold: порог вероятности положительного класса
+        :param iteration_range: диапазон деревьев для предсказания (по умолчанию - все деревья)
+        """
+        self.booster = booster
+        self.feature_names = list(feature_names)
+        self.threshold = threshold
+        self.iteration_range = tuple(iteration_range or (0, 0))
+
+    def predict_proba(self, x):
+        """
+        Вероятности классов (как XGBClassifier.predict_proba)
+        :param x: матрица признаков (numpy или DataFrame) в порядке feature_names
+        """
+        positive = self.predict_positive(x)
+        return np.column_stack([1 - positive, positive])
+
+    def predict_positive(self, x):
+        """
+        Вероятность положительного класса
+        :param x: матрица признаков (numpy или DataFrame) в порядке feature_names
+        """
+        if isinstance(x, pd.DataFrame):
+            x = densify(x)
+        return self.booster.inplace_predict(x, iteration_range=self.iteration_range)
+
+    def predict(self, x):
+        """
+        Предсказанные классы (как XGBClassifier.predict)
+        :param x: матрица признаков (numpy или DataFrame) в порядке feature_names
+        """
+        return (self.predict_positive(x) > self.threshold).astype('int64')
+
+
+def get_model_dir(model_dir, method, bank_id):
+    """
+    Каталог модели
+    :param model_dir: каталог моделей
+    :param method: метод обучения
+    :param bank_id: идентификатор банка
+    """
+    return os.path.join(model_dir, f"model_{method}_{bank_id}")
+
+
+def get_legacy_model_path(model_dir, method, bank_id):
+    """
+    Путь к модели в прежнем формате (pickle-файл обертки scikit-learn)
+    :param model_dir: каталог моделей
+    :param method: метод обучения
+    :param bank_id: идентификатор банка
+    """
+    return os.path.join(model_dir, f"model_{method}_{bank_id}.pkl")
+
+
+def get_model_files(model_dir, method, bank_id):
+    """
+    Все возможные файлы модели (для отслеживания изменений)
+    :param model_dir: каталог моделей
+    :param method: метод обучения
+    :param bank_id: идентификатор банка
+    """
+    path = get_model_dir(model_dir, method, bank_id)
+    return [os.path.join(path, MANIFEST_FILENAME), os.path.join(path, BOOSTER_FILENAME),
+            os.path.join(path, PICKLE_FILENAME), get_legacy_model_path(model_dir, method, bank_id)]
+
+
+def save_model(model, model_dir, method, bank_id, **manifest_fields):
+    """
+    Сохранение модели и файла описания
+    :param model: обученная модель
+    :param model_dir: каталог моделей
+    :param method: метод обучения
+    :param bank_id: идентификатор банка
+    :param manifest_fields: дополнительные сведения для файла описания
+    :return: каталог модели
+    """
+    path = get_model_dir(model_dir, method, bank_id)
+    os.makedirs(path, exist_ok=True)
+
+    if isinstance(model, xgb.Booster) or hasattr(model, "get_booster"):
+        booster = model if isinstance(model, xgb.Booster) else model.get_booster()
+        booster.save_model(os.path.join(path, BOOSTER_FILENAME))
+        model_format, filename = "ubj", BOOSTER_FILENAME
+        feature_names = booster.feature_names
+    else:
+        with open(os.path.join(path, PICKLE_FILENAME), "wb") as fd:
+            pickle.dump(model, fd)
+        model_format, filename = "pickle", PICKLE_FILENAME
+        feature_names = getattr(model, "feature_names_in_", None)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "bank_id": bank_id,
+        "method": method,
+        "format": model_format,
+        "filename": filename,
+        "feature_names": list(feature_names) if feature_names is not None else None,
+        **manifest_fields,
+    }
+    with open(os.path.join(path, MANIFEST_FILENAME), "w", encoding="utf-8") as fd:
+        json.dump(manifest, fd, ensure_ascii=False, indent=2)
+
+    return path
+
+
+def load_manifest(path):
+    """
+    Загрузка файла описания модели с проверкой версии
+    :param path: каталог модели
+    """
+    with open(os.path.join(path, MANIFEST_FILENAME), encoding="utf-8") as fd:
+        manifest = json.load(fd)
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported model manifest version {manifest.get('version')} in {path}")
+
+    return manifest
+
+
+def load_model(model_dir, method, bank_id, nthread=None):
+    """
+    Загрузка модели для предсказаний. Модели XGBoost загружаются как BoosterModel.
+    Если модели в каталоге нет, загружается pickle-файл в прежнем формате
+    :param model_dir: каталог моделей
+    :param method: метод обучения
+    :param bank_id: идентификатор банка
+    :param nthread: количество потоков для предсказаний XGBoost (по умолчанию - все ядра)
+    """
+    path = get_model_dir(model_dir, method, bank_id)
+
+    if not os.path.exists(os.path.join(path, MANIFEST_FILENAME)):
+        with open(get_legacy_model_path(model_dir, method, bank_id), "rb") as fd:
+            model = pickle.load(fd)
+        if hasattr(model, "get_booster"):
+            booster = model.get_booster()
+            return create_booster_model(booster, booster.feature_names, nthread)
+        return model
+
+    manifest = load_manifest(path)
+    if manifest["bank_id"] != bank_id or manifest["method"] != method:
+        raise ValueError(f"Model in {path} is trained for bank {manifest['bank_id']} "
+                         f"with method {manifest['method']}")
+
+    filename = os.path.join(path, manifest["filename"])
+    if manifest["format"] == "pickle":
+        with open(filename, "rb") as fd:
+            return pickle.load(fd)
+
+    booster = xgb.Booster(model_file=filename)
+    return create_booster_model(booster, manifest["feature_names"], nthread,
+                                iteration_range=manifest.get("iteration_range"))
+
+
+def get_feature_names(model, model_dir, method, bank_id):
+    """
+    Признаки модели в порядке обучения: feature_names (BoosterModel), feature_names_in_ (модели scikit-learn,
+    обученные на датасете) или список признаков из файла описания модели
+    :param model: загруженная модель
+    :param model_dir: каталог моделей
+    :param method: метод обучения
+    :param bank_id: идентификатор банка
+    :return: список признаков или None, если признаки неизвестны
+    """
+    feature_names = getattr(model, "feature_names", None)
+    if feature_names is None:
+        feature_names = getattr(model, "feature_names_in_", None)
+
+    path = get_model_dir(model_dir, method, bank_id)
+    if feature_names is None and os.path.exists(os.path.join(path, MANIFEST_FILENAME)):
+        feature_names = load_manifest(path).get("feature_names")
+
+    return list(feature_names) if feature_names is not None else None
+
+
+def create_booster_model(booster, feature_names, nthread=None, iteration_range=None):
+    """
+    Настройка бустера для предсказаний на CPU
+    :param booster: объект xgboost.Booster
+    :param feature_names: признаки модели
+    :param nthread: количество потоков (по умолчанию - все ядра)
+    :param iteration_range: диапазон деревьев для предсказания
+    """
+    params = {"device": "cpu"}
+    if nthread:
+        params["nthread"] = nthread
+    booster.set_param(params)
+    booster.feature_names = list(feature_names)
+
+    return BoosterModel(booster, feature_names, iteration_range=iteration_range)
@@ -4,11 +4,13 @@
 Обучение с помощью нейронной сети
 """
 
+import copy
 from dataclasses import dataclass
 from pathlib import Path
 from sklearn.neural_network import MLPClassifier
 from imblearn.under_sampling import NearMiss
 
+from scripts.data_scripts.data_methods import densify
 from .train import *
 
 
@@ -22,18 +24,24 @@ class MLPParams:
     verbose: bool = True
     hidden_layer_x: int = 0
     hidden_layer_y: int = 0
+    # Остановка, если F1 на валидационной выборке не улучшается больше чем на tol заданное количество эпох
+    n_iter_no_change: int = 10
+    tol: float = 1e-4
 
 
-def train_model(dataset: pd.DataFrame, mlp_params: MLPParams):
+def train_model(dataset: pd.DataFrame, mlp_params: MLPParams, validation: pd.DataFrame = None):
     """
-    Обучение модели с помощью XGBClassifier
+    Обучение модели с помощью нейронной сети.
+    При наличии валидационной выборки обучение идет по эпохам с ранней остановкой,
+    возвращается модель эпохи с лучшим F1
 
     :param dataset: Исходный датасет
     :param mlp_params: Параметры обучения модели
-    :return: Обученная модель
+    :param validation: Валидационная выборка
+    :return: Обученная модель и история обучения
     """
     # Подготовка датасета
-    x_train = dataset.drop('Y', axis=1)
+    x_train = densify(dataset.drop('Y', axis=1))
     y_train = dataset['Y']
 
     # Так как данные не сбалансированы, применяем метод балансировки
@@ -47,10 +55,28 @@ def train_model(dataset: pd.DataFrame, mlp_params: MLPParams):
         max_iter=mlp_params.max_depth,
         learning_rate_init=mlp_params.learning_rate)
 
-    # Fit the model
-    model.fit(x_train_miss, y_train_miss)
+    history = TrainHistory()
+    if validation is None:
+        # Fit the model
+        model.fit(x_train_miss, y_train_miss)
+        return model, history
 
-    return model
+    x_valid = densify(validation.drop('Y', axis=1))
+    y_valid = validation['Y']
+    best_model = model
+    no_change = 0
+    for epoch in range(mlp_params.max_depth):
+        model.partial_fit(x_train_miss, y_train_miss, classes=[0, 1])
+        best_score = history.best_score
+        score = validation_f1(y_valid, model.predict(x_valid))
+
+        if history.add(epoch, score):
+            best_model = copy.deepcopy(model)
+        no_change = 0 if epoch == 0 or score > best_score + mlp_params.tol else no_change + 1
+        if no_change >= mlp_params.n_iter_no_change:
+            break
+
+    return best_model, history
 
 
 def get_train_params(params_yaml):
@@ -64,7 +90,9 @@ def get_train_params(params_yaml):
         learning_rate=params_yaml["neural"]["learning_rate_init"],
         verbose=params_yaml["neural"]["verbose"],
         hidden_layer_x=params_yaml["neural"]["hidden_layer_sizes_x"],
-        hidden_layer_y=params_yaml["neural"]["hidden_layer_sizes_y"]
+        hidden_layer_y=params_yaml["neural"]["hidden_layer_sizes_y"],
+        n_iter_no_change=params_yaml["neural"].get("n_iter_no_change", MLPParams.n_iter_no_change),
+        tol=params_yaml["neural"].get("tol", MLPParams.tol)
     )
 
 
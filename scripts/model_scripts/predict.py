@@ -1,17 +1,38 @@
 #! python
 # -*- coding: UTF-8 -*-
 
-import joblib
+import numpy as np
 import pandas as pd
-import os
-import yaml
-import pickle
 
 import scripts.data_scripts.create_features as cf
 import scripts.data_scripts.data_prepare as data_prepare
 import scripts.data_scripts.fill_na as fill_na
 import scripts.data_scripts.fix_errors as fix_errors
 import scripts.data_scripts.feature_prepare as fp
+from scripts.model_scripts.model_registry import get_registry
+from scripts.model_scripts.feature_layout import build_record_features
+
+
+# Соответствие признаков внутреннего формата полям API-контракта
+API_FIELDS = {
+    "SkillFactory_Id": "skillfactory_id",
+    "BirthDate": "birth_date",
+    "education": "education",
+    "employment status": "employment_status",
+    "Value": "value",
+    "JobStartDate": "job_start_date",
+    "Position": "position",
+    "MonthProfit": "month_profit",
+    "MonthExpense": "month_expense",
+    "Gender": "gender",
+    "Family status": "family_status",
+    "ChildCount": "child_count",
+    "SNILS": "snils",
+    "Loan_amount": "loan_amount",
+    "Loan_term": "loan_term",
+    "Goods_category": "goods_category",
+    "Merch_code": "merch_code",
+}
 
 
 def predict(client):
@@ -20,41 +41,115 @@ def predict(client):
     :param client: данные в клиента
     """
 
-    # %% Задание каталогов
-    project_path = os.getcwd()
-    model_dir = os.path.join(project_path, "models")
+    return predict_record(convert_record_format(client))
+
+
+def predict_record(record):
+    """
+    Предсказания всех банков для одной анкеты без датафрейма:
+    признаки анкеты вычисляются один раз и раскладываются в общую строку признаков
+    :param record: словарь с данными анкеты во внутреннем формате
+    :return: словарь {название решения банка: массив с предсказанием}
+    """
+
+    artifacts = get_registry().snapshot()
+    fill_values = artifacts.preprocessing.fill_values if artifacts.preprocessing is not None else None
+    record_features = build_record_features(record, fill_values)
+
+    predictions = artifacts.scorer.predict_record(record_features)
+
+    return {f'Bank{bank_id}_decision': predictions[bank_id] for bank_id in artifacts.banks}
+
+
+def predict_batch(clients):
+    """
+    Предсказание одобрения банками для нескольких клиентов.
+    Предобработка выполняется один раз для всех анкет, каждая модель вызывается один раз
+    :param clients: список данных клиентов
+    :return: список предсказаний для каждого клиента в исходном порядке
+    """
+
+    if len(clients) == 0:
+        return []
+
+    predictions = predict_dataset(convert_batch_format(clients))
+
+    return [{key: values[i].item() for key, values in predictions.items()}
+            for i in range(len(clients))]
+
+
+def predict_dataset(applications):
+    """
+    Предсказания всех банков для датасета анкет во внутреннем формате
+    :param applications: датасет анкет
+    :return: словарь {название решения банка: массив предсказаний в порядке анкет}
+    """
+
+    # Модели и статистики предобработки загружаются один раз на процесс
+    artifacts = get_registry().snapshot()
+
+    # Предобработка данных анкет
+    applications_df = prepare_applications(applications, artifacts.preprocessing)
+
+    # Предсказания для банков по общей матрице признаков
+    predictions = artifacts.scorer.predict_dataset(applications_df)
+
+    return {f'Bank{bank_id}_decision': predictions[bank_id] for bank_id in artifacts.banks}
+
+
+def prepare_applications(applications, preprocessing=None):
+    """
+    Предобработка анкет для предсказания.
+    В отличие от обучения, строки не удаляются (ни дубликаты, ни выбросы),
+    а статистики не вычисляются, а берутся из сохраненных при обучении,
+    поэтому результат для каждой анкеты не зависит от остальных анкет
+    :param applications: датасет анкет во внутреннем формате
+    :param preprocessing: статистики предобработки (PreprocessingArtifact).
+                          Если не заданы, заполняются только пропуски с постоянными значениями
+    :return: датасет с признаками в порядке анкет
+    """
+
+    fill_values = preprocessing.fill_values if preprocessing is not None else fill_na.CONSTANT_FILL_VALUES
 
-    # Загрузка параметров расчета
-    params = yaml.safe_load(open(os.path.join(project_path, "params.yaml")))
-    train_method = params["general"]["train_method"]
-    num_columns = ['Ежемесячный_доход', 'Ежемесячный_расход', 'Сумма_заказа', 'Кредитная_нагрузка']
+    df = applications.drop(columns=fill_na.DROP_COLUMNS)
+    df = fill_na.apply_fill_values(df, fill_values)
+    df = data_prepare.prepare_dataset(df)
+    df = fix_errors.fix_seniority_in_dataset(df)
+    df = fix_errors.fix_expense_in_dataset(df)
+    df = cf.replace_features(df)
 
-    # Предобработка данных анкеты
-    client_df = convert_data_format(client)
-    client_df = fill_na.fill_na_in_dataset(client_df)
-    client_df = data_prepare.prepare_dataset(client_df)
-    client_df = fix_errors.fix_errors_in_dataset(client_df)
-    client_df = cf.replace_features(client_df)
+    return df
 
-    # Предсказания для банков
-    bank_ids = ['A', 'B', 'C', 'D', 'E']
-    predictions = {}
 
-    for bank_id in bank_ids:
-        scaler_filename = f'scaler_{bank_id}.pkl'
-        scaler_full_filename = os.path.join(model_dir, scaler_filename)
-        standard_scaler = joblib.load(scaler_full_filename)
+def check_layout_parity(clients):
+    """
+    Сравнение векторов признаков, построенных без датафрейма (FeatureLayout),
+    с признаками, полученными предобработкой датасета
+    :param clients: список данных клиентов
+    :return: словарь {идентификатор банка: максимальное абсолютное расхождение}
+    """
+
+    artifacts = get_registry().snapshot()
+    fill_values = artifacts.preprocessing.fill_values if artifacts.preprocessing is not None else None
+    applications_df = prepare_applications(convert_batch_format(clients), artifacts.preprocessing)
+    records_features = [build_record_features(convert_record_format(client), fill_values) for client in clients]
 
-        filename_model = os.path.join(model_dir, f'model_{train_method}_{bank_id}.pkl')
-        df = fp.feature_prepare_for_bank(client_df, bank_id, standard_scaler, num_columns)
+    differences = {}
+    for bank_id, bank_artifacts in artifacts.banks.items():
+        expected = fp.feature_prepare_for_bank(applications_df, bank_id, bank_artifacts.scaler, fp.NUM_COLUMNS)
+        expected = expected[bank_artifacts.feature_names].to_numpy(dtype='float32')
+        actual = np.vstack([bank_artifacts.layout.fill(features) for features in records_features])
+        differences[bank_id] = float(np.nanmax(np.abs(expected - actual))) if len(clients) else 0.0
 
-        with open(filename_model, "rb") as fd:
-            clf = pickle.load(fd)
-            cols_when_model_builds = clf.get_booster().feature_names
-            df = df[cols_when_model_builds]
-            predictions[f'Bank{bank_id}_decision'] = clf.predict(df)
+    return differences
 
-    return predictions
+
+def convert_record_format(raw_data):
+    """
+    Конвертация данных клиента из формата для API-контракта в словарь во внутреннем формате
+    :param raw_data: данные в исходном формате
+    """
+    return {column: getattr(raw_data, field) for column, field in API_FIELDS.items()}
 
 
 def convert_data_format(raw_data):
@@ -62,24 +157,26 @@ def convert_data_format(raw_data):
     Конвертация данных из формата для API-контракта во внутренний формат
     :param raw_data: данные в исходном формате
     """
-    data = {
-        "SkillFactory_Id": raw_data.skillfactory_id,
-        "BirthDate": raw_data.birth_date,
-        "education": raw_data.education,
-        "employment status": raw_data.employment_status,
-        "Value": raw_data.value,
-        "JobStartDate": raw_data.job_start_date,
-        "Position": raw_data.position,
-        "MonthProfit": raw_data.month_profit,
-        "MonthExpense": raw_data.month_expense,
-        "Gender": raw_data.gender,
-        "Family status": raw_data.family_status,
-        "ChildCount": raw_data.child_count,
-        "SNILS": raw_data.snils,
-        "Loan_amount": raw_data.loan_amount,
-        "Loan_term": raw_data.loan_term,
-        "Goods_category": raw_data.goods_category,
-        "Merch_code": raw_data.merch_code
-    }
-
-    return pd.DataFrame(data=data, index=[0])
+    return convert_batch_format([raw_data])
+
+
+def convert_frame_format(raw_dataset):
+    """
+    Конвертация датасета анкет во внутренний формат: столбцы с названиями полей API-контракта
+    переименовываются, отсутствующие столбцы добавляются с пустыми значениями
+    :param raw_dataset: датасет анкет с полями API-контракта или признаками внутреннего формата
+    """
+    df = raw_dataset.rename(columns={field: column for column, field in API_FIELDS.items()})
+
+    return df.reindex(columns=list(API_FIELDS)).reset_index(drop=True)
+
+
+def convert_batch_format(raw_data_list):
+    """
+    Конвертация данных нескольких клиентов из формата для API-контракта во внутренний формат
+    :param raw_data_list: список данных в исходном формате
+    """
+    data = {column: [getattr(raw_data, field) for raw_data in raw_data_list]
+            for column, field in API_FIELDS.items()}
+
+    return pd.DataFrame(data=data, index=range(len(raw_data_list)))
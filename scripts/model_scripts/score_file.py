@@ -0,0 +1,112 @@
+#! python
+# -*- coding: UTF-8 -*-
+"""
+Пакетное предсказание для файла анкет (jsonl, csv, parquet, feather).
+Файл читается частями фиксированного размера, решения банков дописываются в выходной файл
+после обработки каждой части, поэтому объем памяти не зависит от размера файла
+"""
+import os
+import sys
+import yaml
+import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts.data_scripts.data_methods import iter_dataset, DatasetWriter, copy_on_write
+from scripts.data_scripts.fill_na import MODE_FILL_COLUMNS, MEDIAN_FILL_COLUMNS
+from scripts.data_scripts.feature_prepare import BANK_IDS
+from scripts.data_scripts.utils.dates import set_as_of_date, AS_OF_DATE_ENV
+from scripts.model_scripts.predict import predict_dataset, convert_frame_format
+from scripts.model_scripts.model_registry import get_registry
+
+# Поля анкеты, без которых предсказание невозможно
+REQUIRED_COLUMNS = ['BirthDate', 'education', 'employment status', 'MonthProfit', 'MonthExpense',
+                    'Goods_category', 'Merch_code']
+
+# Столбцы с решениями банков в выходном файле
+DECISION_COLUMNS = [f'Bank{bank_id}_decision' for bank_id in BANK_IDS]
+
+
+def get_required_columns(preprocessing=None):
+    """
+    Обязательные поля анкеты. Без статистик предобработки пропуски заполняются только постоянными значениями,
+    поэтому поля, пропуски в которых заполняются модой и медианой (Loan_amount, Loan_term и др.), тоже обязательны
+    :param preprocessing: статистики предобработки (PreprocessingArtifact) или None
+    """
+    if preprocessing is not None:
+        return REQUIRED_COLUMNS
+
+    return REQUIRED_COLUMNS + MODE_FILL_COLUMNS + MEDIAN_FILL_COLUMNS
+
+
+def score_chunk(chunk):
+    """
+    Предсказания банков для части файла анкет.
+    Для анкет без обязательных полей решения не заполняются
+    :param chunk: часть файла анкет
+    :return: датасет с идентификаторами анкет и решениями банков в исходном порядке
+    """
+    applications = convert_frame_format(chunk)
+    required_columns = get_required_columns(get_registry().snapshot().preprocessing)
+    valid = applications[required_columns].notna().all(axis=1).to_numpy()
+
+    predictions = {}
+    if valid.any():
+        predictions = predict_dataset(applications[valid].reset_index(drop=True))
+
+    result = pd.DataFrame({'SkillFactory_Id': applications['SkillFactory_Id']})
+    for column in DECISION_COLUMNS:
+        decisions = pd.array([pd.NA] * len(applications), dtype='Int8')
+        if valid.any():
+            decisions[valid] = predictions[column]
+        result[column] = decisions
+
+    return result
+
+
+def score_file(filename_input, filename_output, chunk_size, workers=1):
+    """
+    Предсказания банков для файла анкет с записью результатов по частям
+    :param filename_input: путь к файлу анкет
+    :param filename_output: путь к файлу результатов
+    :param chunk_size: количество анкет в одной части
+    :param workers: количество процессов (1 - обработка в текущем процессе)
+    """
+    chunks = iter_dataset(filename_input, chunk_size)
+
+    with DatasetWriter(filename_output) as writer:
+        if workers <= 1:
+            for chunk in chunks:
+                writer.write(score_chunk(chunk))
+            return
+
+        # Не более двух частей на процесс в обработке, результаты записываются в исходном порядке
+        with ProcessPoolExecutor(max_workers=workers, initializer=get_registry) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(score_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    writer.write(pending.popleft().result())
+            while pending:
+                writer.write(pending.popleft().result())
+
+
+if __name__ == "__main__":
+    stage_name = "score_file"
+
+    if len(sys.argv) != 3:
+        sys.stderr.write("Arguments error. Usage:\n")
+        sys.stderr.write(f"\tpython3 {stage_name}.py data-file output-file\n")
+        sys.exit(1)
+
+    project_path = os.getcwd()
+    params = yaml.safe_load(open(os.path.join(project_path, "params.yaml")))
+    score_params = params.get("score", {})
+
+    # Единая расчетная дата для всех частей и процессов
+    os.environ.setdefault(AS_OF_DATE_ENV, set_as_of_date().isoformat())
+
+    with copy_on_write():
+        score_file(os.path.join(project_path, sys.argv[1]), os.path.join(project_path, sys.argv[2]),
+                   chunk_size=score_params.get("chunk_size", 10000),
+                   workers=score_params.get("workers", 1))
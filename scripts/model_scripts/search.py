@@ -0,0 +1,262 @@
+#! python
+# -*- coding: UTF-8 -*-
+"""
+Параллельный подбор гиперпараметров модели банка.
+Кандидаты (перебор по сетке, случайный выбор или последовательное отсеивание) задаются
+пространством поиска из блока search файла params.yaml и подставляются в раздел параметров метода обучения.
+Обучающая выборка читается процессами из хранилища признаков банка через memmap,
+кандидаты обучаются функциями train_model / get_train_params метода и сравниваются по F1 на валидационной выборке,
+выделенной из обучающей (тестовая выборка в подборе не используется), результаты сохраняются в таблицу лидеров
+
+Пример запуска:
+    python -m scripts.model_scripts.search A xgbclassifier
+"""
+import os
+import sys
+import copy
+import json
+import math
+import time
+import tempfile
+import importlib
+import yaml
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.model_selection import ParameterGrid, ParameterSampler
+from threadpoolctl import threadpool_limits
+
+from scripts.data_scripts.feature_store import FeatureStore, write_feature_store, get_store_dir, get_rows_filename
+from scripts.data_scripts.train_test_split import separate_bank_dataset, split_rows
+from scripts.model_scripts.train import validation_f1
+from scripts.model_scripts.model_store import BoosterModel
+
+# Разделы params.yaml с параметрами методов обучения
+PARAMS_SECTIONS = {
+    'xgbclassifier': 'tree',
+    'logisticregression': 'log_reg',
+    'neural_network': 'neural',
+}
+
+# Стратегии поиска
+STRATEGIES = ['grid', 'random', 'halving']
+
+# Данные процесса подбора (заполняются при запуске процесса)
+_worker = {}
+
+
+def generate_candidates(space, strategy, n_candidates=0, random_state=42):
+    """
+    Кандидаты для подбора
+    :param space: пространство поиска {параметр: список значений}
+    :param strategy: grid - все сочетания, random и halving - случайные сочетания
+    :param n_candidates: количество случайных кандидатов (0 - все сочетания)
+    :param random_state: фиксированный сид случайных чисел (для повторяемости)
+    :return: список словарей параметров
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown search strategy '{strategy}'. Possible: {', '.join(STRATEGIES)}")
+
+    grid = ParameterGrid(space)
+    if strategy == 'grid' or not n_candidates or n_candidates >= len(grid):
+        return list(grid)
+
+    return list(ParameterSampler(space, n_iter=n_candidates, random_state=random_state))
+
+
+def get_halving_rounds(n_candidates, n_rows, factor=3, min_rows=0):
+    """
+    Размер обучающей выборки для каждого раунда последовательного отсеивания:
+    в каждом раунде остается 1/factor кандидатов, а выборка увеличивается в factor раз
+    :param n_candidates: количество кандидатов
+    :param n_rows: количество строк обучающей выборки
+    :param factor: коэффициент отсеивания
+    :param min_rows: минимальный размер выборки в первом раунде
+    :return: список размеров выборки по раундам
+    """
+    n_rounds = max(1, math.ceil(math.log(max(n_candidates, 1), factor)) + 1)
+    return [max(min(n_rows, min_rows), int(n_rows / factor ** (n_rounds - 1 - r))) for r in range(n_rounds)]
+
+
+def share_dataset(dataset, directory, name):
+    """
+    Сохранение датасета в хранилище признаков для чтения процессами через memmap
+    :param dataset: датасет с целевым признаком Y
+    :param directory: каталог для файлов
+    :param name: имя датасета
+    :return: объект FeatureStore (процессам передается путь к хранилищу, а не данные)
+    """
+    return write_feature_store(dataset, os.path.join(directory, name))
+
+
+def init_worker(train, validation, method, params, threads, early_stopping_ratio, random_state):
+    """
+    Подготовка процесса подбора
+    :param train: обучающая выборка из хранилища признаков
+    :param validation: валидационная выборка для сравнения кандидатов из хранилища признаков
+    :param method: метод обучения
+    :param params: параметры из params.yaml
+    :param threads: количество потоков на процесс
+    :param early_stopping_ratio: доля выборки для ранней остановки
+    :param random_state: фиксированный сид случайных чисел
+    """
+    n_rows = len(train)
+    _worker.update(
+        train=train,
+        validation=validation.to_frame(),
+        module=importlib.import_module(f"scripts.model_scripts.{method}"),
+        section=PARAMS_SECTIONS[method],
+        params=params,
+        threads=threads,
+        early_stopping_ratio=early_stopping_ratio,
+        random_state=random_state,
+        # Одинаковый порядок строк во всех процессах для выборок разного размера
+        order=np.random.default_rng(random_state).permutation(n_rows),
+        limits=threadpool_limits(threads),
+    )
+
+
+def evaluate_candidate(candidate_id, candidate, n_rows=None):
+    """
+    Обучение модели с параметрами кандидата и расчет F1 на валидационной выборке
+    :param candidate_id: номер кандидата
+    :param candidate: параметры кандидата
+    :param n_rows: размер обучающей выборки (по умолчанию - вся выборка)
+    :return: словарь с результатами
+    """
+    module, section = _worker['module'], _worker['section']
+
+    params = copy.deepcopy(_worker['params'])
+    params[section].update(candidate)
+    if section == 'tree':
+        params[section]['nthread'] = _worker['threads']
+        params[section]['external_memory'] = False
+    model_params = module.get_train_params(params)
+
+    rows = np.sort(_worker['order'][:n_rows]) if n_rows else None
+    train_data = _worker['train'].to_frame(rows)
+    validation_data = None
+    if _worker['early_stopping_ratio']:
+        train_data, validation_data = separate_bank_dataset(train_data, 'Y', _worker['early_stopping_ratio'],
+                                                            _worker['random_state'])
+
+    start = time.perf_counter()
+    model, history = module.train_model(train_data, model_params, validation_data)
+    fit_time = time.perf_counter() - start
+
+    validation = _worker['validation']
+    if isinstance(model, xgb.Booster):
+        model = BoosterModel(model, model.feature_names, iteration_range=history.iteration_range)
+    score = validation_f1(validation['Y'], model.predict(validation.drop('Y', axis=1)))
+
+    return {
+        'candidate': candidate_id,
+        'rows': len(train_data),
+        **candidate,
+        'validation_f1': float(score),
+        'best_iteration': history.best_iteration if history.curve else None,
+        'fit_time': round(fit_time, 3),
+    }
+
+
+def run_search(train, method, params, search_params):
+    """
+    Подбор гиперпараметров в пуле процессов.
+    Из обучающей выборки выделяется валидационная (доля search.validation_ratio), по F1 на которой
+    сравниваются кандидаты: тестовая выборка остается для итоговой оценки выбранной модели
+    :param train: обучающая выборка (датасет или выборка из хранилища признаков FeatureStore)
+    :param method: метод обучения
+    :param params: параметры из params.yaml
+    :param search_params: параметры подбора (блок search)
+    :return: таблица лидеров (датасет, отсортированный по убыванию F1)
+    """
+    if method not in PARAMS_SECTIONS:
+        raise ValueError(f"Unknown train method '{method}'. Possible: {', '.join(PARAMS_SECTIONS)}")
+
+    strategy = search_params.get('strategy', 'random')
+    random_state = search_params.get('random_state', 42)
+    candidates = generate_candidates(search_params['space'][method], strategy,
+                                     search_params.get('n_candidates', 0), random_state)
+
+    workers = search_params.get('workers', 0) or os.cpu_count() or 1
+    workers = min(workers, len(candidates))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    early_stopping_ratio = params['split'].get('validation_ratio', 0)
+
+    results = []
+    with tempfile.TemporaryDirectory() as shared_dir:
+        # Датасет сохраняется во временное хранилище, выборка из хранилища признаков передается как есть
+        shared_train = train if isinstance(train, FeatureStore) else share_dataset(train, shared_dir, 'train')
+
+        # Валидационная выборка для сравнения кандидатов (стратифицированно, по номерам строк)
+        fit_rows, validation_rows = split_rows(shared_train.get_target(), search_params.get('validation_ratio', 0.2),
+                                               random_state)
+        fit_train, validation = shared_train.take(np.sort(fit_rows)), shared_train.take(np.sort(validation_rows))
+
+        if strategy == 'halving':
+            rounds = get_halving_rounds(len(candidates), len(fit_train), search_params.get('halving_factor', 3),
+                                        search_params.get('min_rows', 0))
+        else:
+            rounds = [None]
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(fit_train, validation, method, params, threads,
+                                           early_stopping_ratio, random_state)) as executor:
+            survivors = list(enumerate(candidates))
+            for round_number, n_rows in enumerate(rounds):
+                futures = [executor.submit(evaluate_candidate, candidate_id, candidate, n_rows)
+                           for candidate_id, candidate in survivors]
+                round_results = [dict(future.result(), round=round_number) for future in futures]
+                results.extend(round_results)
+                print(f"Раунд {round_number}: кандидатов - {len(survivors)}, "
+                      f"лучший F1 - {max(result['validation_f1'] for result in round_results):.4f}")
+
+                # Последовательное отсеивание: в следующий раунд проходит 1/factor лучших кандидатов
+                keep = math.ceil(len(survivors) / search_params.get('halving_factor', 3))
+                best = sorted(round_results, key=lambda result: -result['validation_f1'])[:keep]
+                survivors = [(result['candidate'], candidates[result['candidate']]) for result in best]
+
+    leaderboard = pd.DataFrame(results)
+    leaderboard = leaderboard.sort_values(['round', 'validation_f1'], ascending=[False, False], kind='stable')
+
+    return leaderboard.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    stage_name = "search"
+
+    if len(sys.argv) != 3:
+        sys.stderr.write("Arguments error. Usage:\n")
+        sys.stderr.write(f"\tpython3 {stage_name}.py bank_id train-method\n")
+        sys.exit(1)
+
+    bank_id = sys.argv[1]
+    train_method = sys.argv[2]
+
+    # %% Задание каталогов
+    project_path = os.getcwd()
+    evaluate_dir = os.path.join(project_path, "evaluate")
+    os.makedirs(evaluate_dir, exist_ok=True)
+
+    # %% Загрузка параметров расчета
+    params = yaml.safe_load(open(os.path.join(project_path, "params.yaml")))
+
+    # %% Обучающая выборка из хранилища признаков банка (строки читаются процессами подбора)
+    store_dir = get_store_dir(project_path, bank_id)
+    train_data = FeatureStore.from_rows_file(store_dir, get_rows_filename(project_path, bank_id, "train"))
+
+    # %% Подбор
+    start = time.perf_counter()
+    leaderboard = run_search(train_data, train_method, params, params["search"])
+    print(f"Кандидатов - {leaderboard['candidate'].nunique()}, время - {time.perf_counter() - start:.1f} с")
+
+    # %% Сохранение результатов в файлы
+    leaderboard.to_csv(os.path.join(evaluate_dir, f"search_{train_method}_{bank_id}.csv"), index=False, sep=';')
+    # Лучшие параметры в формате раздела params.yaml (по столбцам - с сохранением типов значений)
+    best_params = {name: leaderboard[name].iloc[0] for name in params["search"]["space"][train_method]}
+    with open(os.path.join(evaluate_dir, f"search_{train_method}_{bank_id}.json"), "w") as fd:
+        json.dump({'section': PARAMS_SECTIONS[train_method], 'validation_f1': float(leaderboard['validation_f1'].iloc[0]),
+                   'params': {name: getattr(value, 'item', lambda: value)() for name, value in best_params.items()}},
+                  fd, ensure_ascii=False)
+    print(leaderboard.head(10).to_string())
@@ -0,0 +1,268 @@
+#! python
+# -*- coding: UTF-8 -*-
+"""
+Локальный асинхронный сервис предсказаний с динамическим объединением запросов в пакеты.
+Запросы накапливаются в очереди и передаются в predict_batch, когда набирается
+max_batch_size анкет или проходит max_wait секунд с момента поступления первой из них.
+Предсказания выполняются в пуле потоков или процессов, цикл событий не блокируется
+
+Пример запуска (анкеты в формате JSON по одной на строку):
+    python -m scripts.model_scripts.serve < applications.jsonl
+"""
+import os
+import sys
+import json
+import asyncio
+import yaml
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+
+from scripts.model_scripts.predict import predict_batch
+from scripts.model_scripts.model_registry import get_registry
+
+
+class Application(BaseModel):
+    """
+    Анкета клиента в формате API-контракта (поля convert_data_format)
+    """
+    skillfactory_id: Optional[float] = None
+    birth_date: datetime
+    education: str
+    employment_status: str
+    value: Optional[str] = None
+    job_start_date: Optional[datetime] = None
+    position: Optional[str] = None
+    month_profit: float
+    month_expense: float
+    gender: Optional[float] = None
+    family_status: Optional[str] = None
+    child_count: Optional[int] = None
+    snils: Optional[int] = None
+    loan_amount: Optional[float] = None
+    loan_term: Optional[int] = None
+    goods_category: str
+    merch_code: int
+
+
+class MicroBatcher:
+    """
+    Очередь запросов, которая передает анкеты в функцию предсказания пакетами
+    """
+
+    def __init__(self, score_batch, max_batch_size=64, max_wait=0.002, executor=None):
+        """
+        :param score_batch: функция предсказания для списка анкет
+        :param max_batch_size: максимальное количество анкет в пакете
+        :param max_wait: максимальное время ожидания пакета в секундах
+        :param executor: пул для выполнения предсказаний (по умолчанию - пул потоков цикла событий)
+        """
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor
+
+        self._queue = None
+        self._task = None
+        self._flushes = set()
+
+    async def start(self):
+        """
+        Запуск сборки пакетов
+        """
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        """
+        Остановка сборки пакетов. Анкеты, оставшиеся в очереди, отправляются на предсказание пакетами,
+        остановка ожидает результатов всех отправленных пакетов
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+            while not self._queue.empty():
+                size = min(self.max_batch_size, self._queue.qsize())
+                self._start_flush([self._queue.get_nowait() for _ in range(size)])
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def submit(self, item):
+        """
+        Предсказание для одной анкеты в составе очередного пакета
+        :param item: анкета
+        :return: предсказание
+        """
+        if self._task is None:
+            raise RuntimeError("MicroBatcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        """
+        Сборка пакетов: пакет отправляется, когда набирается max_batch_size анкет
+        или истекает max_wait секунд с момента поступления первой анкеты пакета
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            try:
+                while len(batch) < self.max_batch_size:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0 or not await self._get(batch, timeout):
+                        break
+            except asyncio.CancelledError:
+                # При остановке анкеты, уже взятые из очереди, отправляются на предсказание
+                self._start_flush(batch)
+                raise
+
+            # Следующий пакет собирается, пока предыдущий обрабатывается
+            self._start_flush(batch)
+
+    async def _get(self, batch, timeout):
+        """
+        Ожидание следующей анкеты из очереди. Анкета, взятая из очереди до отмены ожидания, не теряется
+        :param batch: пакет, в который добавляется анкета
+        :param timeout: время ожидания в секундах
+        :return: True, если анкета добавлена в пакет
+        """
+        getter = asyncio.ensure_future(self._queue.get())
+        try:
+            await asyncio.wait([getter], timeout=timeout)
+        finally:
+            if getter.done() and not getter.cancelled():
+                batch.append(getter.result())
+            else:
+                getter.cancel()
+
+        return getter.done() and not getter.cancelled()
+
+    def _start_flush(self, batch):
+        """
+        Отправка пакета на предсказание без ожидания результата
+        :param batch: список пар (анкета, future)
+        """
+        flush = asyncio.create_task(self._flush(batch))
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch):
+        """
+        Предсказание для пакета анкет и передача результатов ожидающим запросам.
+        Если предсказание пакета завершилось ошибкой, анкеты предсказываются по одной
+        :param batch: список пар (анкета, future)
+        """
+        loop = asyncio.get_running_loop()
+        items = [item for item, _ in batch]
+        try:
+            results = await loop.run_in_executor(self.executor, self.score_batch, items)
+        except Exception as error:
+            if len(batch) > 1:
+                # Ошибка одной анкеты не должна отклонять весь пакет:
+                # анкеты пакета предсказываются по одной, каждый запрос получает свой результат или ошибку
+                await asyncio.gather(*(self._flush([pair]) for pair in batch))
+                return
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class ScoringService:
+    """
+    Асинхронный сервис предсказаний: проверка анкет и пакетная обработка запросов
+    """
+
+    def __init__(self, max_batch_size=64, max_wait=0.002, workers=1, executor='thread'):
+        """
+        :param max_batch_size: максимальное количество анкет в пакете
+        :param max_wait: максимальное время ожидания пакета в секундах
+        :param workers: количество потоков или процессов для предсказаний
+        :param executor: thread - пул потоков, process - пул процессов
+        """
+        if executor == 'process':
+            # Каждый процесс загружает реестр моделей при запуске
+            self._executor = ProcessPoolExecutor(max_workers=workers, initializer=get_registry)
+        elif executor == 'thread':
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+        else:
+            raise ValueError(f"Unknown executor type '{executor}'. Possible: thread, process")
+
+        self.batcher = MicroBatcher(predict_batch, max_batch_size, max_wait, self._executor)
+        self._executor_type = executor
+
+    async def start(self):
+        """
+        Загрузка моделей и запуск сборки пакетов
+        """
+        if self._executor_type == 'thread':
+            await asyncio.get_running_loop().run_in_executor(self._executor, get_registry)
+        await self.batcher.start()
+
+    async def stop(self):
+        """
+        Остановка сервиса
+        """
+        await self.batcher.stop()
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def score(self, data):
+        """
+        Предсказание одобрения банками для одной анкеты
+        :param data: анкета (словарь в формате API-контракта или объект Application)
+        :return: словарь {название решения банка: предсказание}
+        """
+        application = data if isinstance(data, Application) else Application.model_validate(data)
+        return await self.batcher.submit(application)
+
+
+def create_service(project_path=None):
+    """
+    Сервис предсказаний с параметрами из блока serve файла params.yaml
+    :param project_path: каталог проекта (по умолчанию - текущий каталог)
+    """
+    project_path = project_path or os.getcwd()
+    params = yaml.safe_load(open(os.path.join(project_path, "params.yaml")))
+    serve_params = params.get("serve", {})
+
+    return ScoringService(max_batch_size=serve_params.get("max_batch_size", 64),
+                          max_wait=serve_params.get("max_wait_ms", 2) / 1000,
+                          workers=serve_params.get("workers", 1),
+                          executor=serve_params.get("executor", "thread"))
+
+
+async def serve_lines(lines):
+    """
+    Предсказания для анкет в формате JSON по одной на строку (в исходном порядке)
+    :param lines: строки с анкетами
+    """
+    async with create_service() as service:
+        return await asyncio.gather(*(service.score(json.loads(line)) for line in lines if line.strip()))
+
+
+if __name__ == "__main__":
+    for prediction in asyncio.run(serve_lines(sys.stdin.readlines())):
+        sys.stdout.write(json.dumps(prediction) + "\n")
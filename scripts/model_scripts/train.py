@@ -2,18 +2,70 @@
 # -*- coding: UTF-8 -*-
 import sys
 import os
+import json
 import yaml
-import pickle
 import pandas as pd
+from dataclasses import dataclass, field
+from sklearn.metrics import f1_score
+from threadpoolctl import threadpool_limits
+
+from scripts.data_scripts.data_methods import get_io_params
+from scripts.data_scripts.feature_store import FeatureStore, get_store_dir
+from scripts.data_scripts.create_features import apply_one_hot_format
+from scripts.data_scripts.train_test_split import separate_bank_dataset
+from scripts.model_scripts.model_store import save_model
+
+
+@dataclass
+class TrainHistory:
+    """
+    История обучения: значения F1 (micro, как в evaluate) на валидационной выборке по итерациям
+    """
+    best_iteration: int = 0
+    best_score: float = float('nan')
+    curve: list = field(default_factory=list)
+    # Диапазон деревьев лучшей итерации (для моделей XGBoost)
+    iteration_range: list = None
+
+    def add(self, iteration, score):
+        """
+        Добавление значения F1 для итерации обучения
+        :param iteration: номер итерации (с нуля)
+        :param score: F1 на валидационной выборке
+        :return: True, если значение лучше предыдущих
+        """
+        self.curve.append({'iteration': iteration, 'validation_f1': float(score)})
+        improved = not self.best_score >= score
+        if improved:
+            self.best_iteration, self.best_score = iteration, float(score)
+
+        return improved
+
+    def get_metrics(self):
+        """
+        Метрики обучения для DVC
+        """
+        return {'best_iteration': self.best_iteration,
+                'best_validation_f1': self.best_score if self.curve else None,
+                'iterations': len(self.curve)}
+
+
+def validation_f1(y_true, y_pred):
+    """
+    Метрика F1 на валидационной выборке (micro, как в evaluate)
+    :param y_true: истинные значения
+    :param y_pred: предсказанные классы
+    """
+    return f1_score(y_true, y_pred, average="micro")
 
 
 def train_stage(stage_name, train_function, params_function):
     if len(sys.argv) != 3:
         sys.stderr.write("Arguments error. Usage:\n")
-        sys.stderr.write(f"\tpython3 bank_id {stage_name}.py data-file\n")
+        sys.stderr.write(f"\tpython3 bank_id {stage_name}.py rows-file\n")
         sys.exit(1)
 
-    # Название файла загружаемого датасета
+    # Название файла номеров строк обучающей выборки
     f_input = sys.argv[2]
     bank_id = sys.argv[1]
 
@@ -21,23 +73,69 @@ def train_stage(stage_name, train_function, params_function):
     # Выбрать вариант в зависимости от операционной системы и способа запуска
     # project_path = os.path.abspath(os.path.join(os.getcwd(), os.path.pardir, os.path.pardir))
     project_path = os.getcwd()
-    model_dir = os.path.join(project_path, "models")
 
     # Загрузка параметров расчета
     params = yaml.safe_load(open(os.path.join(project_path, "params.yaml")))
 
     # %% Задание путей для файлов
     filename_input = os.path.join(project_path, f_input)
-    filename_output = os.path.join(model_dir, f"model_{stage_name}_{bank_id}.pkl")
 
-    # %% Чтение файла данных
-    train_data = pd.read_csv(filename_input, sep=';')
+    train_bank(bank_id, stage_name, train_function, params_function, filename_input, params, project_path)
+
+
+def train_bank(bank_id, stage_name, train_function, params_function, filename_input, params, project_path,
+               threads=None):
+    """
+    Обучение и сохранение модели банка
+    :param bank_id: идентификатор банка
+    :param stage_name: метод обучения
+    :param train_function: функция обучения метода
+    :param params_function: функция получения параметров метода
+    :param filename_input: путь к файлу номеров строк обучающей выборки в хранилище признаков банка
+    :param params: параметры из params.yaml
+    :param project_path: каталог проекта
+    :param threads: количество потоков обучения (по умолчанию - без ограничения)
+    :return: история обучения
+    """
+    model_dir = os.path.join(project_path, "models")
+    evaluate_dir = os.path.join(project_path, "evaluate")
+    validation_ratio = params["split"].get("validation_ratio", 0)
+    random_state = params["split"]["random_state"]
 
-    # Обучение модели
+    # %% Чтение данных: файлы хранилища признаков отображаются в память, строки выборки выбираются по номерам.
+    # При обучении по частям (external_memory) методу обучения передается выборка из хранилища,
+    # валидационная выборка выделяется при чтении частей
+    train_store = FeatureStore.from_rows_file(get_store_dir(project_path, bank_id), filename_input)
     model_params = params_function(params)
-    model = train_function(train_data, model_params)
+    if threads and hasattr(model_params, 'nthread'):
+        model_params.nthread = threads
+    validation_data = None
+    if getattr(model_params, 'external_memory', False):
+        train_data = train_store
+        model_params.validation_ratio = validation_ratio
+        model_params.random_state = random_state
+    else:
+        train_data = apply_one_hot_format(train_store.to_frame(), get_io_params()["one_hot"])
+        if validation_ratio:
+            train_data, validation_data = separate_bank_dataset(train_data, 'Y', validation_ratio, random_state)
+
+    # Обучение модели (потоки BLAS и OpenMP библиотек ограничиваются бюджетом задания)
+    with threadpool_limits(threads):
+        model, history = train_function(train_data, model_params, validation_data)
 
     # %% Сохранение результатов в файлы
     os.makedirs(model_dir, exist_ok=True)
-    with open(filename_output, "wb") as fd:
-        pickle.dump(model, fd)
+    manifest_fields = {}
+    if history.curve:
+        manifest_fields['best_iteration'] = history.best_iteration
+    if history.iteration_range:
+        manifest_fields['iteration_range'] = history.iteration_range
+    save_model(model, model_dir, stage_name, bank_id, **manifest_fields)
+
+    os.makedirs(evaluate_dir, exist_ok=True)
+    with open(os.path.join(evaluate_dir, f"train_{stage_name}_{bank_id}.json"), "w") as fd:
+        json.dump(history.get_metrics(), fd)
+    with open(os.path.join(evaluate_dir, f"curve_{stage_name}_{bank_id}.json"), "w") as fd:
+        json.dump(history.curve, fd)
+
+    return history
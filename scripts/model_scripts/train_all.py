@@ -0,0 +1,123 @@
+#! python
+# -*- coding: UTF-8 -*-
+"""
+Обучение моделей всех банков (и нескольких методов обучения) за один запуск.
+Задания выполняются параллельно в пуле процессов, общий бюджет ядер делится между заданиями поровну,
+чтобы потоки XGBoost и библиотек scikit-learn не конкурировали за ядра.
+Время выполнения каждого задания сохраняется в отчет
+
+Пример запуска (методы по умолчанию - из блока train_all или general.train_method):
+    python -m scripts.model_scripts.train_all
+    python -m scripts.model_scripts.train_all xgbclassifier logisticregression
+"""
+import os
+import sys
+import json
+import time
+import importlib
+import yaml
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts.data_scripts.feature_store import get_rows_filename
+from scripts.data_scripts.feature_prepare import BANK_IDS
+from scripts.model_scripts.train import train_bank
+
+
+def get_core_budget(n_jobs, cores=0, max_jobs=0):
+    """
+    Распределение ядер между заданиями
+    :param n_jobs: количество заданий
+    :param cores: общий бюджет ядер (0 - все ядра)
+    :param max_jobs: максимальное количество одновременных заданий (0 - по бюджету ядер)
+    :return: количество одновременных заданий и потоков на задание
+    """
+    cores = cores or os.cpu_count() or 1
+    workers = min(n_jobs, max_jobs or cores, cores)
+
+    return workers, max(1, cores // workers)
+
+
+def run_job(bank_id, method, threads, project_path, params):
+    """
+    Обучение модели одного банка одним методом
+    :param bank_id: идентификатор банка
+    :param method: метод обучения
+    :param threads: количество потоков задания
+    :param project_path: каталог проекта
+    :param params: параметры из params.yaml
+    :return: словарь с отчетом о задании
+    """
+    module = importlib.import_module(f"scripts.model_scripts.{method}")
+    filename_input = get_rows_filename(project_path, bank_id, "train")
+
+    start = time.perf_counter()
+    history = train_bank(bank_id, method, module.train_model, module.get_train_params, filename_input,
+                         params, project_path, threads)
+
+    return {
+        'bank_id': bank_id,
+        'method': method,
+        'threads': threads,
+        'wall_time': round(time.perf_counter() - start, 3),
+        **history.get_metrics(),
+    }
+
+
+def train_all(methods, bank_ids, params, project_path, cores=0, max_jobs=0):
+    """
+    Обучение моделей банков в пуле процессов
+    :param methods: методы обучения
+    :param bank_ids: идентификаторы банков
+    :param params: параметры из params.yaml
+    :param project_path: каталог проекта
+    :param cores: общий бюджет ядер (0 - все ядра)
+    :param max_jobs: максимальное количество одновременных заданий (0 - по бюджету ядер)
+    :return: отчет о запуске
+    """
+    jobs = [(bank_id, method) for method in methods for bank_id in bank_ids]
+    workers, threads = get_core_budget(len(jobs), cores, max_jobs)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_job, bank_id, method, threads, project_path, params)
+                   for bank_id, method in jobs]
+        reports = []
+        for future in futures:
+            reports.append(future.result())
+            report = reports[-1]
+            print(f"{report['method']} {report['bank_id']}: {report['wall_time']:.1f} с, "
+                  f"потоков - {report['threads']}")
+
+    return {
+        'cores': workers * threads,
+        'workers': workers,
+        'threads': threads,
+        'wall_time': round(time.perf_counter() - start, 3),
+        'jobs': reports,
+    }
+
+
+if __name__ == "__main__":
+    stage_name = "train_all"
+
+    # %% Задание каталогов
+    project_path = os.getcwd()
+    evaluate_dir = os.path.join(project_path, "evaluate")
+    os.makedirs(evaluate_dir, exist_ok=True)
+
+    # %% Загрузка параметров расчета
+    params = yaml.safe_load(open(os.path.join(project_path, "params.yaml")))
+    train_all_params = params.get("train_all", {})
+
+    methods = sys.argv[1:] or train_all_params.get("methods") or [params["general"]["train_method"]]
+    bank_ids = train_all_params.get("banks") or BANK_IDS
+
+    report = train_all(methods, bank_ids, params, project_path,
+                       cores=train_all_params.get("cores", 0),
+                       max_jobs=train_all_params.get("jobs", 0))
+    print(f"Заданий - {len(report['jobs'])}, процессов - {report['workers']}, "
+          f"потоков на задание - {report['threads']}, время - {report['wall_time']:.1f} с")
+
+    # %% Сохранение отчета
+    with open(os.path.join(evaluate_dir, f"{stage_name}.json"), "w") as fd:
+        json.dump(report, fd, indent=2)
@@ -1,13 +1,16 @@
 #! python
 # -*- coding: UTF-8 -*-
 """
-Обучение с помощью XGBClassifier
+Обучение с помощью XGBoost (гистограммный метод на квантованной матрице признаков)
 """
 
+import tempfile
 from dataclasses import dataclass
 from pathlib import Path
-from xgboost import XGBClassifier
+import numpy as np
+import xgboost as xgb
 
+from scripts.data_scripts.data_methods import iter_dataset, densify
 from .train import *
 
 
@@ -22,41 +25,213 @@ class TreeParams:
     reg_lambda: int = 0
     reg_alpha: int = 0
     scale_pos_weight: int = 0
-    device: str = 'gpu'
-    sampling_method: str = 'gradient_based'
+    device: str = 'cpu'
+    tree_method: str = 'hist'
+    sampling_method: str = 'uniform'
+    max_bin: int = 256
+    # Количество потоков (0 - все ядра)
+    nthread: int = 0
+    # Обучение по частям файла датасета с кэшированием на диске
+    external_memory: bool = False
+    chunk_size: int = 100000
+    # Остановка, если F1 на валидационной выборке не улучшается заданное количество итераций (0 - без остановки)
+    early_stopping_rounds: int = 0
+    # Разделение на обучающую и валидационную выборки при обучении по частям
+    validation_ratio: float = 0.0
+    random_state: int = 42
 
+    def get_booster_params(self):
+        """
+        Параметры бустера для xgboost.train
+        """
+        return {
+            'objective': 'binary:logistic',
+            'max_depth': self.max_depth,
+            'eta': self.eta,
+            'reg_lambda': self.reg_lambda,
+            'reg_alpha': self.reg_alpha,
+            'scale_pos_weight': self.scale_pos_weight,
+            'device': self.device,
+            'tree_method': self.tree_method,
+            'sampling_method': self.sampling_method,
+            'max_bin': self.max_bin,
+            'nthread': self.get_nthread(),
+        }
 
-def train_model(dataset: pd.DataFrame, tree_params: TreeParams):
+    def get_nthread(self):
+        """
+        Количество потоков обучения
+        """
+        return self.nthread or os.cpu_count() or 1
+
+
+class DatasetIter(xgb.DataIter):
+    """
+    Чтение датасета частями (из файла или хранилища признаков) для построения матрицы XGBoost
+    без загрузки всего датасета. Случайная доля строк каждой части выделяется в валидационную выборку
+    """
+
+    def __init__(self, source, chunk_size, cache_prefix=None, validation_ratio=0.0, random_state=42):
+        """
+        :param source: путь к файлу датасета или выборка из хранилища признаков (FeatureStore)
+        :param chunk_size: количество строк в одной части
+        :param cache_prefix: префикс файлов кэша на диске (None - матрица хранится в памяти)
+        :param validation_ratio: доля строк валидационной выборки
+        :param random_state: фиксированный сид случайных чисел (одинаковое разделение при каждом проходе)
+        """
+        self.source = source
+        self.chunk_size = chunk_size
+        self.validation_ratio = validation_ratio
+        self.random_state = random_state
+        self._chunks = None
+        self._rng = np.random.default_rng(random_state)
+        # Валидационные строки сохраняются только при первом проходе по файлу
+        self._collecting = True
+        self._validation = []
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._chunks is None:
+            self._chunks = (iter_dataset(self.source, self.chunk_size) if isinstance(self.source, str)
+                            else self.source.iter_chunks(self.chunk_size))
+
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._collecting = False
+            return 0
+
+        if self.validation_ratio:
+            mask = self._rng.random(len(chunk)) < self.validation_ratio
+            if self._collecting:
+                self._validation.append(chunk[mask])
+            chunk = chunk[~mask]
+
+        input_data(data=chunk.drop('Y', axis=1), label=chunk['Y'])
+        return 1
+
+    def reset(self):
+        self._chunks = None
+        self._rng = np.random.default_rng(self.random_state)
+
+    def get_validation(self):
+        """
+        Валидационная выборка (после построения матрицы)
+        """
+        return pd.concat(self._validation, ignore_index=True) if self._validation else None
+
+
+class FrameIter(xgb.DataIter):
+    """
+    Передача датасета с разреженными столбцами в XGBoost частями по строкам:
+    плотной становится только текущая часть. Нули one-hot признаков остаются нулями
+    (в разреженной матрице scipy XGBoost считает отсутствующие элементы пропусками)
     """
-    Обучение модели с помощью XGBClassifier
 
-    :param dataset: Исходный датасет
+    def __init__(self, x, y, chunk_size):
+        """
+        :param x: признаки
+        :param y: целевой признак
+        :param chunk_size: количество строк в одной части
+        """
+        self.x = x
+        self.y = y
+        self.chunk_size = chunk_size
+        self._offset = 0
+        super().__init__()
+
+    def next(self, input_data):
+        if self._offset >= len(self.x):
+            return 0
+
+        rows = slice(self._offset, self._offset + self.chunk_size)
+        input_data(data=densify(self.x.iloc[rows]), label=self.y.iloc[rows])
+        self._offset += self.chunk_size
+        return 1
+
+    def reset(self):
+        self._offset = 0
+
+
+def train_model(dataset, tree_params: TreeParams, validation=None):
+    """
+    Обучение модели с помощью XGBoost
+
+    :param dataset: Исходный датасет, путь к файлу датасета или выборка из хранилища признаков
+                    (при обучении по частям)
     :param tree_params: Параметры обучения модели
-    :return: Обученная модель
+    :param validation: Валидационная выборка (при обучении по частям выделяется из файла)
+    :return: Обученный бустер и история обучения
     """
-    # Подготовка датасета
-    x_train = dataset.drop('Y', axis=1)
-    y_train = dataset['Y']
+    booster_params = tree_params.get_booster_params()
+
+    if isinstance(dataset, pd.DataFrame):
+        # Подготовка датасета
+        x_train = dataset.drop('Y', axis=1)
+        y_train = dataset['Y']
+
+        # Признаки квантуются сразу, без хранения исходной матрицы внутри XGBoost
+        if densify(x_train) is x_train:
+            train_matrix = xgb.QuantileDMatrix(x_train, y_train, max_bin=tree_params.max_bin,
+                                               nthread=booster_params['nthread'])
+        else:
+            train_matrix = xgb.QuantileDMatrix(FrameIter(x_train, y_train, tree_params.chunk_size),
+                                               max_bin=tree_params.max_bin, nthread=booster_params['nthread'])
+        return fit_booster(booster_params, train_matrix, validation, tree_params)
 
-    # Если балансируем классы, то на выходе ~0,34 accuracy параметр для балансировки class_weight="balanced"
-    # clf = DecisionTreeClassifier(max_depth=max_depth, max_features="auto", criterion="log_loss", max_leaf_nodes=0.5)
-    # clf.fit(x_train, y_train)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        data_iter = DatasetIter(dataset, tree_params.chunk_size, os.path.join(cache_dir, 'cache'),
+                                tree_params.validation_ratio, tree_params.random_state)
+        train_matrix = xgb.DMatrix(data_iter, nthread=booster_params['nthread'])
+        result = fit_booster(booster_params, train_matrix, data_iter.get_validation(), tree_params)
+        # Файлы кэша освобождаются до удаления временного каталога
+        del train_matrix, data_iter
 
-    # Create and train the XGBoost model
-    model = XGBClassifier(
-        n_estimators=tree_params.n_estimators,
-        max_depth=tree_params.max_depth,
-        device=tree_params.device,
-        eta=tree_params.eta,
-        sampling_method=tree_params.sampling_method,
-        reg_lambda=tree_params.reg_lambda,
-        reg_alpha=tree_params.reg_alpha,
-        scale_pos_weight=tree_params.scale_pos_weight)
+    return result
 
-    # Fit the model
-    model.fit(x_train, y_train)
 
-    return model
+def fit_booster(booster_params, train_matrix, validation, tree_params: TreeParams):
+    """
+    Обучение бустера с расчетом F1 на валидационной выборке после каждого дерева
+    и ранней остановкой, если F1 не улучшается early_stopping_rounds итераций
+
+    :param booster_params: параметры бустера
+    :param train_matrix: матрица обучающей выборки
+    :param validation: валидационная выборка или None
+    :param tree_params: Параметры обучения модели
+    :return: Обученный бустер и история обучения
+    """
+    history = TrainHistory()
+    if validation is None:
+        booster = xgb.train(booster_params, train_matrix, num_boost_round=tree_params.n_estimators)
+        return booster, history
+
+    validation_matrix = xgb.DMatrix(densify(validation.drop('Y', axis=1)), validation['Y'],
+                                    nthread=booster_params['nthread'])
+    evals_result = {}
+    booster = xgb.train({**booster_params, 'disable_default_eval_metric': 1}, train_matrix,
+                        num_boost_round=tree_params.n_estimators,
+                        evals=[(validation_matrix, 'validation')],
+                        custom_metric=f1_metric, maximize=True,
+                        early_stopping_rounds=tree_params.early_stopping_rounds or None,
+                        evals_result=evals_result, verbose_eval=False)
+
+    for iteration, score in enumerate(evals_result['validation']['f1']):
+        history.add(iteration, score)
+    # Модель ограничивается лучшей итерацией только при ранней остановке,
+    # иначе предсказывают все n_estimators деревьев
+    if tree_params.early_stopping_rounds:
+        history.iteration_range = [0, history.best_iteration + 1]
+
+    return booster, history
+
+
+def f1_metric(predt, matrix):
+    """
+    Метрика F1 для xgboost.train
+    :param predt: вероятности положительного класса
+    :param matrix: матрица выборки
+    """
+    return 'f1', validation_f1(matrix.get_label(), predt > 0.5)
 
 
 def get_train_params(params_yaml):
@@ -65,13 +240,24 @@ def get_train_params(params_yaml):
     :param params_yaml: Объект yaml файла параметров
     :return: Объект TreeParams с параметрами модели
     """
+    tree = params_yaml["tree"]
+    defaults = TreeParams()
+
     return TreeParams(
-        max_depth=params_yaml["tree"]["max_depth"],
-        n_estimators=params_yaml["tree"]["n_estimators"],
-        eta=params_yaml["tree"]["eta"],
-        reg_lambda=params_yaml["tree"]["reg_lambda"],
-        reg_alpha=params_yaml["tree"]["reg_alpha"],
-        scale_pos_weight=params_yaml["tree"]["scale_pos_weight"]
+        max_depth=tree["max_depth"],
+        n_estimators=tree["n_estimators"],
+        eta=tree["eta"],
+        reg_lambda=tree["reg_lambda"],
+        reg_alpha=tree["reg_alpha"],
+        scale_pos_weight=tree["scale_pos_weight"],
+        device=tree.get("device", defaults.device),
+        tree_method=tree.get("tree_method", defaults.tree_method),
+        sampling_method=tree.get("sampling_method", defaults.sampling_method),
+        max_bin=tree.get("max_bin", defaults.max_bin),
+        nthread=tree.get("nthread", defaults.nthread),
+        external_memory=tree.get("external_memory", defaults.external_memory),
+        chunk_size=tree.get("chunk_size", defaults.chunk_size),
+        early_stopping_rounds=tree.get("early_stopping_rounds", defaults.early_stopping_rounds)
     )
 
 
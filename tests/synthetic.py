@@ -0,0 +1,63 @@
+"""
+Синтетические анкеты в формате исходного датасета для тестов
+"""
+import numpy as np
+import pandas as pd
+
+from scripts.data_scripts.utils.schema import enforce_schema
+from scripts.data_scripts.utils.seniority_cats import SENIORITY_VALUES
+
+# Расчетная дата синтетического датасета
+AS_OF = pd.Timestamp('2023-11-15 12:00')
+
+
+def make_raw_dataset(row_count, seed=0):
+    """
+    Синтетический датасет в формате исходного датасета (как после read_dataset):
+    пропуски, пустые строки, дубликаты, выбросы, несовершеннолетние и стаж больше возраста
+    :param row_count: количество строк
+    :param seed: начальное значение генератора случайных чисел
+    """
+    rng = np.random.default_rng(seed)
+
+    def choice(values, na_share=0.0):
+        result = rng.choice(np.array(values, dtype=object), size=row_count)
+        result[rng.random(row_count) < na_share] = np.nan
+        return result
+
+    birth_date = AS_OF.normalize() - pd.to_timedelta(rng.integers(14 * 365, 75 * 365, row_count), unit='D')
+    job_start_date = pd.Series(AS_OF.normalize() - pd.to_timedelta(rng.integers(0, 40 * 365, row_count), unit='D'))
+    job_start_date[rng.random(row_count) < 0.05] = pd.NaT
+
+    month_profit = rng.integers(10000, 200000, row_count).astype('float64')
+    month_profit[rng.random(row_count) < 0.03] *= 50
+
+    dataset = pd.DataFrame({
+        'SkillFactory_Id': np.arange(row_count, dtype='float64'),
+        'BirthDate': birth_date,
+        'education': choice(['Высшее - специалист', 'Бакалавр', 'Среднее', 'Среднее профессиональное']),
+        'employment status': choice(['Работаю по найму полный рабочий день/служу', 'Собственное дело',
+                                     'Пенсионер', 'Не работаю']),
+        'Value': choice(list(SENIORITY_VALUES), na_share=0.02),
+        'JobStartDate': job_start_date,
+        'Position': choice(['Менеджер', 'Рабочий']),
+        'MonthProfit': month_profit,
+        'MonthExpense': rng.integers(0, 60000, row_count).astype('float64'),
+        'Gender': choice([0.0, 1.0], na_share=0.01),
+        'Family status': choice(['Никогда в браке не состоял(а)', 'Женат / замужем',
+                                 'Гражданский брак / совместное проживание', 'Разведён / Разведена'], na_share=0.01),
+        'ChildCount': choice([0.0, 1.0, 2.0, 3.0], na_share=0.01),
+        'SNILS': choice([0.0, 1.0], na_share=0.01),
+        'Merch_code': rng.integers(1, 80, row_count).astype('float64'),
+        'Loan_amount': choice([float(value) for value in range(5000, 300000, 5000)], na_share=0.01),
+        'Loan_term': choice([6.0, 12.0, 18.0, 24.0], na_share=0.01),
+        'Goods_category': choice(['Furniture', 'Mobile_devices', 'Travel', 'Medical_services', 'Other']),
+    })
+    for bank_id in 'ABCDE':
+        dataset[f'Bank{bank_id}_decision'] = choice(['denied', 'success', 'error'])
+
+    # Пустые строки и дубликаты
+    dataset.loc[rng.random(row_count) < 0.01, :] = np.nan
+    dataset = pd.concat([dataset, dataset.iloc[:row_count // 100]], ignore_index=True)
+
+    return enforce_schema(dataset)
@@ -0,0 +1,65 @@
+"""
+Совпадение векторов признаков, построенных без датафрейма (build_record_features и FeatureLayout),
+с признаками, полученными предобработкой датасета (prepare_applications и feature_prepare_for_bank)
+"""
+import numpy as np
+import pytest
+
+import scripts.data_scripts.feature_prepare as fp
+from scripts.data_scripts.fill_na import get_fill_values
+from scripts.data_scripts.preprocessing_artifact import PreprocessingArtifact
+from scripts.data_scripts.utils.dates import set_as_of_date, reset_as_of_date
+from scripts.model_scripts.feature_layout import FeatureLayout, build_record_features
+from scripts.model_scripts.predict import API_FIELDS, prepare_applications
+from tests.synthetic import AS_OF, make_raw_dataset
+
+# Количество синтетических анкет
+ROW_COUNT = 2000
+
+# Допустимое расхождение признаков (точность float32)
+TOLERANCE = 1e-5
+
+
+@pytest.fixture(scope='module')
+def applications():
+    """
+    Синтетические анкеты во внутреннем формате (без пустых строк и решений банков)
+    и статистики предобработки, вычисленные по ним
+    """
+    dataset = make_raw_dataset(ROW_COUNT, seed=1)
+    dataset = dataset[dataset['BirthDate'].notna()].reset_index(drop=True)[list(API_FIELDS)]
+    preprocessing = PreprocessingArtifact(fill_values=get_fill_values(dataset), bounds={})
+
+    return dataset, preprocessing
+
+
+@pytest.fixture(scope='module')
+def prepared(applications):
+    """
+    Признаки анкет, полученные предобработкой датасета на расчетную дату, и стандартизатор, обученный по ним
+    """
+    dataset, preprocessing = applications
+    set_as_of_date(AS_OF)
+    try:
+        applications_df = prepare_applications(dataset, preprocessing)
+    finally:
+        reset_as_of_date()
+
+    return applications_df, fp.fit_scaler(applications_df)
+
+
+@pytest.mark.parametrize('bank_id', fp.BANK_IDS)
+def test_layout_matches_feature_prepare(applications, prepared, bank_id):
+    dataset, preprocessing = applications
+    applications_df, scaler = prepared
+
+    expected = fp.feature_prepare_for_bank(applications_df, bank_id, scaler, fp.NUM_COLUMNS)
+    feature_names = list(expected.columns)
+    layout = FeatureLayout(feature_names, scaler)
+    actual = np.vstack([layout.fill(build_record_features(record, preprocessing.fill_values, AS_OF))
+                        for record in dataset.to_dict('records')])
+
+    assert actual.shape == expected.shape
+    for i, column in enumerate(feature_names):
+        np.testing.assert_allclose(actual[:, i], expected[column].to_numpy(dtype='float32'),
+                                   rtol=TOLERANCE, atol=TOLERANCE, err_msg=column)
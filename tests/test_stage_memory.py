@@ -0,0 +1,90 @@
+"""
+Пиковая память этапов предобработки на синтетическом датасете (tracemalloc).
+Этап не должен занимать больше двух объемов исходного датасета: исходный датасет и временные массивы
+объемом не больше исходного. Этап create_features создает новые признаки, и результирующий датасет
+больше исходного, поэтому вместо второго объема исходного датасета учитывается объем результата
+"""
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+from scripts.data_scripts.create_features import create_features_in_dataset
+from scripts.data_scripts.data_methods import copy_on_write
+from scripts.data_scripts.data_prepare import prepare_dataset
+from scripts.data_scripts.fill_na import fill_na_in_dataset
+from scripts.data_scripts.fix_errors import fix_errors_in_dataset
+from tests.synthetic import AS_OF, make_raw_dataset
+
+# Количество строк синтетического датасета
+ROW_COUNT = 20000
+
+# Допустимый пиковый объем памяти этапа в объемах исходного датасета
+MAX_MEMORY_RATIO = 2
+
+
+def measure_peak(function, dataset):
+    """
+    Пиковый объем памяти, выделенной при выполнении функции
+    :param function: функция этапа
+    :param dataset: исходный датасет этапа
+    :return: результат функции и пиковый объем памяти (байт)
+    """
+    tracemalloc.start()
+    try:
+        result = function(dataset)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return result, peak
+
+
+def dataset_size(dataset):
+    """
+    Объем памяти датасета (байт)
+    """
+    return dataset.memory_usage(deep=True).sum()
+
+
+@pytest.fixture(scope='module')
+def stage_memory():
+    """
+    Последовательное выполнение этапов с измерением пиковой памяти
+    :return: словарь {этап: (объем исходного датасета, объем результата, пиковый объем)}
+    """
+    stages = [
+        ('fill_na', fill_na_in_dataset),
+        ('data_prepare', prepare_dataset),
+        ('fix_errors', lambda dataset: fix_errors_in_dataset(dataset, AS_OF)),
+        ('create_features', lambda dataset: create_features_in_dataset(dataset, AS_OF)),
+    ]
+
+    # Этапы конвейера выполняются в режиме копирования при записи (как в create_stage)
+    with copy_on_write():
+        dataset = make_raw_dataset(ROW_COUNT)
+        memory = {}
+        for stage_name, function in stages:
+            result, peak = measure_peak(function, dataset)
+            memory[stage_name] = (dataset_size(dataset), dataset_size(result), peak)
+            dataset = result
+
+    return memory
+
+
+@pytest.mark.parametrize('stage_name', ['fill_na', 'data_prepare', 'fix_errors', 'create_features'])
+def test_stage_peak_memory(stage_memory, stage_name):
+    input_size, output_size, peak = stage_memory[stage_name]
+    limit = input_size * (MAX_MEMORY_RATIO - 1) + max(input_size, output_size)
+
+    assert peak <= limit, (f"{stage_name}: peak {peak / 2 ** 20:.2f} MB, input {input_size / 2 ** 20:.2f} MB, "
+                           f"output {output_size / 2 ** 20:.2f} MB")
+
+
+def test_fix_errors_keeps_source_dataset():
+    dataset = prepare_dataset(fill_na_in_dataset(make_raw_dataset(1000)))
+    source = dataset.copy()
+
+    fix_errors_in_dataset(dataset, AS_OF)
+
+    pd.testing.assert_frame_equal(dataset, source)